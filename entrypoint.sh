@@ -10,6 +10,12 @@ done
 # Run migrations
 python manage.py migrate
 
+# Build the site search index on first deploy (kept up to date on save after that)
+python manage.py rebuild_search_index --if-empty
+
+# Create the Qdrant collection, so the chatbot never has to on a message
+python manage.py setup_vectors --wait 60 || echo "Qdrant isn't set up; the chatbot won't answer until it is."
+
 # Collect static files
 python manage.py collectstatic --noinput
 
@@ -1,25 +1,21 @@
 from django.contrib import admin
 from django.contrib import messages
-from .models import ChatRoom, Message, KnowledgeBase, Document
+from .models import ChatRoom, Message, KnowledgeBase, Document, Job
 
-from .utils import sync_item_to_qdrant
+from .utils import sync_items_to_qdrant
 
 def force_sync_action(modeladmin, request, queryset):
     """
     Action to manually force an update to Qdrant, skipping the delay.
+    The selection is embedded and upserted in batches; for a full rebuild use
+    `manage.py reindex_vectors`.
     """
-    success_count = 0
-    error_count = 0
-
-    for item in queryset:
-        try:
-            # Call the util function directly (bypassing signals/timers)
-            sync_item_to_qdrant(item)
-            success_count += 1
-        except Exception as e:
-            error_count += 1
-            modeladmin.message_user(request, f"Error syncing {item}: {e}", messages.ERROR)
+    # Call the util function directly (bypassing signals/timers)
+    selected = list(queryset)
+    success_count = sync_items_to_qdrant(selected)
 
+    if success_count < len(selected):
+        modeladmin.message_user(request, f"{len(selected) - success_count} items were not synced, check the logs.", messages.ERROR)
     if success_count > 0:
         modeladmin.message_user(request, f"Successfully forced sync for {success_count} items.", messages.SUCCESS)
 
@@ -47,4 +43,11 @@ class DocumentAdmin(admin.ModelAdmin):
     list_display = ('title', 'uploaded_at', 'processed', 'qdrant_id')
     search_fields = ('title',)
     readonly_fields = ('processed', 'qdrant_id')
-    actions = [force_sync_action]
\ No newline at end of file
+    actions = [force_sync_action]
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'key', 'status', 'run_at', 'attempts', 'worker', 'updated_at')
+    list_filter = ('status', 'task')
+    search_fields = ('key', 'last_error')
+    readonly_fields = ('pending_key', 'worker', 'locked_until', 'last_error', 'created_at', 'updated_at')
@@ -0,0 +1,117 @@
+"""
+Semantic cache of chatbot answers. Questions are stored with their answers
+in a vector store collection of their own; a new question whose embedding is at
+least ANSWER_CACHE_THRESHOLD (cosine) close to an answered one gets that
+answer back, without searching the knowledge or calling Gemini.
+
+Entries are only valid for the knowledge they were answered from: each is
+stored with the knowledge version, which utils.py bumps whenever it writes
+or deletes knowledge vectors, and lookups only match the current version.
+Entries also expire after ANSWER_CACHE_TTL seconds. purge() deletes expired
+and outdated entries, and the oldest ones past ANSWER_CACHE_MAX_ENTRIES;
+store() runs it every PURGE_EVERY answers.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .vector_store import Point
+
+COLLECTION_NAME = "chatbot_answers"
+THRESHOLD = getattr(settings, 'ANSWER_CACHE_THRESHOLD', 0.95)
+TTL = getattr(settings, 'ANSWER_CACHE_TTL', 24 * 3600)
+MAX_ENTRIES = getattr(settings, 'ANSWER_CACHE_MAX_ENTRIES', 5000)
+PURGE_EVERY = 50
+VERSION_KEY = 'answers:knowledge_version'
+
+_stored = 0
+
+
+def ensure_collection(store, vector_size):
+    """
+    Creates the answer collection and its payload indexes (sync store).
+    """
+    store.ensure_collection(COLLECTION_NAME, vector_size, indexes={
+        "version": "integer",
+        # Range index: expiry filter and oldest-first eviction
+        "created_at": "float",
+    })
+
+
+def knowledge_changed():
+    """
+    Makes every cached answer stale. Called after knowledge vectors change.
+    """
+    try:
+        # Seeded from the clock, so a lost key can't come back as an old version
+        cache.add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        pass  # a cache that keeps nothing (DummyCache) has nothing to invalidate
+    except Exception as e:
+        print(f"Answer cache not invalidated: {e}")
+
+
+async def current_version():
+    try:
+        version = await cache.aget(VERSION_KEY)
+        if version is None:
+            await cache.aadd(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+            version = await cache.aget(VERSION_KEY)
+        return version or 0
+    except Exception as e:
+        print(f"Answer cache unavailable: {e}")
+        return None
+
+
+def _valid(version):
+    return {"version": version, "created_at__gte": time.time() - TTL}
+
+
+async def lookup(vectors, embedding, version):
+    """
+    The cached answer to the closest previous question, or None.
+    """
+    if version is None:
+        return None
+    try:
+        hits = await vectors.search(
+            COLLECTION_NAME, embedding, limit=1, where=_valid(version), score_threshold=THRESHOLD,
+        )
+    except Exception as e:
+        print(f"Answer cache unavailable: {e}")
+        return None
+    return hits[0].payload['answer'] if hits else None
+
+
+async def store(vectors, embedding, question, answer, version):
+    """
+    Caches an answer under the knowledge version it was generated from.
+    """
+    global _stored
+    if version is None or not answer:
+        return
+    try:
+        await vectors.upsert(COLLECTION_NAME, [Point(
+            str(uuid.uuid4()), embedding,
+            {"question": question, "answer": answer, "version": version, "created_at": time.time()},
+        )], wait=False)
+        _stored += 1
+        if _stored % PURGE_EVERY == 0:
+            await purge(vectors, version)
+    except Exception as e:
+        print(f"Answer not cached: {e}")
+
+
+async def purge(vectors, version):
+    """
+    Deletes expired and outdated answers, then the oldest ones over
+    MAX_ENTRIES.
+    """
+    await vectors.delete(COLLECTION_NAME, where=[{"created_at__lt": time.time() - TTL}, {"version__ne": version}])
+    excess = await vectors.count(COLLECTION_NAME) - MAX_ENTRIES
+    if excess > 0:
+        oldest = await vectors.scroll(COLLECTION_NAME, limit=excess, order_by="created_at")
+        await vectors.delete(COLLECTION_NAME, ids=[record.id for record in oldest])
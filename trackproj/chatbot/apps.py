@@ -6,4 +6,6 @@ class ChatbotConfig(AppConfig):
 
     def ready(self):
         # Import signals so the 'post_save' listeners are registered
-        import chatbot.signals
\ No newline at end of file
+        import chatbot.signals
+        # and the job tasks, so workers know them
+        import chatbot.tasks
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+Splits long texts (PDF transcriptions, knowledge base entries) into
+overlapping chunks for embedding, so every part of a document can be
+retrieved instead of only its first few pages.
+
+Chunks follow the text's structure: paragraphs are kept whole when they fit,
+a heading starts a new chunk once the current one is reasonably full, and
+only oversized paragraphs are cut, at sentence and then word boundaries.
+Consecutive chunks share CHUNK_OVERLAP characters so an answer spanning a
+boundary still appears whole in one of them.
+"""
+import re
+
+CHUNK_SIZE = 1500     # characters, well under the embedding model's input limit
+CHUNK_OVERLAP = 200
+
+PARAGRAPH_RE = re.compile(r'\n\s*\n')
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def _blocks(text):
+    return [block.strip() for block in PARAGRAPH_RE.split(text.replace('\r\n', '\n')) if block.strip()]
+
+
+def _is_heading(block):
+    # Markdown headings, or a short single line that doesn't end a sentence
+    if block.startswith('#'):
+        return True
+    return '\n' not in block and len(block) <= 80 and not block.endswith(('.', '!', '?', ':', ';', ','))
+
+
+def _pieces(block, size):
+    """
+    Splits a block longer than size at sentence, then word, boundaries.
+    """
+    if len(block) <= size:
+        return [block]
+    pieces, current = [], ''
+    for sentence in SENTENCE_RE.split(block):
+        while len(sentence) > size:
+            # No sentence break in reach; cut at the last space (or anywhere)
+            cut = sentence.rfind(' ', 0, size)
+            cut = cut if cut > 0 else size
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > size:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f'{current} {sentence}' if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _tail(text, overlap):
+    # The last `overlap` characters, starting at a word boundary
+    if len(text) <= overlap:
+        return text
+    tail = text[-overlap:]
+    space = tail.find(' ')
+    return tail[space + 1:] if space >= 0 else tail
+
+
+def split_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Returns the chunks of text, each at most `size` characters.
+    """
+    chunks, parts, length = [], [], 0
+    for block in _blocks(text or ''):
+        if _is_heading(block) and length >= size // 2:
+            # New section: start a fresh chunk, no overlap needed
+            chunks.append('\n\n'.join(parts))
+            parts, length = [], 0
+        # Leaves room for the overlap carried over from the previous chunk
+        for piece in _pieces(block, size - overlap - 2):
+            if parts and length + 2 + len(piece) > size:
+                chunk = '\n\n'.join(parts)
+                chunks.append(chunk)
+                carry = _tail(chunk, overlap)
+                parts, length = [carry], len(carry)
+            parts.append(piece)
+            length += len(piece) + (2 if len(parts) > 1 else 0)
+    if parts:
+        chunks.append('\n\n'.join(parts))
+    return chunks
@@ -0,0 +1,112 @@
+"""
+The async vector store and Gemini client shared by everything in a web
+process (the chat consumer), instead of one per message. Their connection
+pools are kept warm between messages.
+
+start() creates them and checks the vector store once at ASGI startup;
+shutdown() saves the queued chat messages and closes them. The collections
+themselves are created at deploy time by `manage.py setup_vectors`, not on
+the message path. The background worker uses the sync store in utils.py.
+"""
+import asyncio
+import sys
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from google import genai
+
+from . import message_buffer, vector_store
+from .utils import COLLECTION_NAME, store
+
+_vectors = None
+_genai = None
+_started = False
+
+
+def vectors():
+    global _vectors
+    if _vectors is None:
+        _vectors = vector_store.create_async_store(store)
+    return _vectors
+
+
+def gemini():
+    global _genai
+    if _genai is None:
+        _genai = genai.Client(api_key=settings.GEMINI_API_KEY)
+    return _genai
+
+
+def start():
+    """
+    Creates the clients and checks that the vector store answers and the
+    collection exists (once per process). Problems are reported, not raised: the site
+    still serves everything but the chatbot.
+    """
+    global _started
+    if _started:
+        return
+    _started = True
+    vectors()
+    gemini()
+    try:
+        if not store.collection_exists(COLLECTION_NAME):
+            print(f"Vector collection '{COLLECTION_NAME}' is missing; run `manage.py setup_vectors`.")
+    except Exception as e:
+        print(f"Vector store is unreachable at startup: {e}")
+
+
+async def close():
+    global _vectors, _genai, _started
+    vectors_async, genai_client = _vectors, _genai
+    _vectors = _genai = None
+    _started = False
+    try:
+        if vectors_async is not None:
+            await vectors_async.close()
+        if genai_client is not None:
+            await genai_client.aio.aclose()
+    except Exception as e:
+        print(f"Error closing the chatbot clients: {e}")
+
+
+async def shutdown():
+    # Queued chat messages first: they're written with the database, not these
+    await message_buffer.flush()
+    await close()
+
+
+def close_on_daphne_shutdown():
+    """
+    Daphne doesn't send ASGI lifespan events, so shutdown() is hooked to its
+    reactor's shutdown instead. Only when running under Daphne: importing
+    the reactor anywhere else would install Twisted's default one.
+    """
+    reactor = sys.modules.get('twisted.internet.reactor')
+    if reactor is None:
+        return
+    from twisted.internet.defer import Deferred
+    reactor.addSystemEventTrigger('before', 'shutdown', lambda: Deferred.fromFuture(asyncio.ensure_future(shutdown())))
+
+
+class LifespanMiddleware:
+    """
+    Answers ASGI lifespan events (uvicorn, hypercorn) with start() and
+    shutdown(); passes everything else to the wrapped application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await sync_to_async(start)()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -1,26 +1,36 @@
 import json
-from google import genai
+import uuid
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.conf import settings
-from qdrant_client import AsyncQdrantClient, models
-from .models import Message, ChatRoom
+from . import answer_cache, clients, embedding_cache, memory, message_buffer, retrieval
+from .models import ChatRoom
+from .utils import COLLECTION_NAME, EMBEDDING_MODEL
 from django.contrib.auth.models import User, AnonymousUser
 from channels.db import database_sync_to_async
 
-# Initialize the GenAI Client
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+# The bot's user, looked up once per process
+_bot_user_id = None
+
+def get_bot_user_id():
+    global _bot_user_id
+    if _bot_user_id is None:
+        _bot_user_id = User.objects.get_or_create(username='chatbot')[0].pk
+    return _bot_user_id
 
 class ChatConsumer(AsyncWebsocketConsumer):
     
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = f'chat_{self.room_name}'
+        self.room_id = None  # looked up on the first message
+        self.streaming = False
 
         # Extract token from query string
         try:
             query_string = self.scope['query_string'].decode()
             params = dict(x.split('=') for x in query_string.split('&') if '=' in x)
             token = params.get('token')
+            # ?stream=1: receive the bot's answers chunk by chunk
+            self.streaming = params.get('stream') in ('1', 'true')
             
             if token:
                 from rest_framework_simplejwt.tokens import AccessToken
@@ -49,6 +59,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        await message_buffer.flush()
 
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
@@ -56,13 +67,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
         user = self.scope['user']
 
         if user.is_authenticated:
-            # Save message to database
-            room, _ = await database_sync_to_async(ChatRoom.objects.get_or_create)(name=self.room_name)
-            message = await database_sync_to_async(Message.objects.create)(
-                room=room,
-                user=user,
-                content=message_content
-            )
+            if self.room_id is None:
+                room, _ = await database_sync_to_async(ChatRoom.objects.get_or_create)(name=self.room_name)
+                self.room_id = room.pk
+            # Save message to database (queued, written in the background)
+            message_buffer.add(self.room_id, user.pk, message_content)
 
             # Send message to room group
             await self.channel_layer.group_send(
@@ -74,24 +83,36 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             )
 
-            # Get response from Gemini
-            bot_response = await self.get_gemini_response(message_content)
+            # Stream the answer to the room as it's generated: one event per
+            # chunk, then a final one with the whole text
+            stream_id = uuid.uuid4().hex
+            parts = []
+            async for chunk in self.stream_gemini_response(message_content):
+                parts.append(chunk)
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    {
+                        'type': 'chat_message',
+                        'message': chunk,
+                        'user': 'chatbot',
+                        'id': stream_id,
+                        'done': False,
+                    }
+                )
+            bot_response = ''.join(parts)
 
-            # Save bot response to database
-            bot_user, _ = await database_sync_to_async(User.objects.get_or_create)(username='chatbot')
-            await database_sync_to_async(Message.objects.create)(
-                room=room,
-                user=bot_user,
-                content=bot_response
-            )
+            # Save bot response to database, once it's complete
+            bot_user_id = _bot_user_id or await database_sync_to_async(get_bot_user_id)()
+            message_buffer.add(self.room_id, bot_user_id, bot_response)
 
-            # Send bot response to room group
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'chat_message',
                     'message': bot_response,
-                    'user': 'chatbot'
+                    'user': 'chatbot',
+                    'id': stream_id,
+                    'done': True,
                 }
             )
         else:
@@ -102,86 +123,79 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def chat_message(self, event):
         message = event['message']
         user = event['user']
-        await self.send(text_data=json.dumps({
-            'message': message,
-            'user': user
-        }))
+        if 'id' not in event:
+            await self.send(text_data=json.dumps({
+                'message': message,
+                'user': user
+            }))
+        elif self.streaming:
+            # Chunks (done=False) are appended to the message with this id;
+            # the done=True event carries the full text
+            await self.send(text_data=json.dumps({
+                'message': message,
+                'user': user,
+                'id': event['id'],
+                'done': event['done'],
+            }))
+        elif event['done']:
+            # Clients that didn't ask for streaming get the whole answer as before
+            await self.send(text_data=json.dumps({
+                'message': message,
+                'user': user
+            }))
 
-    async def get_gemini_response(self, user_message):
+    async def stream_gemini_response(self, user_message):
+        """
+        Yields the answer's text as Gemini generates it (an error message
+        instead if anything fails).
+        """
         try:
-            # Use the Async Client
-            qdrant_client = AsyncQdrantClient(host='qdrant', port=6333)
-
-            #  Collection Check
-            collection_name = "chatbot_memory"
-            if not await qdrant_client.collection_exists(collection_name):
-                await qdrant_client.create_collection(
-                    collection_name=collection_name,
-                    vectors_config=models.VectorParams(size=768, distance=models.Distance.COSINE),
+            # Shared clients (clients.py); the collection is created on deploy
+            client = clients.gemini()
+            vectors = clients.vectors()
+
+            # Generate embeddings (repeated questions come from the cache)
+            async def fetch(texts):
+                embed_response = await client.aio.models.embed_content(
+                    model=EMBEDDING_MODEL,
+                    contents=texts
                 )
-
-            # Generate embeddings
-            embed_response = await client.aio.models.embed_content(
-                model="text-embedding-004",
-                contents=user_message
+                return [e.values for e in embed_response.embeddings]
+            embedding = (await embedding_cache.aembed(EMBEDDING_MODEL, [user_message], fetch, query=True))[0]
+
+            # The same question asked before (even in other words) and the
+            # knowledge unchanged since: answer from the cache
+            version = await answer_cache.current_version()
+            cached_answer = await answer_cache.lookup(vectors, embedding, version)
+            if cached_answer is not None:
+                yield cached_answer
+                await self.remember(user_message, embedding)
+                return
+
+            # Best passages for the question, within the prompt's token budget
+            context = await retrieval.retrieve(vectors, COLLECTION_NAME, user_message, embedding)
+            prompt = retrieval.build_prompt(context.text, user_message)
+            print(
+                f"Chatbot context: {context.tokens} tokens from {len(context.passages)} of "
+                f"{context.candidates} passages, retrieved in {context.elapsed_ms:.0f} ms"
             )
-            embedding = embed_response.embeddings[0].values
-
-            query_filter = models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="is_knowledge",
-                        match=models.MatchValue(value=True)
-                    )
-                ]
-            )
-
-            # Search the vector database
-            search_response = await qdrant_client.query_points(
-                collection_name=collection_name,
-                query=embedding,
-                limit=20, 
-                query_filter=query_filter
-            )
-            search_result = search_response.points
-
-            context = ""
-            if search_result:
-                for result in search_result:
-                    context += result.payload['content'] + "\n"
-                    
-            system_instruction = (
-                "Você é um assistente (chatbot) da página Green Trail. "
-                "Responda o usuário utilizando apenas as informações dadas no contexto abaixo. "
-                "Se essa informação não está no contexto, diga 'Não tenho essa informação.'"
-            )
-
-            prompt = f"""{system_instruction}\nContexto:\n{context}\n\nMensagem do usuário: {user_message}"""
 
-            # Generate content
-            response = await client.aio.models.generate_content(
+            # Generate content, passing each chunk on as soon as it arrives
+            stream = await client.aio.models.generate_content_stream(
                 model='gemini-2.5-flash',
                 contents=prompt
             )
-            
-            # 5. Store new memory using await and UUID for ID
-            import uuid
-            await qdrant_client.upsert(
-                collection_name=collection_name,
-                points=[
-                    models.PointStruct(
-                        id=str(uuid.uuid4()), # Safer than using DB IDs
-                        vector=embedding,
-                        payload={"content": user_message},
-                    )
-                ],
-                wait=True,
-            )
-            
-            # Close the client connection nicely
-            await qdrant_client.close()
-
-            return response.text
+            parts = []
+            async for chunk in stream:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+            await answer_cache.store(vectors, embedding, user_message, ''.join(parts), version)
+            await self.remember(user_message, embedding)
         except Exception as e:
             print(f"!!! CHATBOT ERROR: {e} !!!")
-            return f"An error occurred: {e}"
\ No newline at end of file
+            yield f"An error occurred: {e}"
+
+    async def remember(self, user_message, embedding):
+        # 5. Store new memory (its own collection, see memory.py)
+        await memory.remember(clients.vectors(), embedding, user_message, self.room_name, self.scope['user'].pk)
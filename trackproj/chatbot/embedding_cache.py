@@ -0,0 +1,247 @@
+"""
+Cache of embedding vectors, keyed by model and a hash of the normalized
+text, so the same text (an unchanged chunk, a common question) is only sent
+to the embedding API once.
+
+Two tiers: an in-process LRU, then the Django cache (Redis, which evicts
+the least recently used keys when it's full). Hit/miss counters are kept per
+process and added to shared totals in the cache every so often; see
+`manage.py embedding_cache_stats`.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+MEMORY_SIZE = getattr(settings, 'EMBEDDING_CACHE_SIZE', 2048)
+TIMEOUT = getattr(settings, 'EMBEDDING_CACHE_TIMEOUT', 30 * 24 * 3600)
+PREFIX = 'embeddings'
+STATS_FLUSH_SECONDS = 60
+COUNTERS = ('memory_hits', 'redis_hits', 'misses', 'fetch_ms')
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_counts = dict.fromkeys(COUNTERS, 0)
+_last_flush = time.monotonic()
+
+
+def normalize(text, query=False):
+    """
+    Texts that only differ in Unicode form or whitespace share an entry;
+    queries are also case-folded ("Qual o horário?" == "qual o  horário?").
+    """
+    text = WHITESPACE_RE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+    return text.casefold() if query else text
+
+
+def cache_key(model, text, query=False):
+    digest = hashlib.sha256(normalize(text, query).encode()).hexdigest()
+    return f'{PREFIX}:{model}:{digest}'
+
+
+def _count(name, amount=1):
+    with _lock:
+        _counts[name] += amount
+
+
+def _due_totals():
+    """
+    This process's counts, taken (and reset) once every STATS_FLUSH_SECONDS
+    to be added to the shared totals; None in between.
+    """
+    global _last_flush
+    with _lock:
+        if time.monotonic() - _last_flush < STATS_FLUSH_SECONDS:
+            return None
+        pending = dict(_counts)
+        for counter in COUNTERS:
+            _counts[counter] = 0
+        _last_flush = time.monotonic()
+    return pending
+
+
+def _add_to_totals(pending):
+    if not pending:
+        return
+    try:
+        for name, amount in pending.items():
+            if amount:
+                key = f'{PREFIX}:stats:{name}'
+                cache.add(key, 0, timeout=None)
+                cache.incr(key, amount)
+    except Exception as e:
+        print(f"Embedding cache stats not saved: {e}")
+
+
+async def _aadd_to_totals(pending):
+    if not pending:
+        return
+    try:
+        for name, amount in pending.items():
+            if amount:
+                key = f'{PREFIX}:stats:{name}'
+                await cache.aadd(key, 0, timeout=None)
+                await cache.aincr(key, amount)
+    except Exception as e:
+        print(f"Embedding cache stats not saved: {e}")
+
+
+def _remember(key, vector):
+    with _lock:
+        _memory[key] = vector
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def _memory_lookup(keys):
+    """
+    {key: vector} for the keys found in this process.
+    """
+    found = {}
+    with _lock:
+        for key in keys:
+            if key in _memory:
+                _memory.move_to_end(key)
+                found[key] = _memory[key]
+    if found:
+        _count('memory_hits', len(found))
+    return found
+
+
+def _add_remote(found, remote):
+    for key, data in remote.items():
+        found[key] = np.frombuffer(data, dtype=np.float32).tolist()
+        _remember(key, found[key])
+    if remote:
+        _count('redis_hits', len(remote))
+
+
+def _lookup(keys):
+    """
+    {key: vector} for the keys found in either tier.
+    """
+    found = _memory_lookup(keys)
+    remote_keys = [key for key in keys if key not in found]
+    if remote_keys:
+        try:
+            remote = cache.get_many(remote_keys)
+        except Exception as e:
+            print(f"Embedding cache unavailable: {e}")
+            remote = {}
+        _add_remote(found, remote)
+    return found
+
+
+async def _alookup(keys):
+    found = _memory_lookup(keys)
+    remote_keys = [key for key in keys if key not in found]
+    if remote_keys:
+        try:
+            remote = await cache.aget_many(remote_keys)
+        except Exception as e:
+            print(f"Embedding cache unavailable: {e}")
+            remote = {}
+        _add_remote(found, remote)
+    return found
+
+
+def _encode(vectors):
+    for key, vector in vectors.items():
+        _remember(key, vector)
+    # float32 bytes: a quarter of the size of a pickled list of floats
+    return {key: np.asarray(v, dtype=np.float32).tobytes() for key, v in vectors.items()}
+
+
+def _store(vectors):
+    data = _encode(vectors)
+    try:
+        cache.set_many(data, TIMEOUT)
+    except Exception as e:
+        print(f"Embedding cache unavailable: {e}")
+
+
+async def _astore(vectors):
+    data = _encode(vectors)
+    try:
+        await cache.aset_many(data, TIMEOUT)
+    except Exception as e:
+        print(f"Embedding cache unavailable: {e}")
+
+
+def _missing(keys, texts, found):
+    # One API input per distinct missing key
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            missing.setdefault(key, text)
+    return missing
+
+
+def _fetched(missing, vectors, started):
+    _count('misses', len(missing))
+    _count('fetch_ms', int((time.monotonic() - started) * 1000))
+    return dict(zip(missing, vectors))
+
+
+def embed(model, texts, fetch, query=False):
+    """
+    Vectors for texts, in order. fetch(texts) calls the embedding API for
+    the ones not cached and returns their vectors in the same order.
+    """
+    keys = [cache_key(model, text, query) for text in texts]
+    found = _lookup(list(dict.fromkeys(keys)))
+    missing = _missing(keys, texts, found)
+    if missing:
+        started = time.monotonic()
+        fetched = _fetched(missing, fetch(list(missing.values())), started)
+        _store(fetched)
+        found.update(fetched)
+    _add_to_totals(_due_totals())
+    return [found[key] for key in keys]
+
+
+async def aembed(model, texts, fetch, query=False):
+    """
+    embed() for async callers; fetch is a coroutine function. Redis is
+    reached through the async cache API, so it never blocks the event loop.
+    """
+    keys = [cache_key(model, text, query) for text in texts]
+    found = await _alookup(list(dict.fromkeys(keys)))
+    missing = _missing(keys, texts, found)
+    if missing:
+        started = time.monotonic()
+        fetched = _fetched(missing, await fetch(list(missing.values())), started)
+        await _astore(fetched)
+        found.update(fetched)
+    await _aadd_to_totals(_due_totals())
+    return [found[key] for key in keys]
+
+
+def stats():
+    """
+    Shared totals (all processes, up to their last flush) plus this
+    process's unflushed counts, with the hit rate and the API time saved
+    (hits x average miss latency).
+    """
+    try:
+        totals = cache.get_many([f'{PREFIX}:stats:{name}' for name in COUNTERS])
+    except Exception:
+        totals = {}
+    with _lock:
+        result = {name: totals.get(f'{PREFIX}:stats:{name}', 0) + _counts[name] for name in COUNTERS}
+    hits = result['memory_hits'] + result['redis_hits']
+    lookups = hits + result['misses']
+    result['hit_rate'] = hits / lookups if lookups else 0.0
+    average_ms = result['fetch_ms'] / result['misses'] if result['misses'] else 0.0
+    result['saved_api_calls'] = hits
+    result['saved_seconds'] = round(hits * average_ms / 1000, 1)
+    return result
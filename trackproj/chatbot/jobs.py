@@ -0,0 +1,158 @@
+"""
+Background job queue kept in the database (the Job table), run by
+`manage.py run_jobs`. Pending work survives restarts and deploys, and any
+number of worker processes can share the table.
+
+- Debounce by key: enqueue() keeps at most one pending job per key. Enqueuing
+  again pushes its run time back and replaces its payload, so a burst of
+  saves turns into one job.
+- Jobs store ids, not instances; the task loads the current row when it runs.
+- A failed job is retried with exponential backoff, up to JOB_MAX_ATTEMPTS,
+  then kept as 'failed' with its last error.
+- A claimed job is leased for LEASE_SECONDS; if its worker dies, it becomes
+  claimable again once the lease runs out.
+"""
+import os
+import random
+import socket
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 6)
+BACKOFF_BASE = 30      # seconds before the first retry, doubled after each failure
+BACKOFF_MAX = 3600
+LEASE_SECONDS = 600
+
+# task name -> function(**payload)
+TASKS = {}
+
+
+def task(name):
+    """
+    Registers a function as a job task: @jobs.task('vectors.sync').
+    """
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """
+    Queues a task to run in `delay` seconds. With a key, an existing pending
+    job for that key is updated instead of adding another. Call it inside the
+    transaction that made the change, so both commit together.
+    """
+    fields = {'task': name, 'payload': payload or {}, 'run_at': timezone.now() + timedelta(seconds=delay)}
+    if key is None:
+        return Job.objects.create(**fields)
+    # attempts start over: this is new work, not a retry
+    if Job.objects.filter(pending_key=key).update(attempts=0, **fields):
+        return
+    try:
+        with transaction.atomic():
+            Job.objects.create(key=key, pending_key=key, **fields)
+    except IntegrityError:
+        # Another process queued it in the meantime
+        Job.objects.filter(pending_key=key).update(attempts=0, **fields)
+
+
+def cancel(key):
+    """
+    Drops the pending job for a key, if there is one.
+    """
+    Job.objects.filter(pending_key=key).delete()
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+
+
+def claim(worker, limit=10):
+    """
+    Marks up to `limit` due jobs as running for this worker and returns them.
+    SKIP LOCKED keeps concurrent workers off each other's rows; the worker
+    name guards the databases that don't lock (SQLite).
+    """
+    now = timezone.now()
+    due = Q(status=Job.STATUS_PENDING, run_at__lte=now) | Q(status=Job.STATUS_RUNNING, locked_until__lt=now)
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True).filter(due)
+            .order_by('run_at').values_list('pk', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        # Leaving the pending state frees the key, so changes made while this
+        # runs queue a fresh job
+        Job.objects.filter(due, pk__in=ids).update(
+            status=Job.STATUS_RUNNING, pending_key=None, worker=worker,
+            locked_until=now + timedelta(seconds=LEASE_SECONDS), attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(pk__in=ids, worker=worker, status=Job.STATUS_RUNNING).order_by('run_at'))
+
+
+def run(job):
+    """
+    Runs one claimed job. Returns True if it succeeded.
+    """
+    try:
+        func = TASKS.get(job.task)
+        if func is None:
+            raise LookupError(f"Unknown task '{job.task}'")
+        func(**job.payload)
+    except Exception as e:
+        print(f"Job {job} failed (attempt {job.attempts}): {e}")
+        retry_later(job, e)
+        return False
+    Job.objects.filter(pk=job.pk, worker=job.worker).delete()
+    return True
+
+
+def backoff(attempts):
+    # 30s, 60s, 120s, ... with some jitter so failures don't retry in lockstep
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX) * random.uniform(0.8, 1.2)
+
+
+def retry_later(job, error):
+    mine = Job.objects.filter(pk=job.pk, worker=job.worker)
+    if job.attempts >= MAX_ATTEMPTS:
+        mine.update(status=Job.STATUS_FAILED, last_error=str(error), locked_until=None)
+        return
+    if job.key and Job.objects.filter(pending_key=job.key).exists():
+        # A newer change is already queued and will redo this work
+        mine.delete()
+        return
+    try:
+        with transaction.atomic():
+            mine.update(
+                status=Job.STATUS_PENDING, pending_key=job.key or None, last_error=str(error),
+                run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+                locked_until=None, worker='',
+            )
+    except IntegrityError:
+        mine.delete()
+
+
+def stats():
+    """
+    Queue depth: jobs per status, how many are due now and how late the
+    oldest due job is (seconds).
+    """
+    now = timezone.now()
+    counts = dict(Job.objects.order_by().values_list('status').annotate(Count('pk')))
+    due = Job.objects.filter(status=Job.STATUS_PENDING, run_at__lte=now).aggregate(count=Count('pk'), oldest=Min('run_at'))
+    return {
+        'pending': counts.get(Job.STATUS_PENDING, 0),
+        'running': counts.get(Job.STATUS_RUNNING, 0),
+        'failed': counts.get(Job.STATUS_FAILED, 0),
+        'due': due['count'],
+        'oldest_due_age': (now - due['oldest']).total_seconds() if due['oldest'] else 0,
+    }
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot import answer_cache, memory, vector_store
+from chatbot.utils import COLLECTION_NAME, VECTOR_SIZE
+
+COLLECTIONS = {
+    'knowledge': COLLECTION_NAME,
+    'answers': answer_cache.COLLECTION_NAME,
+    'conversations': memory.COLLECTION_NAME,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the vector collections from one store backend to another, e.g. Qdrant into a local "
+        "NumPy replica (--source qdrant --target numpy), without re-embedding anything."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['qdrant', 'numpy'], default='qdrant')
+        parser.add_argument('--target', choices=['qdrant', 'numpy'], default='numpy')
+        parser.add_argument('--only', nargs='+', choices=list(COLLECTIONS), help="Only these collections (default: all)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Points per upsert")
+
+    def handle(self, *args, **options):
+        if options['source'] == options['target']:
+            raise CommandError("--source and --target must differ")
+        source = vector_store.create_store(options['source'])
+        target = vector_store.create_store(options['target'])
+        started = time.monotonic()
+        for kind in options['only'] or COLLECTIONS:
+            name = COLLECTIONS[kind]
+            if not source.collection_exists(name):
+                self.stdout.write(f"{kind}: not in {options['source']}, skipped")
+                continue
+            # The knowledge collection's indexes come with setup_vectors; the
+            # NumPy store doesn't use them anyway
+            target.ensure_collection(name, VECTOR_SIZE)
+            records = source.scroll(name, with_vectors=True)
+            size = options['batch_size']
+            for start in range(0, len(records), size):
+                target.upsert(name, [
+                    vector_store.Point(record.id, record.vector, record.payload) for record in records[start:start + size]
+                ])
+            # Points the source no longer has
+            stale = {record.id for record in target.scroll(name)} - {record.id for record in records}
+            if stale:
+                target.delete(name, ids=sorted(stale))
+            self.stdout.write(f"{kind}: copied {len(records)} points, removed {len(stale)}")
+        target.close()
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.monotonic() - started:.1f}s."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from chatbot import embedding_cache
+
+
+class Command(BaseCommand):
+    help = "Prints the embedding cache's hit/miss counts and the embedding API time it saved."
+
+    def handle(self, *args, **options):
+        stats = embedding_cache.stats()
+        hits = stats['memory_hits'] + stats['redis_hits']
+        self.stdout.write(
+            f"Hits: {hits} ({stats['memory_hits']} in-process, {stats['redis_hits']} Redis), "
+            f"misses: {stats['misses']}, hit rate: {stats['hit_rate']:.1%}"
+        )
+        self.stdout.write(
+            f"Saved about {stats['saved_api_calls']} embedded texts and {stats['saved_seconds']}s of API time "
+            f"(misses took {stats['fetch_ms'] / 1000:.1f}s)."
+        )
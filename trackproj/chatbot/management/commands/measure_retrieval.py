@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot import retrieval
+from chatbot.utils import COLLECTION_NAME, client, embed_texts, store
+
+GENERATION_MODEL = 'gemini-2.5-flash'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the chatbot's budgeted context (retrieval.py) with the old one (the 20 nearest "
+        "chunks, whole) for some questions: prompt tokens, retrieval time and, with --generate, "
+        "Gemini's own token count and answer time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('questions', nargs='*')
+        parser.add_argument('--file', help="More questions, one per line")
+        parser.add_argument('--budget', type=int, help="Context tokens (default: CHAT_CONTEXT_TOKENS)")
+        parser.add_argument('--generate', action='store_true', help="Also ask Gemini with both prompts (costs API calls)")
+
+    def handle(self, *args, **options):
+        questions = list(options['questions'])
+        if options['file']:
+            with open(options['file']) as f:
+                questions += [line.strip() for line in f if line.strip()]
+        if not questions:
+            raise CommandError("Give some questions, or --file")
+
+        totals = {'old': 0, 'new': 0, 'old_ms': 0.0, 'new_ms': 0.0}
+        for question, embedding in zip(questions, embed_texts(questions)):
+            started = time.monotonic()
+            nearest = store.search(COLLECTION_NAME, embedding, limit=20, where={"is_knowledge": True})
+            old = ''.join(hit.payload['content'] + "\n" for hit in nearest)
+            old_ms = (time.monotonic() - started) * 1000
+
+            started = time.monotonic()
+            hits = store.search(COLLECTION_NAME, embedding, limit=retrieval.CANDIDATES, where={"is_knowledge": True})
+            new = retrieval.assemble(question, hits, options['budget'])
+            new_ms = (time.monotonic() - started) * 1000
+
+            old_tokens = retrieval.estimate_tokens(old)
+            totals['old'] += old_tokens
+            totals['new'] += new.tokens
+            totals['old_ms'] += old_ms
+            totals['new_ms'] += new_ms
+            self.stdout.write(
+                f"{question[:60]!r}: {old_tokens} -> {new.tokens} context tokens "
+                f"({len(nearest)} -> {len(new.passages)} passages), retrieval {old_ms:.0f} -> {new_ms:.0f} ms"
+            )
+            if options['generate']:
+                for label, context in (('old', old), ('new', new.text)):
+                    prompt = retrieval.build_prompt(context, question)
+                    started = time.monotonic()
+                    response = client.models.generate_content(model=GENERATION_MODEL, contents=prompt)
+                    self.stdout.write(
+                        f"    {label}: {response.usage_metadata.prompt_token_count} prompt tokens, "
+                        f"answered in {time.monotonic() - started:.1f}s"
+                    )
+
+        saved = totals['old'] - totals['new']
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(questions)} questions: {totals['old']} -> {totals['new']} context tokens "
+            f"({saved / (totals['old'] or 1):.0%} fewer), retrieval {totals['old_ms']:.0f} -> {totals['new_ms']:.0f} ms in all"
+        ))
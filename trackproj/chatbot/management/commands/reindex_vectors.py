@@ -0,0 +1,120 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatbot.models import Document, KnowledgeBase
+from chatbot.utils import EMBED_BATCH_SIZE, assign_qdrant_ids, mark_processed, upsert_batch
+from trackapp.models import Track
+
+SOURCES = {
+    'track': Track,
+    'knowledge': KnowledgeBase,
+    'document': Document,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embeds tracks, knowledge base entries and documents into the vector store in batches. "
+        "Progress is checkpointed, so running it again after an interruption resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=list(SOURCES), help="Only these kinds (default: all)")
+        parser.add_argument('--batch-size', type=int, default=EMBED_BATCH_SIZE, help="Items per embedding request and upsert")
+        parser.add_argument('--concurrency', type=int, default=4, help="Batches in flight at once")
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'reindex_vectors.checkpoint.json'),
+                            help="Where progress is kept between runs")
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.checkpoint = {} if options['restart'] else self.load_checkpoint()
+        if self.checkpoint:
+            self.stdout.write(f"Resuming after {self.checkpoint}")
+
+        started = time.monotonic()
+        synced = failed = 0
+        with ThreadPoolExecutor(max_workers=options['concurrency'], thread_name_prefix='reindex') as pool:
+            for kind in options['only'] or SOURCES:
+                kind_synced, kind_failed = self.reindex(kind, pool)
+                synced += kind_synced
+                failed += kind_failed
+                self.stdout.write(f"{kind}: {kind_synced} synced, {kind_failed} failed batches")
+
+        elapsed = max(time.monotonic() - started, 0.001)
+        if failed:
+            self.stderr.write(f"{failed} batches failed; run the command again to retry from the checkpoint.")
+        else:
+            self.clear_checkpoint()
+        self.stdout.write(self.style.SUCCESS(f"Synced {synced} items in {elapsed:.1f}s ({synced / elapsed:.1f} items/s)."))
+
+    def reindex(self, kind, pool):
+        """
+        Streams the rows in pk order and keeps up to --concurrency batches in
+        flight. Batches are settled oldest first, so the checkpoint only ever
+        moves past batches that are written; after a failure it stays put for
+        this kind (later batches still run, and upserts are idempotent).
+        """
+        batch_size = self.options['batch_size']
+        rows = SOURCES[kind].objects.filter(pk__gt=self.checkpoint.get(kind, 0)).order_by('pk')
+        pending = deque()
+        state = {'synced': 0, 'failed': 0}
+
+        batch = []
+        for instance in rows.iterator(chunk_size=batch_size):
+            batch.append(instance)
+            if len(batch) == batch_size:
+                self.submit(kind, pool, pending, batch, state)
+                batch = []
+        if batch:
+            self.submit(kind, pool, pending, batch, state)
+        while pending:
+            self.settle(kind, pending.popleft(), state)
+        return state['synced'], state['failed']
+
+    def submit(self, kind, pool, pending, batch, state):
+        # Database work stays on this thread; the workers only call the APIs
+        assign_qdrant_ids(batch)
+        pending.append((batch[-1].pk, pool.submit(upsert_batch, batch)))
+        while len(pending) >= self.options['concurrency']:
+            self.settle(kind, pending.popleft(), state)
+
+    def settle(self, kind, entry, state):
+        last_pk, future = entry
+        try:
+            written = future.result()
+        except Exception as e:
+            print(f"Error syncing {kind} batch ending at {last_pk}: {e}")
+            state['failed'] += 1
+            return
+        mark_processed(written)
+        state['synced'] += len(written)
+        if not state['failed']:
+            self.checkpoint[kind] = last_pk
+            self.save_checkpoint()
+
+    def load_checkpoint(self):
+        try:
+            with open(self.options['checkpoint']) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_checkpoint(self):
+        # Written to a temporary file and renamed, so a kill mid-write can't corrupt it
+        path = self.options['checkpoint']
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.checkpoint, f)
+        os.replace(f'{path}.tmp', path)
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.options['checkpoint'])
+        except FileNotFoundError:
+            pass
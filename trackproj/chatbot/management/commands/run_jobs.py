@@ -0,0 +1,62 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chatbot import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs (vector syncs, image variants, see chatbot/jobs.py). Start as many as needed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the jobs due now and exit")
+        parser.add_argument('--batch', type=int, default=10, help="Jobs claimed at a time")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds to sleep when nothing is due")
+        parser.add_argument('--status', action='store_true', help="Print the queue depth and exit")
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.print_stats()
+            return
+
+        self.stopping = False
+        # Finish the job at hand on SIGTERM (deploys) instead of dying mid-job
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        worker = jobs.worker_name()
+        self.stdout.write(f"Worker {worker} started.")
+        done = failed = 0
+        last_report = time.monotonic()
+        while not self.stopping:
+            close_old_connections()
+            claimed = jobs.claim(worker, limit=options['batch'])
+            for job in claimed:
+                if jobs.run(job):
+                    done += 1
+                else:
+                    failed += 1
+                if self.stopping:
+                    # The rest were claimed but not started; their lease runs
+                    # out and another worker picks them up
+                    break
+
+            if time.monotonic() - last_report >= 60:
+                self.stdout.write(f"{done} done, {failed} failed; queue {jobs.stats()}")
+                last_report = time.monotonic()
+            if not claimed:
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+
+        self.stdout.write(f"Worker {worker} stopped: {done} done, {failed} failed.")
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def print_stats(self):
+        stats = jobs.stats()
+        for name, value in stats.items():
+            self.stdout.write(f"{name}: {value}")
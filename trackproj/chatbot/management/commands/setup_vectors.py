@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot import jobs, memory
+from chatbot.utils import COLLECTION_NAME, ensure_collection
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the vector collections and their payload indexes if they're missing, "
+        "and schedules the conversation memory compaction. Run on deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wait', type=int, default=0, help="Seconds to keep retrying while the vector store is starting up")
+
+    def handle(self, *args, **options):
+        deadline = time.monotonic() + options['wait']
+        while True:
+            try:
+                ensure_collection()
+                break
+            except Exception as e:
+                if time.monotonic() >= deadline:
+                    raise CommandError(f"Couldn't set up the vector store: {e}")
+                self.stdout.write("Waiting for the vector store...")
+                time.sleep(2)
+        # Runs right after each deploy, then queues itself again (one pending at a time)
+        jobs.enqueue('memory.compact', key=memory.COMPACT_JOB_KEY)
+        self.stdout.write(self.style.SUCCESS(f"Vector collection '{COLLECTION_NAME}' is ready."))
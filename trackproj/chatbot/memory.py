@@ -0,0 +1,51 @@
+"""
+Conversation memory: every user message the chatbot answers, embedded, in a
+collection of its own. It used to go into the knowledge collection, which
+then grew with chat volume and every knowledge search had to filter it out.
+
+Messages are kept for CHAT_MEMORY_RETENTION_DAYS. The 'memory.compact' job
+(tasks.py) deletes older ones, along with any messages still left in the
+knowledge collection from before the split, and queues itself again every
+COMPACT_INTERVAL seconds; setup_vectors queues the first one.
+"""
+import time
+import uuid
+
+from django.conf import settings
+
+from .vector_store import Point
+
+COLLECTION_NAME = "chatbot_conversations"
+RETENTION = settings.CHAT_MEMORY_RETENTION_DAYS * 24 * 3600
+COMPACT_INTERVAL = 6 * 3600
+COMPACT_JOB_KEY = 'memory:compact'
+
+
+def ensure_collection(store, vector_size):
+    """
+    Creates the memory collection and its payload indexes (sync store).
+    """
+    store.ensure_collection(COLLECTION_NAME, vector_size, indexes={
+        "room": "keyword",
+        "user_id": "integer",
+        "created_at": "float",
+    })
+
+
+async def remember(vectors, embedding, content, room, user_id):
+    await vectors.upsert(
+        COLLECTION_NAME,
+        [Point(str(uuid.uuid4()), embedding, {"content": content, "room": room, "user_id": user_id, "created_at": time.time()})],
+        # Nothing reads it back right away; don't hold up the reply
+        wait=False,
+    )
+
+
+def compact(store, knowledge_collection):
+    """
+    Deletes messages past the retention window, and the ones stored in the
+    knowledge collection before it had a memory collection of its own (the
+    only points there without is_knowledge).
+    """
+    store.delete(COLLECTION_NAME, where={"created_at__lt": time.time() - RETENTION})
+    store.delete(knowledge_collection, where={"is_knowledge__ne": True})
@@ -0,0 +1,75 @@
+"""
+Writes chat messages in the background, so the consumer doesn't wait on the
+database before replying. Messages are queued in the order they're added and
+saved with one bulk_create per FLUSH_INTERVAL (or as soon as FLUSH_SIZE are
+queued). Each message keeps the timestamp of when it was added, and the
+batches are written one after another in order, so the stored order matches
+the order they happened in.
+
+Consumers call flush() on disconnect and the ASGI shutdown hooks call it
+too, so nothing queued is lost on a normal restart.
+"""
+import asyncio
+
+from channels.db import database_sync_to_async
+from django.utils import timezone
+
+from .models import Message
+
+FLUSH_INTERVAL = 0.5   # seconds a message may wait in the queue
+FLUSH_SIZE = 50
+
+_pending = []
+_timer = None      # (loop, handle) of the scheduled flush
+_writing = None    # the last batch's write, so the next one waits for it
+
+
+def add(room_id, user_id, content):
+    """
+    Queues a message for saving. Must be called from the event loop.
+    """
+    global _timer
+    _pending.append(Message(room_id=room_id, user_id=user_id, content=content, timestamp=timezone.now()))
+    loop = asyncio.get_running_loop()
+    if len(_pending) >= FLUSH_SIZE:
+        loop.create_task(flush())
+    elif _timer is None or _timer[0] is not loop:
+        _timer = (loop, loop.call_later(FLUSH_INTERVAL, lambda: loop.create_task(flush())))
+
+
+async def flush():
+    """
+    Saves everything queued so far, after any batch already being written.
+    """
+    global _timer, _writing
+    if _timer is not None:
+        _timer[1].cancel()
+        _timer = None
+    batch = _pending[:]
+    del _pending[:]
+    previous = _writing
+    if previous is not None and previous.get_loop() is not asyncio.get_running_loop():
+        previous = None  # left over from a loop that's gone (tests)
+    _writing = asyncio.ensure_future(_write(batch, previous))
+    await _writing
+
+
+async def _write(batch, previous):
+    if previous is not None:
+        await asyncio.shield(previous)
+    if batch:
+        await database_sync_to_async(_save)(batch)
+
+
+def _save(batch):
+    try:
+        Message.objects.bulk_create(batch)
+    except Exception as e:
+        # One bad row (its room or user was deleted meanwhile) shouldn't
+        # lose the rest of the batch
+        print(f"Error saving {len(batch)} chat messages together, saving one by one: {e}")
+        for message in batch:
+            try:
+                message.save()
+            except Exception as e:
+                print(f"Chat message dropped: {e}")
@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 class ChatRoom(models.Model):
@@ -13,13 +14,19 @@ class Message(models.Model):
     room = models.ForeignKey(ChatRoom, related_name='messages', on_delete=models.CASCADE)
     user = models.ForeignKey(User, related_name='messages', on_delete=models.CASCADE)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the message is sent, not when it's written (message_buffer.py
+    # saves them a moment later, in batches)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f'{self.user.username}: {self.content}'
 
     class Meta:
         ordering = ('timestamp',)
+        indexes = [
+            # MessageViewSet lists a user's messages in timestamp order
+            models.Index(fields=['user', 'timestamp', 'id'], name='message_user_ts_idx'),
+        ]
 
 class KnowledgeBase(models.Model):
     """
@@ -51,4 +58,42 @@ class Document(models.Model):
     processed = models.BooleanField(default=False)
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+class Job(models.Model):
+    """
+    A unit of background work for `manage.py run_jobs` (see jobs.py).
+    Finished jobs are deleted; failed ones are kept for inspection.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=255, blank=True, help_text="Debounce key, e.g. 'vectors:trackapp.track:12'")
+    # Equal to key while the job is pending and NULL otherwise, so the unique
+    # index allows only one pending job per key (NULLs never collide)
+    pending_key = models.CharField(max_length=255, null=True, blank=True, unique=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    run_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Lease of the worker running it")
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for due jobs
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} ({self.key or self.pk}, {self.status})'
@@ -0,0 +1,329 @@
+"""
+In-process vector store backend: each collection is a matrix of unit-length
+float32 rows in a .npy file, memory-mapped, plus a JSON file with the point
+ids and payloads. A search is one matrix product over the rows (in blocks)
+and an argpartition for the top k, so a few thousand vectors take about a
+millisecond and need no server.
+
+Every write is saved before the call returns (a killed process loses
+nothing it acknowledged, and a job isn't marked done before its writes are
+on disk), by writing a new .npy and then the JSON that names it, so a
+reader never sees one without the other. That rewrites the whole matrix per
+call, which is why callers write in batches. Other processes pick the
+change up on their next call. Several processes can
+write the same collection (the web process and the worker both do): a save
+holds an exclusive lock on `{name}.lock`, and if another process saved since
+this one loaded, it loads theirs and applies its own write on top first. Without fcntl (Windows) saves aren't locked, so two processes saving
+at the same moment can still lose one's writes.
+
+Payload indexes aren't needed here: filters are checked on every point.
+"""
+import atexit
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+from .vector_store import Hit, Point, Record, VectorStore, split_lookup
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BLOCK_ROWS = 65536     # rows per matrix product, bounds the temporary memory
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _matches(point_id, payload, where):
+    if where is None:
+        return True
+    if isinstance(where, (list, tuple)):
+        return any(_matches(point_id, payload, w) for w in where)
+    for key, expected in where.items():
+        field, lookup = split_lookup(key)
+        present = field == 'id' or field in payload
+        value = point_id if field == 'id' else payload.get(field)
+        if lookup == 'ne':
+            if present and value == expected:
+                return False
+            continue
+        if not present:
+            return False
+        if lookup == 'in':
+            ok = value in ({str(v) for v in expected} if field == 'id' else expected)
+        elif lookup == 'exact':
+            ok = value == (str(expected) if field == 'id' else expected)
+        else:
+            try:
+                ok = {'gt': value > expected, 'gte': value >= expected,
+                      'lt': value < expected, 'lte': value <= expected}[lookup]
+            except TypeError:
+                ok = False
+        if not ok:
+            return False
+    return True
+
+
+class Collection:
+    def __init__(self, size):
+        self.size = size
+        self.ids = []
+        self.payloads = []
+        self.rows = {}
+        self.matrix = np.zeros((0, size), dtype=np.float32)
+        self.version = None       # name of the .npy file it was loaded from
+        self.loaded_at = None     # mtime of the JSON file it was loaded from
+        self.pending = []         # unsaved writes, as (method name, args)
+        self.dirty = False
+
+    def reindex(self):
+        self.rows = {point_id: row for row, point_id in enumerate(self.ids)}
+
+    def writable(self):
+        # The memory map is read-only; the first write takes a copy
+        if isinstance(self.matrix, np.memmap):
+            self.matrix = np.array(self.matrix)
+        self.dirty = True
+
+    def mask(self, where):
+        if where is None:
+            return None
+        return np.fromiter(
+            (_matches(point_id, payload, where) for point_id, payload in zip(self.ids, self.payloads)),
+            dtype=bool, count=len(self.ids),
+        )
+
+    def upsert(self, points):
+        self.writable()
+        new_ids, new_payloads, new_vectors = [], [], []
+        for point in points:
+            row = self.rows.get(point.id)
+            if row is None:
+                self.rows[point.id] = len(self.ids) + len(new_ids)
+                new_ids.append(point.id)
+                new_payloads.append(point.payload)
+                new_vectors.append(point.vector)
+            elif row >= len(self.ids):
+                # Twice in this call
+                new_payloads[row - len(self.ids)] = point.payload
+                new_vectors[row - len(self.ids)] = point.vector
+            else:
+                self.payloads[row] = point.payload
+                self.matrix[row] = _unit(point.vector)
+        if new_ids:
+            self.ids.extend(new_ids)
+            self.payloads.extend(new_payloads)
+            self.matrix = np.concatenate([self.matrix, _unit(new_vectors)])
+
+    def delete(self, ids, where):
+        """
+        Returns whether anything was deleted.
+        """
+        if ids is not None:
+            keep = np.array([point_id not in ids for point_id in self.ids], dtype=bool)
+        elif where is not None:
+            keep = ~self.mask(where)
+        else:
+            keep = np.zeros(len(self.ids), dtype=bool)
+        if keep.all():
+            return False
+        self.writable()
+        self.matrix = self.matrix[keep]
+        self.ids = [point_id for point_id, k in zip(self.ids, keep) if k]
+        self.payloads = [payload for payload, k in zip(self.payloads, keep) if k]
+        self.reindex()
+        return True
+
+    def replay(self, pending):
+        """
+        Applies another copy's unsaved writes to this one.
+        """
+        for method, args in pending:
+            getattr(self, method)(*args)
+        self.pending = list(pending)
+        self.dirty = self.dirty or bool(pending)
+
+
+class NumpyStore(VectorStore):
+    def __init__(self, path):
+        self.path = str(path)
+        self.collections = {}
+        self.lock = threading.RLock()
+        atexit.register(self.flush)
+
+    def _meta_path(self, name):
+        return os.path.join(self.path, f'{name}.json')
+
+    @contextmanager
+    def _file_lock(self, name, shared=False):
+        """
+        Locks the collection's files against other processes: shared while
+        loading, exclusive while saving.
+        """
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, f'{name}.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield   # closing the file releases it
+
+    def _load(self, name):
+        """
+        The collection as last saved, or None if it was never saved.
+        """
+        meta_path = self._meta_path(name)
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        collection = Collection(meta['size'])
+        collection.ids, collection.payloads = meta['ids'], meta['payloads']
+        if collection.ids:
+            collection.matrix = np.load(os.path.join(self.path, meta['vectors']), mmap_mode='r')
+        collection.reindex()
+        collection.version = meta['vectors']
+        collection.loaded_at = mtime
+        return collection
+
+    def _get(self, name):
+        """
+        The collection, reloaded if another process saved a newer version
+        (with this process's unsaved writes applied again on top).
+        """
+        with self.lock:
+            collection = self.collections.get(name)
+            try:
+                mtime = os.stat(self._meta_path(name)).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if collection is not None and (mtime is None or mtime == collection.loaded_at):
+                return collection
+            with self._file_lock(name, shared=True):
+                fresh = self._load(name)
+            if fresh is None:
+                raise LookupError(f"Collection '{name}' doesn't exist")
+            if collection is not None:
+                fresh.replay(collection.pending)
+            self.collections[name] = fresh
+            return fresh
+
+    def flush(self):
+        """
+        Saves every changed collection: writes are saved as they're made, so
+        this only retries one whose save failed.
+        """
+        with self.lock:
+            for name, collection in list(self.collections.items()):
+                if collection.dirty:
+                    self._save(name, collection)
+
+    def _save(self, name, collection):
+        with self._file_lock(name):
+            saved = self._load(name)
+            if saved is not None and saved.version != collection.version:
+                # Another process saved since this one loaded: keep their writes too
+                saved.replay(collection.pending)
+                collection = self.collections[name] = saved
+            vectors = f'{name}.{uuid.uuid4().hex[:12]}.npy'
+            np.save(os.path.join(self.path, vectors), np.ascontiguousarray(collection.matrix))
+            meta_path = self._meta_path(name)
+            with open(f'{meta_path}.tmp', 'w') as f:
+                json.dump({'size': collection.size, 'vectors': vectors, 'ids': collection.ids, 'payloads': collection.payloads}, f)
+            os.replace(f'{meta_path}.tmp', meta_path)
+            if saved is not None:
+                # Processes that mapped it keep reading it until they reload
+                try:
+                    os.remove(os.path.join(self.path, saved.version))
+                except FileNotFoundError:
+                    pass
+            collection.version = vectors
+            collection.pending = []
+            collection.dirty = False
+            collection.loaded_at = os.stat(meta_path).st_mtime_ns
+
+    def collection_exists(self, name):
+        with self.lock:
+            return name in self.collections or os.path.exists(self._meta_path(name))
+
+    def ensure_collection(self, name, size, indexes=None):
+        with self.lock:
+            if not self.collection_exists(name):
+                self.collections[name] = Collection(size)
+                self.collections[name].dirty = True
+                self.flush()
+
+    def upsert(self, name, points, wait=True):
+        points = [Point(str(point.id), point.vector, point.payload) for point in points]
+        with self.lock:
+            collection = self._get(name)
+            collection.upsert(points)
+            collection.pending.append(('upsert', (points,)))
+            self._save(name, collection)
+
+    def search(self, name, vector, limit=10, where=None, score_threshold=None):
+        with self.lock:
+            collection = self._get(name)
+            if not collection.ids:
+                return []
+            query = _unit(vector)
+            scores = np.concatenate([
+                collection.matrix[start:start + BLOCK_ROWS] @ query
+                for start in range(0, len(collection.ids), BLOCK_ROWS)
+            ])
+            mask = collection.mask(where)
+            if mask is not None:
+                scores[~mask] = -np.inf
+            if score_threshold is not None:
+                scores[scores < score_threshold] = -np.inf
+            k = min(limit, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                Hit(collection.ids[row], float(scores[row]), collection.payloads[row])
+                for row in top if scores[row] != -np.inf
+            ]
+
+    def scroll(self, name, where=None, limit=None, order_by=None, with_vectors=False):
+        with self.lock:
+            collection = self._get(name)
+            rows = [
+                row for row, (point_id, payload) in enumerate(zip(collection.ids, collection.payloads))
+                if _matches(point_id, payload, where)
+            ]
+            if order_by:
+                # Like Qdrant: points without the field are left out
+                rows = sorted((r for r in rows if order_by in collection.payloads[r]), key=lambda r: collection.payloads[r][order_by])
+            return [
+                Record(collection.ids[row], collection.payloads[row], collection.matrix[row].tolist() if with_vectors else None)
+                for row in rows[:limit]
+            ]
+
+    def delete(self, name, ids=None, where=None):
+        if ids is not None:
+            ids = {str(point_id) for point_id in ids}
+        with self.lock:
+            collection = self._get(name)
+            if collection.delete(ids, where):
+                collection.pending.append(('delete', (ids, where)))
+                self._save(name, collection)
+
+    def count(self, name, where=None):
+        with self.lock:
+            collection = self._get(name)
+            mask = collection.mask(where)
+            return len(collection.ids) if mask is None else int(mask.sum())
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,138 @@
+"""
+Builds the chatbot's prompt context from the knowledge collection.
+
+1. The CANDIDATES nearest chunks to the question's embedding.
+2. Those re-scored with BM25 against the question's words (trackapp.search's
+   tokenizer: lowercased, accents stripped), with IDF taken over the
+   candidates; the vector and BM25 rankings are merged with reciprocal rank
+   fusion, so exact names and numbers the embedding glossed over move up.
+3. Near-duplicates dropped: passages that mostly repeat a better one, or
+   that a better one mostly repeats (the same text in several documents, a
+   whole-item point from before chunking next to its chunks).
+4. The best passages packed into CHAT_CONTEXT_TOKENS tokens, estimated at
+   CHARS_PER_TOKEN characters each; a passage that doesn't fit is skipped
+   for smaller ones, and if none fits the best one is cut short.
+
+`manage.py measure_retrieval` compares the prompts this makes with the old
+"top 20, all of it" ones.
+"""
+import math
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+
+from trackapp.search import BM25_B, BM25_K1, tokenize
+
+CANDIDATES = 50
+CONTEXT_TOKENS = getattr(settings, 'CHAT_CONTEXT_TOKENS', 2000)
+CHARS_PER_TOKEN = 4    # Gemini's rough average for Portuguese and English text
+RRF_K = 60
+SHINGLE_SIZE = 3
+DUPLICATE_CONTAINMENT = 0.8   # share of the shorter passage's shingles found in the other
+
+SYSTEM_INSTRUCTION = (
+    "Você é um assistente (chatbot) da página Green Trail. "
+    "Responda o usuário utilizando apenas as informações dadas no contexto abaixo. "
+    "Se essa informação não está no contexto, diga 'Não tenho essa informação.'"
+)
+
+Context = namedtuple('Context', 'text passages tokens candidates elapsed_ms')
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def build_prompt(context_text, user_message):
+    return f"""{SYSTEM_INSTRUCTION}\nContexto:\n{context_text}\n\nMensagem do usuário: {user_message}"""
+
+
+def bm25_scores(query_terms, documents):
+    """
+    BM25 of each tokenized document for the query terms, with document
+    frequencies counted over `documents` themselves.
+    """
+    if not documents:
+        return []
+    frequency = Counter(term for terms in documents for term in set(terms))
+    average_length = (sum(len(terms) for terms in documents) / len(documents)) or 1
+    scores = []
+    for terms in documents:
+        counts = Counter(terms)
+        score = 0.0
+        for term in query_terms:
+            if counts[term]:
+                idf = math.log(1 + (len(documents) - frequency[term] + 0.5) / (frequency[term] + 0.5))
+                norm = counts[term] + BM25_K1 * (1 - BM25_B + BM25_B * len(terms) / average_length)
+                score += idf * counts[term] * (BM25_K1 + 1) / norm
+        scores.append(score)
+    return scores
+
+
+def _shingles(terms):
+    if len(terms) < SHINGLE_SIZE:
+        return {tuple(terms)}
+    return {tuple(terms[i:i + SHINGLE_SIZE]) for i in range(len(terms) - SHINGLE_SIZE + 1)}
+
+
+def rank(query, hits):
+    """
+    The hits' texts, best first by fused vector + BM25 rank, without
+    near-duplicates.
+    """
+    texts = [hit.payload.get('content', '') for hit in hits]
+    terms = [tokenize(text) for text in texts]
+    bm25 = bm25_scores(list(dict.fromkeys(tokenize(query))), terms)
+    lexical_rank = {i: r for r, i in enumerate(sorted(range(len(hits)), key=lambda i: -bm25[i]))}
+    # hits come in vector order; passages no query word appears in get no lexical credit
+    fused = {
+        i: 1 / (RRF_K + i) + (1 / (RRF_K + lexical_rank[i]) if bm25[i] > 0 else 0)
+        for i in range(len(hits))
+    }
+
+    kept, seen = [], []
+    for i in sorted(fused, key=fused.get, reverse=True):
+        shingles = _shingles(terms[i])
+        if not texts[i] or any(
+            len(shingles & other) >= DUPLICATE_CONTAINMENT * min(len(shingles), len(other)) for other in seen
+        ):
+            continue
+        seen.append(shingles)
+        kept.append(texts[i])
+    return kept
+
+
+def pack(passages, budget):
+    """
+    As many of the passages (in order of preference) as fit in `budget`
+    tokens. Returns the chosen ones, in that order.
+    """
+    chosen, used = [], 0
+    for text in passages:
+        cost = estimate_tokens(text) + 1   # + the separator
+        if used + cost <= budget:
+            chosen.append(text)
+            used += cost
+    if passages and not chosen:
+        # None fits whole: keep the start of the best one, cut at a word
+        cut = passages[0][:budget * CHARS_PER_TOKEN]
+        chosen.append(cut[:cut.rfind(' ')] if ' ' in cut else cut)
+    return chosen
+
+
+def assemble(query, hits, budget=None):
+    started = time.monotonic()
+    passages = pack(rank(query, hits), budget or CONTEXT_TOKENS)
+    text = '\n\n'.join(passages)
+    return Context(text, passages, estimate_tokens(text), len(hits), (time.monotonic() - started) * 1000)
+
+
+async def retrieve(vectors, collection, query, embedding, budget=None):
+    """
+    The prompt context for a question, from the async vector store.
+    """
+    started = time.monotonic()
+    hits = await vectors.search(collection, embedding, limit=CANDIDATES, where={"is_knowledge": True})
+    context = assemble(query, hits, budget)
+    return context._replace(elapsed_ms=(time.monotonic() - started) * 1000)
@@ -1,38 +1,29 @@
-import threading
+from django.conf import settings
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from .models import KnowledgeBase, Document
 from trackapp.models import Track
-from .utils import sync_item_to_qdrant, delete_from_qdrant
+from . import jobs
 
 # Debouncer
-# This dictionary holds active timers: { 'model_name-id': TimerObject }
-active_timers = {}
-DELAY_SECONDS = 300 # Currently set to 5 minutes (leave it at 15 or so when testing)
+# Syncs go through the job queue (jobs.py, run by `manage.py run_jobs`), one
+# pending job per object: every save pushes it back, so a burst of edits is
+# synced once, SYNC_DELAY seconds after the last one.
+SYNC_DELAY = getattr(settings, 'VECTOR_SYNC_DELAY', 300)
+
+def sync_key(instance):
+    return f"vectors:{instance._meta.label_lower}:{instance.pk}"
 
 def schedule_sync(instance):
     """
-    Cancels existing timer for this specific object and starts a new one.
+    Queues (or pushes back) the sync for this specific object.
     """
-    key = f"{instance._meta.model_name}-{instance.pk}"
-    
-    # Cancel existing timer if it's running
-    if key in active_timers:
-        active_timers[key].cancel()
-    
-    # Define the actual task
-    def task():
-        print(f"Timer finished. Syncing {key}...")
-        sync_item_to_qdrant(instance)
-        # Cleanup
-        if key in active_timers:
-            del active_timers[key]
-
-    # Start new timer
-    timer = threading.Timer(DELAY_SECONDS, task)
-    active_timers[key] = timer
-    timer.start()
-    print(f"Scheduled sync for {key} in {DELAY_SECONDS}s")
+    jobs.enqueue(
+        'vectors.sync',
+        {'model': instance._meta.label_lower, 'pk': instance.pk},
+        key=sync_key(instance),
+        delay=SYNC_DELAY,
+    )
 
 
 # Signals
@@ -57,5 +48,6 @@ def on_save(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=Document)
 @receiver(post_delete, sender=Track)
 def on_delete(sender, instance, **kwargs):
+    jobs.cancel(sync_key(instance))
     if instance.qdrant_id:
-        delete_from_qdrant(instance.qdrant_id)
\ No newline at end of file
+        jobs.enqueue('vectors.delete', {'qdrant_id': str(instance.qdrant_id)}, key=f"vectors-delete:{instance.qdrant_id}")
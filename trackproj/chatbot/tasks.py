@@ -0,0 +1,43 @@
+"""
+Job tasks (see jobs.py) for keeping the vector store in step.
+"""
+from django.apps import apps
+
+from . import jobs, memory
+from .utils import (
+    COLLECTION_NAME, EMBED_BATCH_SIZE, assign_qdrant_ids, delete_from_qdrant, ensure_collection, mark_processed,
+    store, upsert_batch,
+)
+
+
+@jobs.task('vectors.sync')
+def sync_vectors(model, pk=None, pks=None):
+    """
+    Syncs one row (pk, queued on save) or many (pks, queued by bulk writes
+    like import_tracks), a batch of EMBED_BATCH_SIZE at a time.
+    """
+    # Loaded when the job runs, so it syncs the rows as they are now; rows
+    # deleted meanwhile are skipped (the delete queued its own job)
+    instances = list(apps.get_model(model).objects.filter(pk__in=[pk] if pks is None else pks))
+    assign_qdrant_ids(instances)
+    for start in range(0, len(instances), EMBED_BATCH_SIZE):
+        mark_processed(upsert_batch(instances[start:start + EMBED_BATCH_SIZE]))
+    if pks is None and instances:
+        print(f"Synced to Qdrant: {instances[0]._meta.label} {pk}")
+    elif pks is not None:
+        print(f"Synced to Qdrant: {len(instances)} of {len(pks)} {model} rows")
+
+
+@jobs.task('vectors.delete')
+def delete_vectors(qdrant_id):
+    # Every chunk of the item, in one call
+    delete_from_qdrant(qdrant_id)
+
+
+@jobs.task('memory.compact')
+def compact_memory():
+    ensure_collection()
+    memory.compact(store, COLLECTION_NAME)
+    print("Compacted conversation memory")
+    # Periodic: runs again later (a failure is retried by the queue instead)
+    jobs.enqueue('memory.compact', key=memory.COMPACT_JOB_KEY, delay=memory.COMPACT_INTERVAL)
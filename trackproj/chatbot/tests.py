@@ -0,0 +1,497 @@
+import io
+import uuid
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.utils import timezone
+from trackapp.models import Track
+from . import answer_cache, chunking, clients, embedding_cache, jobs, message_buffer, retrieval
+from .models import ChatRoom, Job, KnowledgeBase, Message
+from .utils import delete_from_qdrant, sync_item_to_qdrant
+
+# Tests that reach the cache get one in this process instead of Redis, and
+# clear it in setUp so nothing carries over from an earlier test
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# This checks the background job queue behind the Qdrant syncs.
+class JobQueueTests(TestCase):
+    def due_now(self):
+        Job.objects.update(run_at=timezone.now())
+
+    def run_worker(self):
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+
+    def test_saves_are_debounced_into_one_job(self):
+        track = Track.objects.create(label="Debounce")
+        track.description = "Editada"
+        track.save()
+        track.save(update_fields=['qdrant_id'])
+        job = Job.objects.get()
+        self.assertEqual((job.task, job.payload), ('vectors.sync', {'model': 'trackapp.track', 'pk': track.pk}))
+        self.assertGreater(job.run_at, timezone.now())
+
+    def test_worker_syncs_the_current_row(self):
+        track = Track.objects.create(label="Antes")
+        Track.objects.filter(pk=track.pk).update(label="Depois")
+        self.due_now()
+        with patch('chatbot.tasks.upsert_batch', side_effect=lambda batch: batch) as upsert:
+            self.run_worker()
+        self.assertEqual(upsert.call_args.args[0][0].label, "Depois")
+        self.assertFalse(Job.objects.exists())
+        track.refresh_from_db()
+        self.assertIsNotNone(track.qdrant_id)
+
+    def test_bulk_sync_job(self):
+        tracks = Track.objects.bulk_create([Track(label="Um"), Track(label="Dois")])
+        jobs.enqueue('vectors.sync', {'model': 'trackapp.track', 'pks': [t.pk for t in tracks]})
+        with patch('chatbot.tasks.upsert_batch', side_effect=lambda batch: batch) as upsert:
+            self.run_worker()
+        self.assertEqual(sorted(t.label for t in upsert.call_args.args[0]), ["Dois", "Um"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failures_back_off_then_stop(self):
+        Track.objects.create(label="Falha")
+        with patch('chatbot.tasks.upsert_batch', side_effect=RuntimeError('qdrant down')):
+            for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+                self.due_now()
+                self.run_worker()
+                job = Job.objects.get()
+                self.assertEqual(job.attempts, attempt)
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertEqual(job.last_error, 'qdrant down')
+        self.assertEqual(jobs.stats()['failed'], 1)
+
+    def test_retry_waits_and_keeps_the_key(self):
+        Track.objects.create(label="Retry")
+        self.due_now()
+        with patch('chatbot.tasks.upsert_batch', side_effect=RuntimeError('timeout')):
+            self.run_worker()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.STATUS_PENDING)
+        self.assertGreater(job.run_at, timezone.now())
+        # A new save coalesces into the retrying job
+        Track.objects.get().save()
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_delete_cancels_sync_and_queues_removal(self):
+        track = Track.objects.create(label="Apagar")
+        Track.objects.filter(pk=track.pk).update(qdrant_id=uuid.uuid4())
+        Track.objects.get().delete()
+        self.assertEqual(list(Job.objects.values_list('task', flat=True)), ['vectors.delete'])
+
+def numpy_store(test):
+    from chatbot.numpy_store import NumpyStore
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    store = NumpyStore(path)
+    test.addCleanup(store.close)
+    return store
+
+# This checks that long texts are stored as chunks and re-synced incrementally.
+@override_settings(CACHES=LOCAL_CACHE)
+class VectorChunkTests(TestCase):
+    def make_store(self):
+        return numpy_store(self)
+
+    def setUp(self):
+        cache.clear()
+        self.store = self.make_store()
+        self.embedded = []
+
+        def embed_content(model, contents):
+            self.embedded.extend(contents)
+            return SimpleNamespace(embeddings=[SimpleNamespace(values=[1.0] + [0.0] * 767) for _ in contents])
+
+        genai = SimpleNamespace(models=SimpleNamespace(embed_content=embed_content))
+        for patcher in (patch('chatbot.utils.store', self.store), patch('chatbot.utils.client', genai),
+                        patch('chatbot.utils._collection_ready', False),
+                        patch('chatbot.embedding_cache._memory', OrderedDict())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def points(self):
+        return self.store.scroll('chatbot_memory')
+
+    def test_split_text(self):
+        text = '\n\n'.join(f"Parágrafo {i}. " + 'palavra ' * 60 for i in range(20))
+        chunks = chunking.split_text(text)
+        self.assertGreater(len(chunks), 3)
+        self.assertTrue(all(len(c) <= chunking.CHUNK_SIZE for c in chunks))
+        self.assertIn('Parágrafo 19.', chunks[-1])
+        # Consecutive chunks overlap
+        self.assertIn(chunks[0][-40:], chunks[1][:chunking.CHUNK_OVERLAP])
+
+    def test_edit_reembeds_only_changed_chunks(self):
+        paragraphs = [f"Seção {i}. " + 'trilha ' * 150 for i in range(8)]
+        entry = KnowledgeBase.objects.create(title="Guia", content='\n\n'.join(paragraphs))
+        sync_item_to_qdrant(entry)
+        first = {p.id for p in self.points()}
+        self.assertGreater(len(first), 3)
+        self.assertEqual({p.payload['parent_id'] for p in self.points()}, {str(entry.qdrant_id)})
+
+        self.embedded.clear()
+        paragraphs[-1] = "Seção final reescrita. " + 'montanha ' * 100
+        entry.content = '\n\n'.join(paragraphs)
+        sync_item_to_qdrant(entry)
+        self.assertLess(len(self.embedded), 3)
+        second = {p.id for p in self.points()}
+        self.assertTrue(first - second)  # the old last chunk is gone
+        self.assertTrue(any('montanha' in p.payload['content'] for p in self.points()))
+
+    def test_memory_compaction(self):
+        from chatbot import memory
+        from chatbot.utils import ensure_collection
+        from chatbot.vector_store import Point
+        ensure_collection()
+        entry = KnowledgeBase.objects.create(title="Guia", content='texto')
+        sync_item_to_qdrant(entry)
+        now = time.time()
+        vector = [0.0, 1.0] + [0.0] * 766
+        self.store.upsert('chatbot_conversations', [
+            Point(str(uuid.uuid4()), vector, {'content': 'antiga', 'created_at': now - memory.RETENTION - 60}),
+            Point(str(uuid.uuid4()), vector, {'content': 'recente', 'created_at': now}),
+        ])
+        # A message stored the old way, among the knowledge
+        self.store.upsert('chatbot_memory', [Point(str(uuid.uuid4()), vector, {'content': 'oi'})])
+
+        memory.compact(self.store, 'chatbot_memory')
+        remaining = self.store.scroll('chatbot_conversations')
+        self.assertEqual([p.payload['content'] for p in remaining], ['recente'])
+        self.assertEqual({p.payload['parent_id'] for p in self.points()}, {str(entry.qdrant_id)})
+
+    def test_delete_removes_every_chunk(self):
+        entry = KnowledgeBase.objects.create(title="Longo", content='\n\n'.join('texto ' * 200 for _ in range(5)))
+        sync_item_to_qdrant(entry)
+        other = KnowledgeBase.objects.create(title="Outro", content='curto')
+        sync_item_to_qdrant(other)
+        delete_from_qdrant(entry.qdrant_id)
+        self.assertEqual({p.payload['parent_id'] for p in self.points()}, {str(other.qdrant_id)})
+
+# The same, against Qdrant (its local mode)
+class VectorChunkQdrantTests(VectorChunkTests):
+    def make_store(self):
+        from qdrant_client import QdrantClient
+        from chatbot.vector_store import QdrantStore
+        return QdrantStore(QdrantClient(':memory:'))
+
+# Both backends must give the same answers to the same calls.
+class VectorStoreTests(TestCase):
+    def stores(self):
+        from qdrant_client import QdrantClient
+        from chatbot.vector_store import QdrantStore
+        return {'numpy': numpy_store(self), 'qdrant': QdrantStore(QdrantClient(':memory:'))}
+
+    def fill(self, store):
+        from chatbot.vector_store import Point
+        store.ensure_collection('pontos', 3, indexes={'kind': 'keyword', 'n': 'integer'})
+        self.ids = [str(uuid.uuid4()) for _ in range(4)]
+        store.upsert('pontos', [
+            Point(self.ids[0], [1, 0, 0], {'kind': 'a', 'n': 1}),
+            Point(self.ids[1], [0.9, 0.1, 0], {'kind': 'b', 'n': 2}),
+            Point(self.ids[2], [0, 1, 0], {'kind': 'a', 'n': 3}),
+            Point(self.ids[3], [0, 0, 1], {'n': 4}),
+        ])
+
+    def test_backends_agree(self):
+        for backend, store in self.stores().items():
+            with self.subTest(backend):
+                self.fill(store)
+                hits = store.search('pontos', [1, 0, 0], limit=2)
+                self.assertEqual([h.id for h in hits], self.ids[:2])
+                self.assertAlmostEqual(hits[0].score, 1.0, places=5)
+                self.assertEqual([h.id for h in store.search('pontos', [1, 0, 0], limit=5, where={'kind': 'a'})],
+                                 [self.ids[0], self.ids[2]])
+                self.assertEqual(len(store.search('pontos', [1, 0, 0], limit=5, score_threshold=0.5)), 2)
+                # ne also matches points without the field
+                self.assertEqual(store.count('pontos', where={'kind__ne': 'a'}), 2)
+                self.assertEqual(store.count('pontos', where=[{'n__gte': 4}, {'id__in': [self.ids[0]]}]), 2)
+                self.assertEqual([r.payload['n'] for r in store.scroll('pontos', where={'n__lt': 4}, order_by='n', limit=2)], [1, 2])
+                store.delete('pontos', where={'kind__in': ['b']})
+                store.delete('pontos', ids=[self.ids[3]])
+                self.assertEqual(sorted(r.id for r in store.scroll('pontos')), sorted([self.ids[0], self.ids[2]]))
+
+    def test_numpy_store_persists_and_reloads(self):
+        from chatbot.numpy_store import NumpyStore
+        from chatbot.vector_store import Point
+        store = numpy_store(self)
+        self.fill(store)
+        # Another process opening the same files; every write is on disk already
+        other = NumpyStore(store.path)
+        self.assertEqual(other.count('pontos'), 4)
+        store.upsert('pontos', [Point(self.ids[0], [0, 0, 1], {'kind': 'z'})])
+        self.assertEqual(other.search('pontos', [0, 0, 1], limit=1, where={'kind': 'z'})[0].id, self.ids[0])
+
+    def test_numpy_store_merges_writes_from_two_processes(self):
+        from chatbot.numpy_store import NumpyStore
+        from chatbot.vector_store import Point
+        store = numpy_store(self)
+        self.fill(store)
+        other = NumpyStore(store.path)
+        self.addCleanup(other.close)
+        other.count('pontos')
+        new_id = str(uuid.uuid4())
+        store.upsert('pontos', [Point(new_id, [1, 1, 0], {'kind': 'c', 'n': 5})])
+        # other's copy is stale now; the one it saves must still have the upsert
+        stale = other.collections['pontos']
+        stale.delete(None, {'kind': 'b'})
+        stale.pending.append(('delete', (None, {'kind': 'b'})))
+        other._save('pontos', stale)
+        for reader in (NumpyStore(store.path), store, other):
+            self.assertEqual(sorted(r.payload['n'] for r in reader.scroll('pontos')), [1, 3, 4, 5])
+
+# This checks the two-tier embedding cache.
+@override_settings(CACHES=LOCAL_CACHE)
+class EmbeddingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fetched = []
+        for patcher in (patch('chatbot.embedding_cache._memory', OrderedDict()),
+                        patch('chatbot.embedding_cache._counts', dict.fromkeys(embedding_cache.COUNTERS, 0))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fetch(self, texts):
+        self.fetched.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def test_second_lookup_skips_the_api(self):
+        first = embedding_cache.embed('model', ['a  trilha', 'b', 'a trilha'], self.fetch)
+        self.assertEqual(self.fetched, ['a  trilha', 'b'])  # normalized duplicates are fetched once
+        self.assertEqual(first[0], first[2])
+        self.fetched.clear()
+        self.assertEqual(embedding_cache.embed('model', ['b', ' a trilha\n'], self.fetch), [first[1], first[0]])
+        self.assertEqual(self.fetched, [])
+        # A different model doesn't share entries
+        embedding_cache.embed('other-model', ['b'], self.fetch)
+        self.assertEqual(self.fetched, ['b'])
+
+    def test_redis_tier_serves_other_processes(self):
+        embedding_cache.embed('model', ['trilha'], self.fetch)
+        embedding_cache._memory.clear()  # as seen from another process
+        self.fetched.clear()
+        self.assertEqual(embedding_cache.embed('model', ['trilha'], self.fetch), [[6.0, 0.5]])
+        self.assertEqual(self.fetched, [])
+        stats = embedding_cache.stats()
+        self.assertEqual((stats['misses'], stats['redis_hits'], stats['memory_hits']), (1, 1, 0))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_memory_tier_is_bounded(self):
+        with patch('chatbot.embedding_cache.MEMORY_SIZE', 2):
+            embedding_cache.embed('model', ['a', 'b', 'c'], self.fetch)
+        self.assertEqual(len(embedding_cache._memory), 2)
+
+    def test_queries_ignore_case(self):
+        async def fetch(texts):
+            return self.fetch(texts)
+        async_to_sync(embedding_cache.aembed)('model', ['Qual o horário?'], fetch, query=True)
+        async_to_sync(embedding_cache.aembed)('model', ['qual o  HORÁRIO?'], fetch, query=True)
+        self.assertEqual(self.fetched, ['Qual o horário?'])
+
+    def test_async_path_uses_async_cache_calls(self):
+        async def fetch(texts):
+            return self.fetch(texts)
+        # The blocking calls would stall the event loop the consumer runs on
+        redis = MagicMock(get_many=MagicMock(side_effect=AssertionError), set_many=MagicMock(side_effect=AssertionError),
+                          aget_many=AsyncMock(return_value={}), aset_many=AsyncMock())
+        with patch('chatbot.embedding_cache.cache', redis):
+            async_to_sync(embedding_cache.aembed)('model', ['trilha'], fetch, query=True)
+        redis.aset_many.assert_awaited_once()
+
+# This checks the clients shared by the chat consumer.
+class ChatClientsTests(TestCase):
+    def setUp(self):
+        for patcher in (patch('chatbot.clients._vectors', None), patch('chatbot.clients._genai', None),
+                        patch('chatbot.clients._started', False)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_clients_are_shared(self):
+        self.assertIs(clients.vectors(), clients.vectors())
+        self.assertIs(clients.gemini(), clients.gemini())
+
+    def test_lifespan_starts_and_closes_clients(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        app = clients.LifespanMiddleware(None)
+        with patch('chatbot.clients.store') as store:
+            store.collection_exists.return_value = True
+            async_to_sync(app)({'type': 'lifespan'}, receive, send)
+            store.collection_exists.assert_called_once()
+            store.close.assert_called_once()
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertIsNone(clients._vectors)
+        self.assertIsNone(clients._genai)
+
+# This checks the chat consumer end to end, with Gemini faked.
+@override_settings(CACHES=LOCAL_CACHE, CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatStreamingTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        from chatbot.vector_store import AsyncStore
+        self.user = User.objects.create_user(username='hiker', password='pass')
+        self.store = numpy_store(self)
+        for name in ('chatbot_memory', 'chatbot_answers', 'chatbot_conversations'):
+            self.store.ensure_collection(name, 2)
+        self.vectors = AsyncStore(self.store)
+        self.generated = []
+
+        async def embed_content(model, contents):
+            # Questions about trails point one way, everything else another
+            return SimpleNamespace(embeddings=[
+                SimpleNamespace(values=[1.0, 0.1] if 'trilha' in text.lower() else [0.0, 1.0]) for text in contents
+            ])
+
+        async def stream():
+            for text in ("Trilhas ", "fáceis ", "ficam ao norte."):
+                yield SimpleNamespace(text=text)
+
+        async def generate_content_stream(model, contents):
+            self.generated.append(contents)
+            return stream()
+
+        gemini = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(
+            embed_content=embed_content, generate_content_stream=generate_content_stream,
+        )))
+        for patcher in (patch('chatbot.clients._vectors', self.vectors), patch('chatbot.clients._genai', gemini),
+                        patch('chatbot.embedding_cache._memory', OrderedDict()),
+                        patch('chatbot.consumers._bot_user_id', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def chat(self, query, message='Onde ficam as trilhas fáceis?'):
+        from channels.testing import WebsocketCommunicator
+        from rest_framework_simplejwt.tokens import AccessToken
+        from trackproj.asgi import application
+        token = await database_sync_to_async(AccessToken.for_user)(self.user)
+        communicator = WebsocketCommunicator(application, f'/ws/chat/geral/?token={token}{query}')
+        await communicator.connect()
+        await communicator.send_json_to({'message': message})
+        received = [await communicator.receive_json_from()]  # the user's own message
+        while not (received[-1]['user'] == 'chatbot' and received[-1].get('done', True)):
+            received.append(await communicator.receive_json_from())
+        await communicator.disconnect()
+        return received[1:]
+
+    def test_streamed_chunks_then_full_text(self):
+        events = async_to_sync(self.chat)('&stream=1')
+        self.assertEqual([e['message'] for e in events[:-1]], ["Trilhas ", "fáceis ", "ficam ao norte."])
+        self.assertEqual(len({e['id'] for e in events}), 1)
+        self.assertEqual([e['done'] for e in events], [False, False, False, True])
+        self.assertEqual(events[-1]['message'], "Trilhas fáceis ficam ao norte.")
+        # Stored once, complete
+        self.assertEqual(list(Message.objects.filter(user__username='chatbot').values_list('content', flat=True)),
+                         ["Trilhas fáceis ficam ao norte."])
+
+    def test_non_streaming_clients_get_the_whole_answer(self):
+        events = async_to_sync(self.chat)('')
+        self.assertEqual(events, [{'message': "Trilhas fáceis ficam ao norte.", 'user': 'chatbot'}])
+
+    def test_similar_question_is_answered_from_cache(self):
+        first = async_to_sync(self.chat)('')
+        second = async_to_sync(self.chat)('', 'Quais trilhas são fáceis?')
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.generated), 1)
+        # A different question still goes to Gemini
+        async_to_sync(self.chat)('', 'Qual o horário de funcionamento?')
+        self.assertEqual(len(self.generated), 2)
+
+    def test_knowledge_change_invalidates_answers(self):
+        async_to_sync(self.chat)('')
+        async_to_sync(self.chat)('')
+        self.assertEqual(len(self.generated), 1)
+        answer_cache.knowledge_changed()
+        async_to_sync(self.chat)('')
+        self.assertEqual(len(self.generated), 2)
+
+    def test_messages_are_remembered_apart_from_knowledge(self):
+        async_to_sync(self.chat)('')
+        memories = self.store.scroll('chatbot_conversations')
+        self.assertEqual([(m.payload['content'], m.payload['room'], m.payload['user_id']) for m in memories],
+                         [('Onde ficam as trilhas fáceis?', 'geral', self.user.pk)])
+        self.assertEqual(self.store.count('chatbot_memory'), 0)
+
+    def test_prompt_context_stays_within_budget(self):
+        from chatbot.vector_store import Point
+        self.store.upsert('chatbot_memory', [
+            Point(str(uuid.uuid4()), [1.0, 0.1 + i / 100], {"content": f"Trilha {i}: " + "caminho de terra " * 100, "is_knowledge": True})
+            for i in range(30)
+        ])
+        with patch('chatbot.retrieval.CONTEXT_TOKENS', 500):
+            async_to_sync(self.chat)('')
+        context = self.generated[0].split('Contexto:\n')[1].split('\n\nMensagem do usuário')[0]
+        self.assertTrue(context.startswith('Trilha '))
+        self.assertLessEqual(retrieval.estimate_tokens(context), 500)
+
+        async def fill():
+            for i, version in enumerate((1, 2, 2, 2)):
+                await answer_cache.store(self.vectors, [1.0, i], f'pergunta {i}', f'resposta {i}', version)
+            with patch('chatbot.answer_cache.MAX_ENTRIES', 2):
+                await answer_cache.purge(self.vectors, 2)
+            return sorted(point.payload['answer'] for point in await self.vectors.scroll('chatbot_answers'))
+        self.assertEqual(async_to_sync(fill)(), ['resposta 2', 'resposta 3'])
+
+    def test_buffered_messages_keep_their_order(self):
+        room = ChatRoom.objects.create(name='geral')
+
+        async def send_all():
+            for i in range(5):
+                message_buffer.add(room.pk, self.user.pk, f'mensagem {i}')
+            await message_buffer.flush()
+
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(send_all)()
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), [f'mensagem {i}' for i in range(5)])
+
+# This checks how the prompt's context is ranked and packed.
+class RetrievalTests(TestCase):
+    def hits(self, *texts):
+        from chatbot.vector_store import Hit
+        return [Hit(str(i), 1 - i / 100, {"content": text}) for i, text in enumerate(texts)]
+
+    def test_exact_words_move_a_passage_up(self):
+        hits = self.hits(
+            "Trilhas fáceis para iniciantes na serra.",
+            "Parque aberto das oito às dezessete horas.",
+            "Mirante com vista para o vale.",
+            "A Trilha do Pico tem 12 km e exige preparo.",
+        )
+        ranked = retrieval.rank("Quantos km tem a Trilha do Pico?", hits)
+        self.assertEqual(ranked[0], "A Trilha do Pico tem 12 km e exige preparo.")
+        # Nothing lost, vector order otherwise
+        self.assertEqual(ranked[1:], [hits[0].payload['content'], hits[1].payload['content'], hits[2].payload['content']])
+
+    def test_near_duplicates_are_dropped(self):
+        text = "A trilha do morro começa no estacionamento e sobe pela mata até o mirante principal."
+        hits = self.hits(text, text.replace("principal", "principal."), "Um texto " + text + " Fim.", "Outro assunto completamente diferente.")
+        self.assertEqual(retrieval.rank("mirante", hits), [text, "Outro assunto completamente diferente."])
+
+    def test_packing_respects_the_budget(self):
+        passages = ["a " * 400, "b " * 40, "c " * 400, "d " * 40]
+        packed = retrieval.pack(passages, 100)
+        # The long ones don't fit; the short ones after them still do
+        self.assertEqual(packed, ["b " * 40, "d " * 40])
+        context = retrieval.assemble("x", self.hits(*passages), 100)
+        self.assertLessEqual(context.tokens, 100)
+        # A first passage over the budget is cut at a word
+        cut = retrieval.pack(["palavra " * 200], 50)[0]
+        self.assertLessEqual(retrieval.estimate_tokens(cut), 50)
+        self.assertTrue(cut.endswith("palavra"))
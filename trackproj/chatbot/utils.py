@@ -1,20 +1,51 @@
+import hashlib
 import mimetypes
 import uuid
+from collections import defaultdict
 from django.conf import settings
 from google import genai
-from qdrant_client import QdrantClient, models
+from . import answer_cache, chunking, embedding_cache, memory, vector_store
+from .vector_store import Point
 from .models import Document, KnowledgeBase
 from trackapp.models import Track
 
 # Sync clients for background tasks
 client = genai.Client(api_key=settings.GEMINI_API_KEY)
-qdrant_client = QdrantClient(host='qdrant', port=6333)
+# Qdrant, or the local NumPy store (settings.VECTOR_STORE, see vector_store.py)
+store = vector_store.create_store()
 COLLECTION_NAME = "chatbot_memory"
+EMBEDDING_MODEL = "text-embedding-004"
+VECTOR_SIZE = 768
+EMBED_BATCH_SIZE = 100 # Most texts the embedding API takes in one request
 
-def sync_item_to_qdrant(instance):
+def track_text(instance):
+    """
+    The text embedded for a Track.
+    """
+    # We construct a natural language sentence so Gemini understands the context
+    # since we store the difficulty as "facil", for code, and "Fácil", for readability.
+    difficulty = instance.get_difficulty_display()
+    route = instance.get_route_type_display() # Same goes for route types
+
+    # Handle optional fields safely
+    dist = f"{instance.distance} meters" if instance.distance else "Unknown distance"
+    dur = f"{instance.duration} minutes" if instance.duration else "Unknown duration"
+    elev = f"{instance.elevation} meters" if instance.elevation else "Unknown elevation"
+
+    return (
+        f"Hiking Trail Name: {instance.label}.\n"
+        f"Difficulty Level: {difficulty}.\n"
+        f"Route Type: {route}.\n"
+        f"Total Distance: {dist}.\n"
+        f"Estimated Duration: {dur}.\n"
+        f"Elevation Gain: {elev}.\n"
+        f"Description: {instance.description}"
+    )
+
+def item_text(instance):
     """
-    Reads a KnowledgeBase or Document instance, extracts text, 
-    and UPSERTS it into Qdrant.
+    Returns (text, source) to embed for a KnowledgeBase, Document or Track.
+    text is empty when there's nothing usable.
     """
     text_content = ""
     source_info = ""
@@ -43,7 +74,7 @@ def sync_item_to_qdrant(instance):
                 client.files.delete(name=uploaded_file.name)
             except Exception as e:
                 print(f"Error reading PDF: {e}")
-                return
+                return "", source_info
         # Handle text files
         # Could also be handled by Gemini, especially if it contains OCR-only information.
         elif mime_type and mime_type.startswith('text'):
@@ -52,78 +83,173 @@ def sync_item_to_qdrant(instance):
     
     elif isinstance(instance, Track):
         source_info = f"Track: {instance.label}"
-        
-        # We construct a natural language sentence so Gemini understands the context
-        # since we store the difficulty as "facil", for code, and "Fácil", for readability.
-        difficulty = instance.get_difficulty_display()
-        route = instance.get_route_type_display() # Same goes for route types
-        
-        # Handle optional fields safely
-        dist = f"{instance.distance} meters" if instance.distance else "Unknown distance"
-        dur = f"{instance.duration} minutes" if instance.duration else "Unknown duration"
-        elev = f"{instance.elevation} meters" if instance.elevation else "Unknown elevation"
-        
-        text_content = (
-            f"Hiking Trail Name: {instance.label}.\n"
-            f"Difficulty Level: {difficulty}.\n"
-            f"Route Type: {route}.\n"
-            f"Total Distance: {dist}.\n"
-            f"Estimated Duration: {dur}.\n"
-            f"Elevation Gain: {elev}.\n"
-            f"Description: {instance.description}"
-        )
-
-    # Vectorize and upsert
-    if text_content:
-        # Generate new UUID if not exists, or use existing to overwrite
+        text_content = track_text(instance)
+
+    return text_content, source_info
+
+def sync_item_to_qdrant(instance):
+    """
+    Reads a KnowledgeBase, Document or Track instance, extracts text, 
+    and UPSERTS its chunks into Qdrant (see upsert_batch).
+    """
+    try:
+        assign_qdrant_ids([instance])
+        mark_processed(upsert_batch([instance]))
+        print(f"Synced to Qdrant: {item_text(instance)[1]}")
+    except Exception as e:
+        print(f"Error syncing to Qdrant: {e}")
+
+# Each item is stored as one point per chunk (chunking.py). A chunk's point id
+# is derived from the item's qdrant_id and the chunk's hash, so re-syncing an
+# edited item only embeds the chunks that changed, and the points left over
+# from the old version are deleted. All chunks carry parent_id = qdrant_id.
+_collection_ready = False
+
+def ensure_collection():
+    """
+    Creates the collection and its payload indexes if they're missing, and
+    the answer cache and conversation memory collections (once per process).
+    """
+    global _collection_ready
+    if _collection_ready:
+        return
+    store.ensure_collection(COLLECTION_NAME, VECTOR_SIZE, indexes={
+        "parent_id": "keyword",
+        # The chatbot's search filters on it
+        "is_knowledge": "bool",
+    })
+    answer_cache.ensure_collection(store, VECTOR_SIZE)
+    memory.ensure_collection(store, VECTOR_SIZE)
+    _collection_ready = True
+
+def item_chunks(instance):
+    """
+    Returns (source, [(point_id, text, hash)]); no chunks if the item has no
+    text. The source line is part of every chunk, so renaming an item
+    re-embeds it.
+    """
+    text_content, source_info = item_text(instance)
+    parent = uuid.UUID(str(instance.qdrant_id))
+    chunks = {}
+    for chunk in chunking.split_text(text_content):
+        text = f"{source_info}\n{chunk}"
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        point_id = str(uuid.uuid5(parent, digest))
+        # Repeated chunks (boilerplate) are stored once
+        chunks.setdefault(point_id, (point_id, text, digest))
+    return source_info, list(chunks.values())
+
+def _parent_filter(qdrant_ids):
+    # The chunks of these items, plus the single whole-item point they had
+    # before chunking (its id is the item's qdrant_id)
+    qdrant_ids = [str(qdrant_id) for qdrant_id in qdrant_ids]
+    return [{"parent_id__in": qdrant_ids}, {"id__in": qdrant_ids}]
+
+def stored_point_ids(qdrant_ids):
+    """
+    Ids of every point currently stored for these items.
+    """
+    return {record.id for record in store.scroll(COLLECTION_NAME, where=_parent_filter(qdrant_ids))}
+
+def embed_texts(texts):
+    """
+    Embedding vectors for texts, in order. Texts embedded before (by any
+    process) come from the embedding cache; one request for the rest.
+    """
+    def fetch(missing):
+        response = client.models.embed_content(model=EMBEDDING_MODEL, contents=missing)
+        return [embedding.values for embedding in response.embeddings]
+    return embedding_cache.embed(EMBEDDING_MODEL, texts, fetch)
+
+# Batched sync, for many items at once (admin actions, import_tracks,
+# reindex_vectors): one embedding request and one upsert per batch.
+def assign_qdrant_ids(instances):
+    """
+    Gives every instance without a qdrant_id a new one, with one bulk UPDATE
+    per model (no post_save, so no sync gets scheduled for it).
+    """
+    missing = defaultdict(list)
+    for instance in instances:
         if not instance.qdrant_id:
             instance.qdrant_id = uuid.uuid4()
-            instance.save(update_fields=['qdrant_id'])
-            
-        # Get Embedding
-        # !!! We should probably break the file in chunks in case it's too big.
-        try:
-            embed_response = client.models.embed_content(
-                model="text-embedding-004",
-                contents=text_content[:9000] # Simple truncate for safety
-            )
-            embedding = embed_response.embeddings[0].values
-
-            qdrant_client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=[
-                models.PointStruct(
-                    id=str(instance.qdrant_id),
-                    vector=embedding,
-                    payload={
-                        "content": text_content,
-                        "source": source_info,
-                        "is_knowledge": True
-                        }
-                    )
-                ]
-            )
-            print(f"Synced to Qdrant: {source_info}")
-            
-            if isinstance(instance, Document):
-                instance.processed = True
-                instance.save(update_fields=['processed'])
+            missing[type(instance)].append(instance)
+    for model, items in missing.items():
+        model.objects.bulk_update(items, ['qdrant_id'], batch_size=500)
+
+def upsert_batch(instances):
+    """
+    Brings the instances' chunks in the vector store up to date: embeds and upserts the
+    new or changed chunks (EMBED_BATCH_SIZE per request) and deletes the
+    orphaned ones in one call. They must already have a qdrant_id (see
+    assign_qdrant_ids). Returns the ones written (items without text are
+    skipped); raises if a call fails. Doesn't touch the database, so it can
+    run in a worker thread.
+    """
+    items = []
+    for instance in instances:
+        source_info, chunks = item_chunks(instance)
+        if chunks:
+            items.append((instance, source_info, chunks))
+    if not items:
+        return []
+
+    ensure_collection()
+    stored = stored_point_ids([instance.qdrant_id for instance, _, _ in items])
+    wanted = {point_id for _, _, chunks in items for point_id, _, _ in chunks}
+    pending = [
+        (instance, source_info, chunk) for instance, source_info, chunks in items
+        for chunk in chunks if chunk[0] not in stored
+    ]
+
+    for start in range(0, len(pending), EMBED_BATCH_SIZE):
+        batch = pending[start:start + EMBED_BATCH_SIZE]
+        vectors = embed_texts([text for _, _, (_, text, _) in batch])
+        store.upsert(COLLECTION_NAME, [
+            Point(point_id, vector, {
+                "content": text,
+                "source": source_info,
+                "is_knowledge": True,
+                "parent_id": str(instance.qdrant_id),
+                "chunk_hash": digest,
+            })
+            for (instance, source_info, (point_id, text, digest)), vector in zip(batch, vectors)
+        ])
 
+    orphans = stored - wanted
+    if orphans:
+        store.delete(COLLECTION_NAME, ids=sorted(orphans))
+    if pending or orphans:
+        # Answers cached from the old knowledge may be wrong now
+        answer_cache.knowledge_changed()
+    return [instance for instance, _, _ in items]
+
+def mark_processed(instances):
+    ids = [instance.pk for instance in instances if isinstance(instance, Document)]
+    if ids:
+        Document.objects.filter(pk__in=ids).update(processed=True)
+
+def sync_items_to_qdrant(instances, batch_size=EMBED_BATCH_SIZE):
+    """
+    Batched sync_item_to_qdrant. Returns how many items were synced; a batch
+    that fails is reported and skipped.
+    """
+    instances = list(instances)
+    assign_qdrant_ids(instances)
+    synced = 0
+    for start in range(0, len(instances), batch_size):
+        try:
+            written = upsert_batch(instances[start:start + batch_size])
+            mark_processed(written)
+            synced += len(written)
         except Exception as e:
             print(f"Error syncing to Qdrant: {e}")
+    return synced
 
 def delete_from_qdrant(qdrant_id):
     """
-    Deletes a specific point from Qdrant using the UUID.
+    Deletes every point (all chunks) of an item from the vector store in one call.
     """
     if qdrant_id:
-        try:
-            qdrant_client.delete(
-                collection_name=COLLECTION_NAME,
-                points_selector=models.PointIdsList(
-                    points=[str(qdrant_id)]
-                )
-            )
-            print(f"Deleted vector ID {qdrant_id}")
-        except Exception as e:
-            print(f"Error deleting from Qdrant: {e}")
\ No newline at end of file
+        store.delete(COLLECTION_NAME, where=_parent_filter([qdrant_id]))
+        answer_cache.knowledge_changed()
+        print(f"Deleted vectors of {qdrant_id}")
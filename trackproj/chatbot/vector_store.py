@@ -0,0 +1,264 @@
+"""
+Vector store interface used by the chatbot (utils.py for syncing, the
+consumer, answer_cache.py and memory.py), so none of them talk to Qdrant
+directly. Backends, picked with settings.VECTOR_STORE:
+
+- 'qdrant': a Qdrant server (QDRANT_* settings).
+- 'numpy': numpy_store.py, vectors in memory-mapped NumPy files under
+  VECTOR_STORE_PATH. No server; enough for a few thousand vectors. Useful as
+  a local replica (see `manage.py copy_vectors`) or in tests.
+
+Filters ("where") are dicts of Django-style lookups on payload fields, all
+of which must match; a list of dicts matches any of them:
+
+    {'parent_id__in': ids}, {'created_at__lt': cutoff, 'version__ne': 3}
+    [{'parent_id__in': ids}, {'id__in': ids}]
+
+Lookups: exact (no suffix), in, ne (different or missing), gt, gte, lt, lte.
+'id' matches the point id instead of a payload field.
+"""
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+
+Point = namedtuple('Point', 'id vector payload')
+Hit = namedtuple('Hit', 'id score payload')
+Record = namedtuple('Record', 'id payload vector')
+
+LOOKUPS = ('in', 'ne', 'gt', 'gte', 'lt', 'lte')
+# Payload index types ensure_collection() understands
+INDEX_TYPES = ('keyword', 'integer', 'float', 'bool')
+
+
+def split_lookup(key):
+    field, _, lookup = key.rpartition('__')
+    if lookup in LOOKUPS:
+        return field, lookup
+    return key, 'exact'
+
+
+class VectorStore:
+    """
+    The operations every backend provides. Vectors are compared by cosine
+    similarity; point ids are UUID strings.
+    """
+
+    def collection_exists(self, name):
+        raise NotImplementedError
+
+    def ensure_collection(self, name, size, indexes=None):
+        """
+        Creates the collection if it's missing, and payload indexes
+        ({field: one of INDEX_TYPES}) for the fields filtered on.
+        """
+        raise NotImplementedError
+
+    def upsert(self, name, points, wait=True):
+        """
+        Inserts or replaces Points. wait=False may return before they're
+        searchable.
+        """
+        raise NotImplementedError
+
+    def search(self, name, vector, limit=10, where=None, score_threshold=None):
+        """
+        The `limit` closest points matching `where`, as Hits, best first.
+        """
+        raise NotImplementedError
+
+    def scroll(self, name, where=None, limit=None, order_by=None, with_vectors=False):
+        """
+        Records matching `where` (all of them without a limit), in ascending
+        order of the `order_by` payload field if given.
+        """
+        raise NotImplementedError
+
+    def delete(self, name, ids=None, where=None):
+        raise NotImplementedError
+
+    def count(self, name, where=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class QdrantStore(VectorStore):
+    """
+    Qdrant server backend. The sync methods here; AsyncQdrantStore has the
+    same for the async client, sharing the request building.
+    """
+    SCHEMAS = {
+        'keyword': models.PayloadSchemaType.KEYWORD,
+        'integer': models.PayloadSchemaType.INTEGER,
+        'float': models.PayloadSchemaType.FLOAT,
+        'bool': models.PayloadSchemaType.BOOL,
+    }
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def condition(cls, key, value):
+        # (condition, negated)
+        field, lookup = split_lookup(key)
+        if field == 'id':
+            ids = [str(v) for v in value] if lookup == 'in' else [str(value)]
+            return models.HasIdCondition(has_id=ids), False
+        if lookup == 'in':
+            return models.FieldCondition(key=field, match=models.MatchAny(any=list(value))), False
+        if lookup in ('exact', 'ne'):
+            return models.FieldCondition(key=field, match=models.MatchValue(value=value)), lookup == 'ne'
+        return models.FieldCondition(key=field, range=models.Range(**{lookup: value})), False
+
+    @classmethod
+    def to_filter(cls, where):
+        if where is None:
+            return None
+        if isinstance(where, (list, tuple)):
+            return models.Filter(should=[cls.to_filter(w) for w in where])
+        must, must_not = [], []
+        for key, value in where.items():
+            condition, negated = cls.condition(key, value)
+            (must_not if negated else must).append(condition)
+        return models.Filter(must=must or None, must_not=must_not or None)
+
+    def _selector(self, ids, where):
+        if ids is not None:
+            return models.PointIdsList(points=[str(i) for i in ids])
+        return models.FilterSelector(filter=self.to_filter(where))
+
+    def _points(self, points):
+        return [models.PointStruct(id=str(p.id), vector=list(p.vector), payload=p.payload) for p in points]
+
+    def _hits(self, response):
+        return [Hit(str(p.id), p.score, p.payload) for p in response.points]
+
+    def _records(self, points):
+        return [Record(str(p.id), p.payload, p.vector) for p in points]
+
+    def collection_exists(self, name):
+        return self.client.collection_exists(name)
+
+    def ensure_collection(self, name, size, indexes=None):
+        if not self.client.collection_exists(name):
+            self.client.create_collection(
+                collection_name=name,
+                vectors_config=models.VectorParams(size=size, distance=models.Distance.COSINE),
+            )
+        for field, kind in (indexes or {}).items():
+            self.client.create_payload_index(collection_name=name, field_name=field, field_schema=self.SCHEMAS[kind])
+
+    def upsert(self, name, points, wait=True):
+        self.client.upsert(collection_name=name, points=self._points(points), wait=wait)
+
+    def search(self, name, vector, limit=10, where=None, score_threshold=None):
+        return self._hits(self.client.query_points(
+            collection_name=name, query=list(vector), limit=limit,
+            query_filter=self.to_filter(where), score_threshold=score_threshold,
+        ))
+
+    def scroll(self, name, where=None, limit=None, order_by=None, with_vectors=False):
+        found, offset = [], None
+        while True:
+            page = 1000 if limit is None else min(1000, limit - len(found))
+            points, offset = self.client.scroll(
+                collection_name=name, scroll_filter=self.to_filter(where), limit=page, offset=offset,
+                order_by=order_by, with_payload=True, with_vectors=with_vectors,
+            )
+            found.extend(self._records(points))
+            # Ordered scrolls come back in one page (no offsets)
+            if offset is None or order_by or (limit is not None and len(found) >= limit):
+                return found
+
+    def delete(self, name, ids=None, where=None):
+        self.client.delete(collection_name=name, points_selector=self._selector(ids, where))
+
+    def count(self, name, where=None):
+        return self.client.count(collection_name=name, count_filter=self.to_filter(where), exact=True).count
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncQdrantStore(QdrantStore):
+    """
+    QdrantStore with coroutine methods, for the consumer. Collections are
+    created on deploy, with the sync store, so there's no ensure_collection.
+    """
+
+    async def collection_exists(self, name):
+        return await self.client.collection_exists(name)
+
+    async def upsert(self, name, points, wait=True):
+        await self.client.upsert(collection_name=name, points=self._points(points), wait=wait)
+
+    async def search(self, name, vector, limit=10, where=None, score_threshold=None):
+        return self._hits(await self.client.query_points(
+            collection_name=name, query=list(vector), limit=limit,
+            query_filter=self.to_filter(where), score_threshold=score_threshold,
+        ))
+
+    async def scroll(self, name, where=None, limit=None, order_by=None, with_vectors=False):
+        # The consumer only ever needs one page
+        points, _ = await self.client.scroll(
+            collection_name=name, scroll_filter=self.to_filter(where), limit=limit or 1000,
+            order_by=order_by, with_payload=True, with_vectors=with_vectors,
+        )
+        return self._records(points)
+
+    async def delete(self, name, ids=None, where=None):
+        await self.client.delete(collection_name=name, points_selector=self._selector(ids, where))
+
+    async def count(self, name, where=None):
+        return (await self.client.count(collection_name=name, count_filter=self.to_filter(where), exact=True)).count
+
+    async def close(self):
+        await self.client.close()
+
+
+class AsyncStore:
+    """
+    Coroutine methods for a sync store (the NumPy backend), run in a thread.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+        return sync_to_async(method, thread_sensitive=False)
+
+
+def create_store(backend=None):
+    """
+    The sync store for settings.VECTOR_STORE (or `backend`).
+    """
+    backend = backend or settings.VECTOR_STORE
+    if backend == 'numpy':
+        from .numpy_store import NumpyStore
+        return NumpyStore(settings.VECTOR_STORE_PATH)
+    if backend == 'qdrant':
+        return QdrantStore(QdrantClient(
+            host=settings.QDRANT_HOST, port=settings.QDRANT_PORT,
+            api_key=settings.QDRANT_API_KEY, timeout=settings.QDRANT_TIMEOUT,
+        ))
+    raise ValueError(f"Unknown vector store '{backend}'")
+
+
+def create_async_store(store):
+    """
+    The async counterpart of `store`: a pooled async Qdrant client for
+    Qdrant, the same in-process store otherwise.
+    """
+    if isinstance(store, QdrantStore):
+        return AsyncQdrantStore(AsyncQdrantClient(
+            host=settings.QDRANT_HOST, port=settings.QDRANT_PORT,
+            api_key=settings.QDRANT_API_KEY, timeout=settings.QDRANT_TIMEOUT,
+            pool_size=settings.QDRANT_POOL_SIZE,
+            # The version check is a blocking request; clients.start() checks instead
+            check_compatibility=False,
+        ))
+    return AsyncStore(store)
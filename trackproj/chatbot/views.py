@@ -2,6 +2,7 @@ from rest_framework import viewsets
 from .models import ChatRoom, Message
 from .serializers import ChatRoomSerializer, MessageSerializer
 from rest_framework.permissions import IsAuthenticated
+from trackapp.pagination import OptionalCursorPagination
 
 class ChatRoomViewSet(viewsets.ModelViewSet):
     queryset = ChatRoom.objects.all()
@@ -12,6 +13,8 @@ class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('timestamp', 'id')
 
     def get_queryset(self):
         """
@@ -1,23 +1,20 @@
 from django.contrib import admin, messages
+from django.db import transaction
 from django.utils.html import format_html
 from .models import Track, Profile, Rating, Favorite
-from chatbot.utils import sync_item_to_qdrant
+from . import response_cache
+from chatbot.utils import sync_items_to_qdrant
 
 # Chatbot knowledge sync function
 def force_sync_tracks(modeladmin, request, queryset):
     """
-    Manually sends selected tracks to Qdrant via the utility function.
+    Manually sends selected tracks to Qdrant, in batches.
     """
-    count = 0
-    errors = 0
-    for item in queryset:
-        try:
-            sync_item_to_qdrant(item)
-            count += 1
-        except Exception as e:
-            errors += 1
-            modeladmin.message_user(request, f"Error syncing '{item.label}': {e}", messages.ERROR)
-            
+    selected = list(queryset)
+    count = sync_items_to_qdrant(selected)
+
+    if count < len(selected):
+        modeladmin.message_user(request, f"{len(selected) - count} tracks were not synced, check the logs.", messages.ERROR)
     if count > 0:
         modeladmin.message_user(request, f"Successfully synced {count} tracks to Qdrant.", messages.SUCCESS)
 
@@ -38,6 +35,13 @@ class TrackAdmin(admin.ModelAdmin):
     
     search_fields = ('label', 'description')
     list_filter = ('difficulty', 'route_type')
+
+    # Derived from the GPX upload
+    readonly_fields = (
+        'ascent', 'descent', 'min_altitude', 'max_altitude', 'min_latitude',
+        'max_latitude', 'min_longitude', 'max_longitude', 'point_count',
+        'start_latitude', 'start_longitude'
+    )
     
     # Add the action button
     actions = [force_sync_tracks]
@@ -53,7 +57,49 @@ class RatingAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'track__label')
     list_filter = ('score', 'date')
 
+    # Keep the rating aggregates stored on Track right, as RatingViewSet does
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if not change:
+                Track.objects.apply_rating_change(obj.track_id, added=obj.score)
+                return
+            old_track_id, old_score = form.initial.get('track'), form.initial.get('score')
+            if obj.track_id != old_track_id:
+                response_cache.invalidate_track(old_track_id)
+                Track.objects.apply_rating_change(old_track_id, removed=old_score)
+                Track.objects.apply_rating_change(obj.track_id, added=obj.score)
+            else:
+                Track.objects.apply_rating_change(obj.track_id, added=obj.score, removed=old_score)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            Track.objects.apply_rating_change(obj.track_id, removed=obj.score)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            track_ids = list(queryset.values_list('track_id', flat=True))
+            queryset.delete()
+            Track.objects.filter(pk__in=track_ids).rebuild_rating_aggregates()
+
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'track')
-    search_fields = ('user__username', 'track__label')
\ No newline at end of file
+    search_fields = ('user__username', 'track__label')
+
+    # Go through the counter-aware writes so Track.favorites_count stays right
+    def save_model(self, request, obj, form, change):
+        if change:
+            super().save_model(request, obj, form, change)
+            Track.objects.filter(pk__in=[obj.track_id, form.initial.get('track')]).rebuild_favorites_count()
+        else:
+            Favorite.objects.add(obj.user, obj.track_id)
+
+    def delete_model(self, request, obj):
+        Favorite.objects.remove(obj.user, obj.track_id)
+
+    def delete_queryset(self, request, queryset):
+        track_ids = list(queryset.values_list('track_id', flat=True))
+        queryset.delete()
+        Track.objects.filter(pk__in=track_ids).rebuild_favorites_count()
\ No newline at end of file
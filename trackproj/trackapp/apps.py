@@ -3,3 +3,9 @@ from django.apps import AppConfig
 class TrackappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trackapp'
+
+    def ready(self):
+        # Registers the image variant post_save listeners
+        import trackapp.signals
+        # and the image variant job tasks, so workers know them
+        import trackapp.tasks
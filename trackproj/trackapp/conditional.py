@@ -0,0 +1,83 @@
+"""
+ETag / Last-Modified validators for API responses, so clients can revalidate
+with If-None-Match / If-Modified-Since and get a 304 instead of the payload.
+
+Validators come from a cheap fingerprint (row count and max(updated_at))
+rather than from the rendered body, so a 304 is answered before anything is
+serialized. That relies on every change that shows up in a response moving
+some updated_at forward: see TouchQuerySet.touch() and the receivers in
+signals.py. A deletion moves no updated_at, only the count, so lists are
+revalidated by ETag alone (If-Modified-Since can't see a row going away).
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def state(count, times, extra=''):
+    """
+    {'count', 'last_modified', 'stamp'}: last_modified is the latest of
+    times as a Unix timestamp (what Last-Modified can express), stamp keeps
+    the full precision plus anything else the ETag should depend on.
+    """
+    times = [t for t in times if t is not None]
+    latest = max(times) if times else None
+    return {
+        'count': count,
+        'last_modified': int(latest.timestamp()) if latest else None,
+        'stamp': (latest.isoformat() if latest else '') + extra,
+    }
+
+
+def fingerprint(queryset, *fields):
+    """
+    state() for a queryset in one aggregate query: its row count and the
+    latest of the given datetime fields (default updated_at). Use only
+    forward relations in fields, so the joins don't multiply rows.
+    """
+    fields = fields or ('updated_at',)
+    aggregates = {f'latest_{i}': Max(field) for i, field in enumerate(fields)}
+    row = queryset.order_by().aggregate(count=Count('pk'), **aggregates)
+    return state(row['count'], [row[name] for name in aggregates])
+
+
+def etag_for(request, state):
+    """
+    Strong ETag for this URL, user and format. The user is part of it because
+    responses carry per-user fields (is_favorite, user_reaction).
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    parts = [
+        request.build_absolute_uri(),
+        str(request.user.pk or ''),
+        getattr(renderer, 'format', ''),
+        str(state['count']),
+        state['stamp'],
+    ]
+    return quote_etag(hashlib.sha256('|'.join(parts).encode()).hexdigest()[:32])
+
+
+def set_validators(response, etag, last_modified):
+    # Error responses don't describe the resource, so they get no validators
+    if response.status_code not in (200, 304):
+        return response
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ['Authorization', 'Cookie'])
+    return response
+
+
+def respond(request, state, build, many=False):
+    """
+    Answers a matching If-None-Match / If-Modified-Since with a 304 without
+    calling build(); otherwise returns build()'s response with validators.
+    For lists (many) only If-None-Match can match.
+    """
+    etag = etag_for(request, state)
+    response = get_conditional_response(request, etag=etag, last_modified=None if many else state['last_modified'])
+    if response is None:
+        response = build()
+    return set_validators(response, etag, state['last_modified'])
@@ -0,0 +1,60 @@
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+
+class TrackFilter(BaseFilterBackend):
+    """
+    ?difficulty=facil,moderado  ?route_type=ida_volta
+    ?distance_min=&distance_max=  (meters)
+    ?duration_min=&duration_max=  (minutes)
+    ?elevation_min=&elevation_max=  (meters)
+    The Track indexes are laid out for these: equality on difficulty and
+    route_type first, then a range on distance.
+    """
+    choice_fields = ('difficulty', 'route_type')
+    range_fields = ('distance', 'duration', 'elevation')
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        for field in self.choice_fields:
+            values = [v for v in params.get(field, '').split(',') if v]
+            if len(values) == 1:
+                queryset = queryset.filter(**{field: values[0]})
+            elif values:
+                queryset = queryset.filter(**{f'{field}__in': values})
+
+        for field in self.range_fields:
+            for suffix, lookup in (('min', 'gte'), ('max', 'lte')):
+                value = params.get(f'{field}_{suffix}')
+                if value in (None, ''):
+                    continue
+                try:
+                    queryset = queryset.filter(**{f'{field}__{lookup}': float(value)})
+                except ValueError:
+                    continue
+        return queryset
+
+
+class TrackOrderingFilter(OrderingFilter):
+    """
+    ?ordering=distance, -created_at, popularity, -rating, ... Ties fall back to
+    id so pages stay stable. `popularity` is an alias for favorites_count and
+    `rating` for the stored rating_average.
+    """
+    ordering_fields = ['distance', 'duration', 'elevation', 'created_at', 'favorites_count', 'rating_average', 'rating_count']
+    aliases = {'popularity': 'favorites_count', 'rating': 'rating_average'}
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if params:
+            fields = []
+            for term in params.split(','):
+                term = term.strip()
+                prefix = '-' if term.startswith('-') else ''
+                fields.append(prefix + self.aliases.get(term.lstrip('-'), term.lstrip('-')))
+            ordering = self.remove_invalid_fields(queryset, fields, view, request)
+            if ordering:
+                return ordering + ['id']
+        return self.get_default_ordering(view)
+
+    def get_valid_fields(self, queryset, view, context={}):
+        return [(field, field) for field in self.ordering_fields]
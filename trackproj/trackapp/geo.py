@@ -0,0 +1,62 @@
+"""
+Grid index for track start points. The world is cut into GRID_SIZE degree
+cells numbered row by row, so the cells covering a box are a handful of
+contiguous integer ranges: an indexed range scan on MySQL and SQLite alike.
+"""
+import math
+
+GRID_SIZE = 0.05  # degrees, roughly 5.5 km north-south
+GRID_COLUMNS = int(round(360 / GRID_SIZE))
+MAX_GRID_RANGES = 50  # beyond this many rows, scan one range and let the bbox refine
+METERS_PER_DEGREE = 111195.0
+
+
+def _row(lat):
+    return int(math.floor((min(max(lat, -90.0), 90.0) + 90.0) / GRID_SIZE))
+
+
+def _column(lon):
+    return int(math.floor((lon + 180.0) / GRID_SIZE)) % GRID_COLUMNS
+
+
+def grid_cell(lat, lon):
+    if lat is None or lon is None:
+        return None
+    return _row(lat) * GRID_COLUMNS + _column(lon)
+
+
+def cell_ranges(min_lat, min_lon, max_lat, max_lon):
+    """
+    Returns [(first_cell, last_cell), ...] covering the box. A box that
+    crosses the antimeridian (min_lon > max_lon) is split in two per row.
+    """
+    first_row, last_row = _row(min_lat), _row(max_lat)
+    first_col, last_col = _column(min_lon), _column(max_lon)
+    if first_col <= last_col:
+        spans = [(first_col, last_col)]
+    else:
+        spans = [(first_col, GRID_COLUMNS - 1), (0, last_col)]
+
+    if (last_row - first_row + 1) * len(spans) > MAX_GRID_RANGES:
+        return [(first_row * GRID_COLUMNS, last_row * GRID_COLUMNS + GRID_COLUMNS - 1)]
+    return [
+        (row * GRID_COLUMNS + low, row * GRID_COLUMNS + high)
+        for row in range(first_row, last_row + 1)
+        for low, high in spans
+    ]
+
+
+def bbox_around(lat, lon, radius):
+    """
+    Smallest lat/lon box containing the circle of `radius` meters around a point.
+    """
+    dlat = radius / METERS_PER_DEGREE
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-6 else min(radius / (METERS_PER_DEGREE * cos_lat), 180.0)
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if dlon >= 180.0:
+        min_lon, max_lon = -180.0, 180.0
+    else:
+        min_lon = (min_lon + 180.0) % 360.0 - 180.0
+        max_lon = (max_lon + 180.0) % 360.0 - 180.0
+    return max(lat - dlat, -90.0), min_lon, min(lat + dlat, 90.0), max_lon
@@ -0,0 +1,228 @@
+"""
+GPX ingestion: streams the track points out of an uploaded file and derives
+the statistics stored on Track, so nothing on the read path opens the file.
+"""
+from array import array
+from datetime import datetime
+import xml.etree.ElementTree as ET
+import zipfile
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # meters (mean radius)
+ELEVATION_SMOOTHING = 5   # points in the moving average applied before summing gain
+POINT_TAGS = {'trkpt', 'rtept'}
+
+
+class GPXError(ValueError):
+    pass
+
+
+def _local(tag):
+    # '{http://www.topografix.com/GPX/1/1}trkpt' -> 'trkpt'
+    return tag.rsplit('}', 1)[-1]
+
+
+def _parse_time(text):
+    try:
+        return datetime.fromisoformat(text.strip().replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return float('nan')
+
+
+def read_points(fileobj):
+    """
+    Reads (lat, lon, ele, time) arrays from a GPX file object with iterparse.
+    Each point element is cleared as soon as it's read, so memory stays flat
+    regardless of how long the recording is. Missing ele/time become NaN.
+    """
+    lats, lons, eles, times = array('d'), array('d'), array('d'), array('d')
+    parents = []
+    try:
+        for event, elem in ET.iterparse(fileobj, events=('start', 'end')):
+            if event == 'start':
+                parents.append(elem)
+                continue
+            parents.pop()
+            if _local(elem.tag) not in POINT_TAGS:
+                continue
+            ele = time = float('nan')
+            for child in elem:
+                name = _local(child.tag)
+                if name == 'ele' and child.text:
+                    ele = float(child.text)
+                elif name == 'time' and child.text:
+                    time = _parse_time(child.text)
+            lats.append(float(elem.attrib['lat']))
+            lons.append(float(elem.attrib['lon']))
+            eles.append(ele)
+            times.append(time)
+            # Detach the point from its segment so the tree never grows
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
+    except (ET.ParseError, KeyError, ValueError) as e:
+        raise GPXError(f"Invalid GPX file: {e}") from e
+
+    return np.array(lats), np.array(lons), np.array(eles), np.array(times)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in meters; takes degrees, works on arrays.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def elevation_gain(ele, window=ELEVATION_SMOOTHING):
+    """
+    Total ascent and descent in meters after a moving-average pass, which
+    keeps GPS altitude jitter from adding up to hundreds of phantom meters.
+    """
+    ele = ele[~np.isnan(ele)]
+    if ele.size < 2:
+        return 0.0, 0.0
+    window = min(window, ele.size)
+    smoothed = np.convolve(ele, np.ones(window) / window, mode='valid')
+    steps = np.diff(smoothed)
+    return float(steps[steps > 0].sum()), float(-steps[steps < 0].sum())
+
+
+def compute_statistics(lat, lon, ele, times):
+    """
+    Returns a dict keyed by Track field name.
+    """
+    if lat.size == 0:
+        raise GPXError("GPX file has no track points.")
+
+    stats = {
+        'point_count': int(lat.size),
+        'start_latitude': float(lat[0]),
+        'start_longitude': float(lon[0]),
+        'distance': float(haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum()),
+        'min_latitude': float(lat.min()),
+        'max_latitude': float(lat.max()),
+        'min_longitude': float(lon.min()),
+        'max_longitude': float(lon.max()),
+        'ascent': None,
+        'descent': None,
+        'min_altitude': None,
+        'max_altitude': None,
+        'duration': None,
+    }
+
+    if not np.isnan(ele).all():
+        stats['ascent'], stats['descent'] = elevation_gain(ele)
+        stats['min_altitude'] = float(np.nanmin(ele))
+        stats['max_altitude'] = float(np.nanmax(ele))
+
+    times = times[~np.isnan(times)]
+    if times.size >= 2:
+        stats['duration'] = int(round((times.max() - times.min()) / 60))
+
+    return stats
+
+
+# Map previews: (highest map zoom served, Douglas-Peucker tolerance in meters).
+# Zooms above the last entry get the finest level.
+SIMPLIFY_LEVELS = (
+    (10, 60.0),
+    (13, 15.0),
+    (16, 4.0),
+)
+
+
+def _project(lat, lon):
+    # Local equirectangular projection in meters; plenty for a single trail
+    lat0 = np.radians(lat.mean())
+    return (
+        EARTH_RADIUS * np.radians(lon) * np.cos(lat0),
+        EARTH_RADIUS * np.radians(lat),
+    )
+
+
+def _segment_distance(px, py, x1, y1, x2, y2):
+    # Distance from each point to the segment (x1, y1)-(x2, y2). Uses the
+    # segment rather than the infinite line so loops (start == end) still work.
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return np.hypot(px - x1, py - y1)
+    t = np.clip(((px - x1) * dx + (py - y1) * dy) / length2, 0, 1)
+    return np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+def simplify(lat, lon, tolerance):
+    """
+    Douglas-Peucker: returns a boolean mask of the points to keep. Each split
+    measures the whole span in one vectorized pass; the recursion is an
+    explicit stack so long recordings don't hit Python's recursion limit.
+    """
+    n = lat.size
+    keep = np.ones(n, dtype=bool)
+    if n < 3:
+        return keep
+    x, y = _project(lat, lon)
+    keep[1:-1] = False
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dist = _segment_distance(x[start + 1:end], y[start + 1:end], x[start], y[start], x[end], y[end])
+        i = int(dist.argmax())
+        if dist[i] > tolerance:
+            i += start + 1
+            keep[i] = True
+            stack.append((start, i))
+            stack.append((i, end))
+    return keep
+
+
+def encode_polyline(lat, lon, precision=5):
+    """
+    Google's encoded polyline format, which every web/mobile map SDK decodes.
+    """
+    coords = np.round(np.column_stack((lat, lon)) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chunks = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def simplified_polylines(lat, lon):
+    """
+    Returns [(max_zoom, tolerance, point_count, polyline), ...] for SIMPLIFY_LEVELS.
+    """
+    levels = []
+    for max_zoom, tolerance in SIMPLIFY_LEVELS:
+        keep = simplify(lat, lon, tolerance)
+        levels.append((max_zoom, tolerance, int(keep.sum()), encode_polyline(lat[keep], lon[keep])))
+    return levels
+
+
+def analyze(fileobj):
+    """
+    Everything Track stores from one GPX file: (statistics, polylines).
+    """
+    lat, lon, ele, times = read_points(fileobj)
+    return compute_statistics(lat, lon, ele, times), simplified_polylines(lat, lon)
+
+
+def analyze_file(path, member=None):
+    """
+    analyze() for a file on disk, or for a member of the zip archive at path.
+    Doesn't touch Django, so it can run in a plain worker process.
+    """
+    if member is None:
+        with open(path, 'rb') as f:
+            return analyze(f)
+    with zipfile.ZipFile(path) as archive, archive.open(member) as f:
+        return analyze(f)
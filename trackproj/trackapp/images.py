@@ -0,0 +1,156 @@
+"""
+Resized WebP variants of uploaded pictures, so feed cards and avatars don't
+download the original phone photo. Rendering is an 'images.variants' job
+(chatbot/jobs.py, run by `manage.py run_jobs`), queued with the upload, so
+it survives restarts and deploys; until it's done, clients get the original.
+`manage.py build_image_variants` queues it for images that have none.
+
+Variant files are named by content hash and shared by identical renders;
+the ones a row stops using (new image, image cleared, row deleted) are
+deleted by an 'images.cleanup' job once no row refers to them.
+"""
+import hashlib
+import io
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from chatbot import jobs
+
+# Sent with (sender=model, pk, image_field) once a row's variants are recorded
+variants_built = Signal()
+
+# Longest side in pixels for each variant
+VARIANT_SIZES = {
+    'thumb': 128,
+    'medium': 640,
+    'full': 1600,
+}
+WEBP_QUALITY = 80
+VARIANTS_DIR = 'variants'
+
+# Every image field that gets variants, by model label
+IMAGE_FIELDS = {
+    'trackapp.track': 'image',
+    'trackapp.trackimage': 'image',
+    'trackapp.profile': 'picture',
+    'trackapp.communitypost': 'image',
+}
+
+
+def variants_field(image_field):
+    # Track.image -> Track.image_variants, Profile.picture -> Profile.picture_variants
+    return f'{image_field}_variants'
+
+
+def render_variants(fileobj):
+    """
+    Returns {variant: (filename, webp_bytes)}. Orientation from EXIF is
+    applied to the pixels and the metadata itself is dropped. File names are
+    content hashes, so identical output is stored once and can be cached forever.
+    """
+    with Image.open(fileobj) as original:
+        original = ImageOps.exif_transpose(original)
+        mode = 'RGBA' if original.mode in ('RGBA', 'LA', 'P') else 'RGB'
+        original = original.convert(mode)
+
+        rendered = {}
+        for name, size in VARIANT_SIZES.items():
+            image = original.copy()
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            # No exif= argument, so nothing but the pixels is written
+            image.save(buffer, format='WEBP', quality=WEBP_QUALITY, method=4)
+            data = buffer.getvalue()
+            digest = hashlib.sha256(data).hexdigest()[:20]
+            rendered[name] = (f'{VARIANTS_DIR}/{digest}.webp', data)
+    return rendered
+
+
+def variant_files(variants):
+    return [filename for name, filename in (variants or {}).items() if name != 'source']
+
+
+def build_variants(model, pk, image_field):
+    """
+    Job entry point: renders and stores the variants for one image and
+    records them on the row, unless the image was replaced in the meantime.
+    Errors propagate, so the queue retries.
+    """
+    instance = model.objects.filter(pk=pk).first()
+    image = getattr(instance, image_field, None)
+    if not image:
+        return
+    source = image.name
+    with image.open('rb'):
+        rendered = render_variants(image)
+
+    variants = {'source': source}
+    for name, (filename, data) in rendered.items():
+        if not default_storage.exists(filename):
+            default_storage.save(filename, ContentFile(data))
+        variants[name] = filename
+
+    # update() rather than save(): no signals, and only if still the same file
+    updated = model.objects.filter(pk=pk, **{image_field: source}).update(**{variants_field(image_field): variants})
+    if updated:
+        variants_built.send(sender=model, pk=pk, image_field=image_field)
+        delete_unused(set(variant_files(getattr(instance, variants_field(image_field)))) - set(variants.values()))
+
+
+def in_use(filename):
+    """
+    Whether any row's variants refer to the file.
+    """
+    for label, image_field in IMAGE_FIELDS.items():
+        field = variants_field(image_field)
+        rows = apps.get_model(label).objects.annotate(variants_text=Cast(field, TextField()))
+        if rows.filter(variants_text__contains=filename).exists():
+            return True
+    return False
+
+
+def delete_unused(filenames):
+    for filename in filenames:
+        if not in_use(filename):
+            default_storage.delete(filename)
+
+
+def schedule_cleanup(variants):
+    """
+    Queues the deletion of a row's old variant files (those no other row uses).
+    """
+    files = variant_files(variants)
+    if files:
+        jobs.enqueue('images.cleanup', {'files': files})
+
+
+def schedule_variants(instance, image_field):
+    """
+    Called from post_save. Queues rendering, in the same transaction, if the
+    image changed since the variants were last built. Returns whether it did.
+    """
+    image = getattr(instance, image_field)
+    field = variants_field(image_field)
+    variants = getattr(instance, field) or {}
+
+    if not image:
+        if variants:
+            type(instance).objects.filter(pk=instance.pk).update(**{field: {}})
+            schedule_cleanup(variants)
+        return False
+    if variants.get('source') == image.name:
+        return False
+
+    label = instance._meta.label_lower
+    jobs.enqueue(
+        'images.variants',
+        {'model': label, 'pk': instance.pk, 'image_field': image_field},
+        key=f"images:{label}:{instance.pk}",
+    )
+    return True
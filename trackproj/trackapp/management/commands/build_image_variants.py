@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from trackapp import images
+
+
+class Command(BaseCommand):
+    help = (
+        "Queues the resized WebP variants (trackapp/images.py) of every image that has none, "
+        "or whose variants are of an older image. The run_jobs workers render them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Queue every image, even those already built")
+
+    def handle(self, *args, **options):
+        queued = 0
+        for label, image_field in images.IMAGE_FIELDS.items():
+            field = images.variants_field(image_field)
+            rows = apps.get_model(label).objects.exclude(**{image_field: ''}).only('pk', image_field, field)
+            for instance in rows.iterator():
+                if options['all']:
+                    # Forget the built ones, so they count as out of date
+                    setattr(instance, field, {})
+                queued += images.schedule_variants(instance, image_field)
+        self.stdout.write(self.style.SUCCESS(f"Queued variants for {queued} images."))
@@ -0,0 +1,153 @@
+import os
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from trackapp import gpx, response_cache, search
+from trackapp.models import Track, TrackGeometry
+
+PARSE_ERRORS = (gpx.GPXError, OSError, zipfile.BadZipFile)
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports every .gpx file in a directory (recursively) or .zip archive as a Track. "
+        "Files are parsed in a process pool and the rows are written in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Directory or .zip archive of GPX files")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Parser processes (default: one per CPU; 1 parses in this process)")
+        parser.add_argument('--batch-size', type=int, default=200, help="Tracks per bulk insert")
+        parser.add_argument('--difficulty', choices=[c for c, _ in Track.DIFFICULTY_CHOICES], default=Track.DIFFICULTY_MODERATE)
+        parser.add_argument('--route-type', choices=[c for c, _ in Track.ROUTE_TYPE_CHOICES], default=Track.ROUTE_TYPE_ROUND_TRIP)
+        parser.add_argument('--skip-vectors', action='store_true', help="Don't queue the imported tracks' vector sync")
+
+    def handle(self, *args, **options):
+        source = options['source']
+        jobs = self.find_files(source)
+        if not jobs:
+            raise CommandError(f"No .gpx files found in {source}")
+        self.options = options
+        self.stdout.write(f"Importing {len(jobs)} GPX files with {options['workers']} worker(s)...")
+
+        started = time.monotonic()
+        imported, failed, points = [], 0, 0
+        batch = []
+        for job, result in self.analyzed(jobs, options['workers']):
+            name = job[1] or os.path.relpath(job[0], source)
+            if isinstance(result, Exception):
+                failed += 1
+                self.stderr.write(f"Skipped {name}: {result}")
+                continue
+            batch.append((job, name, result))
+            points += result[0]['point_count']
+            if len(batch) >= options['batch_size']:
+                imported += self.write_batch(batch)
+                batch = []
+        if batch:
+            imported += self.write_batch(batch)
+
+        # bulk_create() sends no post_save, so nothing was invalidated or
+        # scheduled per row; do both once for the whole import
+        response_cache.invalidate_track(None)
+        elapsed = max(time.monotonic() - started, 0.001)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(imported)} tracks ({failed} skipped, {points} points) in {elapsed:.1f}s: "
+            f"{len(imported) / elapsed:.1f} files/s, {points / elapsed:.0f} points/s."
+        ))
+
+        if imported and not options['skip_vectors']:
+            # Embedding thousands of tracks is the worker's job (run_jobs), not the import's
+            from chatbot.jobs import enqueue
+            enqueue('vectors.sync', {'model': Track._meta.label_lower, 'pks': [t.pk for t in imported]})
+            self.stdout.write(f"Queued the vector sync of {len(imported)} tracks.")
+
+    def find_files(self, source):
+        # [(path, zip member or None)], sorted so imports are repeatable
+        if zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                members = [n for n in archive.namelist() if n.lower().endswith('.gpx')]
+            return [(source, member) for member in sorted(members)]
+        if not os.path.isdir(source):
+            raise CommandError(f"{source} is neither a directory nor a zip archive")
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, f) for f in files if f.lower().endswith('.gpx'))
+        return [(path, None) for path in sorted(paths)]
+
+    def analyzed(self, jobs, workers):
+        """
+        Yields (job, (stats, polylines) or the parse error) in job order, so
+        batches are written while the pool is still parsing later files.
+        """
+        if workers <= 1:
+            for job in jobs:
+                try:
+                    yield job, gpx.analyze_file(*job)
+                except PARSE_ERRORS as e:
+                    yield job, e
+            return
+        # gpx.analyze_file doesn't need Django, so the workers don't set it up
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(gpx.analyze_file, *job) for job in jobs]
+            for job, future in zip(jobs, futures):
+                try:
+                    yield job, future.result()
+                except PARSE_ERRORS as e:
+                    yield job, e
+
+    def read(self, job):
+        path, member = job
+        if member is None:
+            with open(path, 'rb') as f:
+                return f.read()
+        with zipfile.ZipFile(path) as archive:
+            return archive.read(member)
+
+    def write_batch(self, batch):
+        tracks, geometries, stored = [], {}, []
+        try:
+            for job, name, (stats, polylines) in batch:
+                filename = os.path.basename(name)
+                stored.append(default_storage.save(f'tracks/{filename}', ContentFile(self.read(job))))
+                track = Track(
+                    label=os.path.splitext(filename)[0][:100],
+                    url=stored[-1],
+                    difficulty=self.options['difficulty'],
+                    route_type=self.options['route_type'],
+                    # Also how the rows are found again: MySQL doesn't return ids from bulk_create
+                    qdrant_id=uuid.uuid4(),
+                )
+                track.apply_gpx_statistics(stats)
+                tracks.append(track)
+                geometries[track.qdrant_id] = polylines
+
+            with transaction.atomic():
+                Track.objects.bulk_create(tracks, batch_size=self.options['batch_size'])
+                ids = dict(Track.objects.filter(qdrant_id__in=geometries).values_list('qdrant_id', 'pk'))
+                for track in tracks:
+                    track.pk = ids[track.qdrant_id]
+                    track._state.adding = False
+                TrackGeometry.objects.bulk_create([
+                    TrackGeometry(track=track, max_zoom=max_zoom, tolerance=tolerance, point_count=count, polyline=polyline)
+                    for track in tracks
+                    for max_zoom, tolerance, count, polyline in geometries[track.qdrant_id]
+                ])
+                for track in tracks:
+                    search.index_object(track)
+        except BaseException:
+            # Rolled back (or never written): no row points at the copied files
+            for name in stored:
+                default_storage.delete(name)
+            raise
+        self.stdout.write(f"  wrote {len(tracks)} tracks")
+        return tracks
+
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from trackapp.models import Track
+from trackapp import response_cache
+
+
+class Command(BaseCommand):
+    help = "Recomputes the favorites_count stored on each Track from the Favorite table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('track_ids', nargs='*', type=int, help="Only these tracks (default: all)")
+
+    def handle(self, *args, **options):
+        queryset = Track.objects.all()
+        if options['track_ids']:
+            queryset = queryset.filter(pk__in=options['track_ids'])
+        # select_for_update keeps favorites written meanwhile from being overwritten
+        with transaction.atomic():
+            count = queryset.select_for_update().rebuild_favorites_count()
+            # update() skips the signals that normally invalidate cached
+            # responses; one bump covers every track instead of one per row
+            response_cache.invalidate_track(None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt favorites_count for {count} tracks."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from trackapp.models import SearchDocument
+from trackapp import search
+
+
+class Command(BaseCommand):
+    help = "Re-indexes every track, knowledge base entry and community post for /api/search/."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-empty', action='store_true', help="Only build the index if it has no documents yet")
+
+    def handle(self, *args, **options):
+        if options['if_empty'] and SearchDocument.objects.exists():
+            self.stdout.write("Search index already built, skipping.")
+            return
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} objects."))
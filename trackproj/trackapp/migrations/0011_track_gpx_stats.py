@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trackapp', '0010_communitypost_post_created_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='ascent',
+            field=models.FloatField(blank=True, editable=False, help_text='Total ascent in meters', null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='descent',
+            field=models.FloatField(blank=True, editable=False, help_text='Total descent in meters', null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='max_altitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='max_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='max_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='min_altitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='min_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='min_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='point_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
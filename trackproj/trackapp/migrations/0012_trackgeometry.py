@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trackapp', '0011_track_gpx_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackGeometry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_zoom', models.PositiveSmallIntegerField(help_text='Highest map zoom this level is meant for')),
+                ('tolerance', models.FloatField(help_text='Simplification tolerance in meters')),
+                ('point_count', models.PositiveIntegerField()),
+                ('polyline', models.TextField(help_text='Encoded polyline (precision 5)')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geometries', to='trackapp.track')),
+            ],
+            options={
+                'ordering': ['max_zoom'],
+                'unique_together': {('track', 'max_zoom')},
+            },
+        ),
+    ]
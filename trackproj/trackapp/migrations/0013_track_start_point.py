@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trackapp', '0012_trackgeometry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='grid_cell',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, help_text='See geo.py', null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='start_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='start_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
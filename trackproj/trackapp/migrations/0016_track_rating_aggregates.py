@@ -0,0 +1,73 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:21
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    Track = apps.get_model('trackapp', 'Track')
+    Rating = apps.get_model('trackapp', 'Rating')
+    tracks = {}
+    for row in Rating.objects.order_by().values('track', 'score').annotate(count=Count('id'), total=Sum('score')):
+        fields = tracks.setdefault(row['track'], {'rating_count': 0, 'rating_sum': 0})
+        fields['rating_count'] += row['count']
+        fields['rating_sum'] += row['total']
+        fields[f"rating_count_{row['score']}"] = row['count']
+    for track_id, fields in tracks.items():
+        fields['rating_average'] = fields['rating_sum'] / fields['rating_count']
+        Track.objects.filter(pk=track_id).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trackapp', '0015_track_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='rating_average',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='rating_count_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='rating_count_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='rating_count_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='rating_count_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='rating_count_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['rating_average'], name='track_rating_idx'),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
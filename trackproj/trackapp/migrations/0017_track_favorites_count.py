@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_favorites_count(apps, schema_editor):
+    Track = apps.get_model('trackapp', 'Track')
+    Favorite = apps.get_model('trackapp', 'Favorite')
+    for row in Favorite.objects.order_by().values('track').annotate(count=Count('id')):
+        Track.objects.filter(pk=row['track']).update(favorites_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trackapp', '0016_track_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['favorites_count'], name='track_popularity_idx'),
+        ),
+        migrations.RunPython(populate_favorites_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trackapp', '0019_profile_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='gpx_values',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
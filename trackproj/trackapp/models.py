@@ -1,7 +1,114 @@
 import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Prefetch, Q, Value, When, BooleanField, FloatField
+from django.db.models.functions import Greatest
 from django.core.validators import FileExtensionValidator, MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
+from django.utils import timezone
+from . import geo, gpx
+
+class TouchQuerySet(models.QuerySet):
+    def touch(self):
+        # Moves updated_at forward for changes that don't go through save()
+        # (counters, children, variants), so ETags/Last-Modified follow them
+        return self.update(updated_at=timezone.now())
+
+class TrackQuerySet(TouchQuerySet):
+    def with_favorites(self, user=None):
+        """
+        Annotates is_favorite (for the given user) and prefetches the gallery,
+        so serializing a page doesn't query per row. favorites_count is a
+        stored counter (see FavoriteQuerySet).
+        """
+        queryset = self
+        if user is not None and user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorite=Exists(Favorite.objects.filter(user=user, track=OuterRef('pk')))
+            )
+        else:
+            queryset = queryset.annotate(is_favorite=Value(False, output_field=BooleanField()))
+        return queryset.prefetch_related('images')
+
+    def apply_rating_change(self, track_id, added=None, removed=None):
+        """
+        Adjusts the stored rating aggregates for one rating being created
+        (added=score), deleted (removed=score) or edited (both). Uses F()
+        expressions so concurrent ratings can't lose updates; call it inside
+        the transaction that writes the Rating row.
+        """
+        if added == removed:
+            return  # an edit that kept the score changes none of them
+        updates = {'updated_at': timezone.now()}
+        count_delta = int(added is not None) - int(removed is not None)
+        if count_delta:
+            updates['rating_count'] = F('rating_count') + count_delta
+        updates['rating_sum'] = F('rating_sum') + (added or 0) - (removed or 0)
+        if added is not None:
+            updates[f'rating_count_{added}'] = F(f'rating_count_{added}') + 1
+        if removed is not None:
+            updates[f'rating_count_{removed}'] = F(f'rating_count_{removed}') - 1
+        self.filter(pk=track_id).update(**updates)
+        # Separate statement: MySQL would otherwise see the new sum with the old count
+        self.filter(pk=track_id).update(rating_average=Track.rating_average_expression())
+
+    def rebuild_rating_aggregates(self):
+        """
+        Recomputes the rating aggregates of every track in this queryset from
+        the Rating table, with one grouped query. Returns the number of tracks.
+        """
+        track_ids = list(self.values_list('pk', flat=True))
+        blank = {field: 0 for field in Track.COUNTER_FIELDS}
+        blank['rating_average'] = None
+        aggregates = {track_id: dict(blank) for track_id in track_ids}
+
+        rows = (
+            Rating.objects.filter(track__in=track_ids)
+            .order_by().values('track', 'score').annotate(count=Count('pk'))
+        )
+        for row in rows:
+            fields = aggregates[row['track']]
+            fields['rating_count'] += row['count']
+            fields['rating_sum'] += row['score'] * row['count']
+            fields[f"rating_count_{row['score']}"] = row['count']
+
+        now = timezone.now()
+        tracks = []
+        for track_id, fields in aggregates.items():
+            if fields['rating_count']:
+                fields['rating_average'] = fields['rating_sum'] / fields['rating_count']
+            tracks.append(Track(pk=track_id, updated_at=now, **fields))
+        Track.objects.bulk_update(tracks, Track.COUNTER_FIELDS + ('updated_at',), batch_size=500)
+        return len(tracks)
+
+    def rebuild_favorites_count(self):
+        """
+        Recomputes favorites_count for the tracks in this queryset from the
+        Favorite table. Returns the number of tracks.
+        """
+        track_ids = list(self.values_list('pk', flat=True))
+        counts = dict(
+            Favorite.objects.filter(track__in=track_ids).order_by()
+            .values('track').annotate(count=Count('pk')).values_list('track', 'count')
+        )
+        now = timezone.now()
+        tracks = [Track(pk=pk, favorites_count=counts.get(pk, 0), updated_at=now) for pk in track_ids]
+        Track.objects.bulk_update(tracks, ['favorites_count', 'updated_at'], batch_size=500)
+        return len(tracks)
+
+    def starting_in(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Tracks whose start point lies in the box: a range scan on grid_cell
+        narrows the candidates, then the exact coordinates refine them.
+        """
+        cells = Q()
+        for low, high in geo.cell_ranges(min_lat, min_lon, max_lat, max_lon):
+            cells |= Q(grid_cell__range=(low, high))
+        exact = Q(start_latitude__range=(min_lat, max_lat))
+        if min_lon <= max_lon:
+            exact &= Q(start_longitude__range=(min_lon, max_lon))
+        else:
+            exact &= Q(start_longitude__gte=min_lon) | Q(start_longitude__lte=max_lon)
+        return self.filter(cells).filter(exact)
 
 class Track(models.Model):
     # DIFFICULTY
@@ -33,21 +140,175 @@ class Track(models.Model):
     route_type = models.CharField(max_length=10, choices=ROUTE_TYPE_CHOICES, default=ROUTE_TYPE_ROUND_TRIP)
     elevation = models.FloatField(blank=True, null=True, help_text="Elevation should be in meters")
     image = models.ImageField(upload_to='tracks/images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Derived from the GPX file when it's uploaded (see gpx.py), never typed in
+    ascent = models.FloatField(blank=True, null=True, editable=False, help_text="Total ascent in meters")
+    descent = models.FloatField(blank=True, null=True, editable=False, help_text="Total descent in meters")
+    min_altitude = models.FloatField(blank=True, null=True, editable=False)
+    max_altitude = models.FloatField(blank=True, null=True, editable=False)
+    min_latitude = models.FloatField(blank=True, null=True, editable=False)
+    max_latitude = models.FloatField(blank=True, null=True, editable=False)
+    min_longitude = models.FloatField(blank=True, null=True, editable=False)
+    max_longitude = models.FloatField(blank=True, null=True, editable=False)
+    point_count = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    start_latitude = models.FloatField(blank=True, null=True, editable=False)
+    start_longitude = models.FloatField(blank=True, null=True, editable=False)
+    grid_cell = models.BigIntegerField(blank=True, null=True, editable=False, db_index=True, help_text="See geo.py")
+    # The MANUAL_GPX_FIELDS values the last GPX gave, to tell them from typed-in ones
+    gpx_values = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Kept in step by FavoriteQuerySet.add/remove/toggle
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Rating aggregates, kept in step by RatingViewSet (see apply_rating_change)
+    # and rebuilt by `manage.py rebuild_rating_aggregates`
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(blank=True, null=True, editable=False)
+    rating_count_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_5 = models.PositiveIntegerField(default=0, editable=False)
 
     qdrant_id = models.UUIDField(null=True, blank=True, unique=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TrackQuerySet.as_manager()
+
+    class Meta:
+        # Shaped for TrackFilter/TrackOrderingFilter (filters.py): equality on
+        # difficulty/route_type, then a range or sort on distance; single-column
+        # indexes for sorting the whole catalog.
+        indexes = [
+            models.Index(fields=['difficulty', 'route_type', 'distance'], name='track_diff_route_dist_idx'),
+            models.Index(fields=['route_type', 'distance'], name='track_route_dist_idx'),
+            models.Index(fields=['distance'], name='track_distance_idx'),
+            models.Index(fields=['duration'], name='track_duration_idx'),
+            models.Index(fields=['elevation'], name='track_elevation_idx'),
+            models.Index(fields=['created_at'], name='track_created_idx'),
+            models.Index(fields=['rating_average'], name='track_rating_idx'),
+            models.Index(fields=['favorites_count'], name='track_popularity_idx'),
+        ]
+
+    RATING_SCORES = range(1, 6)
+    # Only ever changed with F() updates. A full save() from an instance loaded
+    # before the last update must not write its stale copies back.
+    COUNTER_FIELDS = (
+        'favorites_count', 'rating_count', 'rating_sum', 'rating_average',
+        'rating_count_1', 'rating_count_2', 'rating_count_3', 'rating_count_4', 'rating_count_5',
+    )
+
+    # They used to be typed in: a new GPX only replaces them if they're blank
+    # or still what the previous GPX gave (gpx_values)
+    MANUAL_GPX_FIELDS = ('distance', 'duration', 'elevation')
+
     def __str__(self):
         return f"{self.label} ({self.url})"
 
+    def save(self, *args, **kwargs):
+        # A new upload hasn't been written to storage yet; read it now so the
+        # statistics land in the same save as the file. The map geometries
+        # need the pk, so they're written right after.
+        geometries = None
+        if self.url and not self.url._committed:
+            geometries = self.ingest_gpx()
+        self.grid_cell = geo.grid_cell(self.start_latitude, self.start_longitude)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        if geometries is not None:
+            TrackGeometry.replace_for(self, geometries)
+
+    @property
+    def rating_histogram(self):
+        return {score: getattr(self, f'rating_count_{score}') for score in self.RATING_SCORES}
+
+    @staticmethod
+    def rating_average_expression():
+        return Case(
+            When(rating_count=0, then=Value(None)),
+            default=F('rating_sum') * 1.0 / F('rating_count'),
+            output_field=FloatField(),
+        )
+
+    def ingest_gpx(self):
+        """
+        Parses the GPX file, copies the derived statistics onto the instance
+        (without saving) and returns its simplified polylines (see
+        gpx.simplified_polylines). Returns None if the file couldn't be parsed.
+        """
+        committed = self.url._committed
+        try:
+            self.url.open('rb')
+            stats, polylines = gpx.analyze(self.url)
+        except (gpx.GPXError, OSError) as e:
+            print(f"Error reading GPX for '{self.label}': {e}")
+            return None
+        finally:
+            if committed:
+                self.url.close()
+            else:
+                self.url.seek(0)
+        self.apply_gpx_statistics(stats)
+        return polylines
+
+    def apply_gpx_statistics(self, stats):
+        # stats as returned by gpx.compute_statistics
+        if stats['ascent'] is not None:
+            stats = dict(stats, elevation=stats['ascent'])
+        derived = {}
+        for field, value in stats.items():
+            if field in self.MANUAL_GPX_FIELDS:
+                current = getattr(self, field)
+                if current is not None and current != self.gpx_values.get(field):
+                    continue  # typed in
+                derived[field] = value
+            setattr(self, field, value)
+        self.gpx_values = derived
+        # save() does this too, but bulk_create() (import_tracks) skips save()
+        self.grid_cell = geo.grid_cell(self.start_latitude, self.start_longitude)
+
+class TrackGeometry(models.Model):
+    """
+    Simplified outline of a track's GPX for map previews, one row per zoom
+    band. Only rewritten when a new GPX file is uploaded.
+    """
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='geometries')
+    max_zoom = models.PositiveSmallIntegerField(help_text="Highest map zoom this level is meant for")
+    tolerance = models.FloatField(help_text="Simplification tolerance in meters")
+    point_count = models.PositiveIntegerField()
+    polyline = models.TextField(help_text="Encoded polyline (precision 5)")
+
+    class Meta:
+        unique_together = ('track', 'max_zoom')
+        ordering = ['max_zoom']
+
+    def __str__(self):
+        return f"{self.track.label} (zoom <= {self.max_zoom})"
+
+    @classmethod
+    def replace_for(cls, track, geometries):
+        cls.objects.filter(track=track).delete()
+        cls.objects.bulk_create([
+            cls(track=track, max_zoom=max_zoom, tolerance=tolerance, point_count=count, polyline=polyline)
+            for max_zoom, tolerance, count, polyline in geometries
+        ])
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=20, blank=True, null=True)
     cpf = models.CharField(max_length=14, blank=True, null=True)
     picture = models.ImageField(upload_to='profile/', blank=True, null=True)
+    picture_variants = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name or self.user.username
@@ -62,14 +323,76 @@ class Rating(models.Model):
     class Meta:
         unique_together = ('user', 'track')
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['-date', '-id'], name='rating_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.track.label} ({self.score})"
 
+class FavoriteQuerySet(models.QuerySet):
+    """
+    Favorite writes that keep Track.favorites_count in step: the insert or
+    delete (the unique constraint settles concurrent taps, no row lock),
+    then an F() update of the counter and a read of the new value.
+    All return (favorited, favorites_count); Track.DoesNotExist if there's no
+    such track.
+    """
+    def _insert(self, user, track_id):
+        # Whether the row is new; in a savepoint, so a duplicate doesn't
+        # break the surrounding transaction
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(user=user, track_id=track_id)
+            return True
+        except IntegrityError:
+            return False
+
+    def _delete(self, user, track_id):
+        deleted, _ = self.filter(user=user, track_id=track_id).delete()
+        return bool(deleted)
+
+    def _count(self, track_id, delta=0):
+        """
+        Adds delta to the track's favorites_count and returns the new count,
+        which never goes below 0 even if the counter had drifted.
+        """
+        tracks = Track.objects.using(self.db).filter(pk=track_id)
+        if delta:
+            # GREATEST(count, 1) - 1 rather than GREATEST(count - 1, 0): on
+            # MySQL's unsigned column 0 - 1 is an error, not -1
+            value = F('favorites_count') + delta if delta > 0 else Greatest(F('favorites_count'), -delta) + delta
+            if not tracks.update(favorites_count=value, updated_at=timezone.now()):
+                raise Track.DoesNotExist
+        count = tracks.values_list('favorites_count', flat=True).first()
+        if count is None:
+            raise Track.DoesNotExist
+        return count
+
+    @transaction.atomic
+    def add(self, user, track_id):
+        if not self._insert(user, track_id):
+            return True, self._count(track_id)
+        return True, self._count(track_id, 1)
+
+    @transaction.atomic
+    def remove(self, user, track_id):
+        if not self._delete(user, track_id):
+            return False, self._count(track_id)
+        return False, self._count(track_id, -1)
+
+    @transaction.atomic
+    def toggle(self, user, track_id):
+        if self._delete(user, track_id):
+            return False, self._count(track_id, -1)
+        return self.add(user, track_id)
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     track = models.ForeignKey(Track, on_delete=models.CASCADE)
 
+    objects = FavoriteQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'track')
     
@@ -79,21 +402,45 @@ class Favorite(models.Model):
 class TrackImage(models.Model):
     track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='tracks/gallery/')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Image for {self.track.label}"
 
+class CommunityPostQuerySet(TouchQuerySet):
+    def for_feed(self, user=None):
+        """
+        Loads authors, comments (with commenters), the mentioned track and the
+        user's own reaction in a fixed number of batched queries.
+        """
+        queryset = self.select_related('user__profile').prefetch_related(
+            Prefetch('comments', queryset=PostComment.objects.select_related('user__profile')),
+            Prefetch('track', queryset=Track.objects.with_favorites(user)),
+        )
+        if user is not None and user.is_authenticated:
+            queryset = queryset.prefetch_related(
+                Prefetch('reactions', queryset=PostReaction.objects.filter(user=user), to_attr='own_reactions')
+            )
+        return queryset
+
 class CommunityPost(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     content = models.TextField()
     image = models.ImageField(upload_to='community/posts/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     track = models.ForeignKey(Track, on_delete=models.SET_NULL, null=True, blank=True, related_name='mentioned_in_posts')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommunityPostQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the feed (see pagination.py)
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"Post by {self.user.username} at {self.created_at}"
@@ -110,6 +457,22 @@ class PostComment(models.Model):
     def __str__(self):
         return f"Comment by {self.user.username} on {self.post.id}"
 
+class PostReactionQuerySet(models.QuerySet):
+    def summaries_for(self, posts):
+        """
+        Counts reactions by type for all the given posts with one grouped query.
+        Returns {post_id: [{'reaction_type': ..., 'count': ...}, ...]}.
+        """
+        summaries = {post.pk: [] for post in posts}
+        rows = (
+            self.filter(post__in=list(summaries))
+            .order_by().values('post', 'reaction_type')
+            .annotate(count=Count('pk'))
+        )
+        for row in rows:
+            summaries[row['post']].append({'reaction_type': row['reaction_type'], 'count': row['count']})
+        return summaries
+
 class PostReaction(models.Model):
     REACTION_CHOICES = [
         ('like', 'Like'),
@@ -125,8 +488,53 @@ class PostReaction(models.Model):
     reaction_type = models.CharField(max_length=10, choices=REACTION_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PostReactionQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'post')
 
     def __str__(self):
-        return f"{self.user.username} reacted {self.reaction_type} to {self.post.id}"
\ No newline at end of file
+        return f"{self.user.username} reacted {self.reaction_type} to {self.post.id}"
+
+class SearchDocument(models.Model):
+    """
+    Denormalized text of one searchable object (see search.py). MySQL
+    searches it through a FULLTEXT index; other databases through SearchTerm.
+    """
+    KIND_TRACK = 'track'
+    KIND_KNOWLEDGE = 'knowledge'
+    KIND_POST = 'post'
+    KIND_CHOICES = [
+        (KIND_TRACK, 'Track'),
+        (KIND_KNOWLEDGE, 'Knowledge'),
+        (KIND_POST, 'Community post'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    length = models.PositiveIntegerField(default=0, help_text="Weighted token count, for ranking")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.title}"
+
+class SearchTerm(models.Model):
+    """
+    Inverted index postings: one row per distinct term of a document.
+    """
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64)
+    frequency = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'document'], name='searchterm_term_doc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} x{self.frequency}"
@@ -0,0 +1,44 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the view's `cursor_ordering`.
+    Each page is a range scan from the last seen row, so there's no COUNT(*)
+    and no OFFSET, and rows inserted while scrolling don't shift the pages.
+    """
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', None) or super().get_ordering(request, queryset, view)
+
+
+class OptionalCursorPagination(PageNumberPagination):
+    """
+    Page numbers by default (what the frontend already uses), keyset cursors
+    on request: `?pagination=cursor` for the first page, then follow `next`.
+    Cursors only follow the view's `cursor_ordering`, so `?ordering=` is
+    refused in that mode rather than quietly ignored.
+    """
+    mode_query_param = 'pagination'
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or KeysetCursorPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            if request.query_params.get(OrderingFilter.ordering_param):
+                raise ValidationError({'error': "ordering can't be combined with cursor pagination"})
+            self.cursor_paginator = KeysetCursorPagination()
+            self.cursor_paginator.page_size = self.get_page_size(request)
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
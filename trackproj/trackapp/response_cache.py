@@ -0,0 +1,154 @@
+"""
+Response cache for the track catalog (TrackViewSet list/retrieve).
+
+Responses are stored as the anonymous user sees them. The only per-user
+field, is_favorite, is patched in afterwards from a small cached set of the
+user's favorited track ids, so every user shares the same cached pages.
+
+Keys embed version numbers instead of being deleted: saving a track bumps
+that track's version and the catalog version, a favorite bumps the user's
+version too, and a bulk change to many tracks bumps the version every
+detail page shares. Old entries are never read again and just expire.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+PREFIX = 'tracks'
+TIMEOUT = getattr(settings, 'TRACK_CACHE_TIMEOUT', 3600)
+LOCK_TIMEOUT = 10      # seconds a rebuild may hold the lock
+LOCK_WAIT = 2.0        # seconds a request waits for someone else's rebuild
+LOCK_POLL = 0.05
+
+
+def _catalog_key():
+    return f'{PREFIX}:version:catalog'
+
+def _details_key():
+    return f'{PREFIX}:version:details'
+
+def _track_key(track_id):
+    return f'{PREFIX}:version:track:{track_id}'
+
+def _user_key(user_id):
+    return f'{PREFIX}:version:user:{user_id}'
+
+
+def _safe(operation, default=None):
+    # The cache is an optimization: if Redis is unreachable, serve from the DB
+    try:
+        return operation()
+    except Exception as e:
+        print(f"Track cache unavailable: {e}")
+        return default
+
+
+def _initial_version():
+    # Seeded from the clock, so a version key lost to eviction or a Redis
+    # restart can't come back as a number that was already used
+    return time.time_ns() // 1000
+
+
+def _versions(*keys):
+    def load():
+        found = cache.get_many(keys)
+        for key in keys:
+            if key not in found:
+                cache.add(key, _initial_version(), timeout=None)
+                found[key] = cache.get(key)
+        return [found[key] for key in keys]
+    # Without the cache there's nothing to version; any value will do
+    return _safe(load, [0] * len(keys))
+
+
+def _bump(*keys):
+    for key in keys:
+        def incr(key=key):
+            # add() is a no-op when the key exists; incr() is atomic in Redis
+            cache.add(key, _initial_version(), timeout=None)
+            cache.incr(key)
+        _safe(incr)
+
+
+def invalidate_track(track_id, user_id=None):
+    """
+    Marks a track's cached detail (every track's, if track_id is None), every
+    cached list page and, if given, the user's favorites overlay as stale
+    once the current transaction commits.
+    """
+    keys = [_catalog_key(), _details_key() if track_id is None else _track_key(track_id)]
+    if user_id is not None:
+        keys.append(_user_key(user_id))
+    transaction.on_commit(lambda: _bump(*keys))
+
+
+def _request_fingerprint(request):
+    # Absolute URLs (images, next/previous links) depend on scheme and host
+    params = sorted(request.query_params.lists())
+    raw = f'{request.scheme}://{request.get_host()}{request.path}?{params}'
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def list_key(request):
+    (version,) = _versions(_catalog_key())
+    return f'{PREFIX}:list:v{version}:{_request_fingerprint(request)}'
+
+
+def detail_key(request, track_id):
+    shared, version = _versions(_details_key(), _track_key(track_id))
+    return f'{PREFIX}:detail:{track_id}:v{shared}.{version}:{_request_fingerprint(request)}'
+
+
+def get_or_build(key, build):
+    """
+    Returns (data, hit). On a miss only one request per key rebuilds, via a
+    lock in the cache; the others wait briefly for its result instead of all
+    hitting the database at once. build() returns the data to cache or None
+    to skip caching (e.g. an error response).
+    """
+    data = _safe(lambda: cache.get(key))
+    if data is not None:
+        return data, True
+
+    lock = f'{key}:lock'
+    locked = _safe(lambda: cache.add(lock, 1, LOCK_TIMEOUT), True)
+    if not locked:
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            data = _safe(lambda: cache.get(key))
+            if data is not None:
+                return data, True
+        # The other rebuild is slow or died; build without the lock
+
+    try:
+        data = build()
+        if data is not None:
+            _safe(lambda: cache.set(key, data, TIMEOUT))
+    finally:
+        if locked:
+            _safe(lambda: cache.delete(lock))
+    return data, False
+
+
+def favorite_ids(user, load):
+    """
+    The user's favorited track ids, cached under the user's version.
+    load() reads them from the database.
+    """
+    (version,) = _versions(_user_key(user.pk))
+    key = f'{PREFIX}:favorites:{user.pk}:v{version}'
+    ids = _safe(lambda: cache.get(key))
+    if ids is None:
+        ids = set(load())
+        _safe(lambda: cache.set(key, ids, TIMEOUT))
+    return ids
+
+
+def apply_overlay(items, favorited):
+    for item in items:
+        item['is_favorite'] = item['id'] in favorited
+    return items
@@ -0,0 +1,181 @@
+"""
+Site search over tracks, knowledge base entries and community posts.
+
+Each searchable object is copied into a SearchDocument when it's saved.
+On MySQL the documents are matched with a FULLTEXT index (boolean mode,
+prefix terms); anywhere else (SQLite in dev/tests) the SearchTerm postings
+are range-scanned by prefix and ranked with BM25 in Python.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count
+from django.db.models.expressions import RawSQL
+
+from chatbot.models import KnowledgeBase
+from .models import Track, CommunityPost, SearchDocument, SearchTerm
+
+TITLE_WEIGHT = 3  # a title hit counts as this many body hits
+MAX_TERM_LENGTH = 64
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_RE = re.compile(r'\w+')
+
+
+def _track_text(track):
+    return track.label, track.description
+
+def _knowledge_text(entry):
+    return entry.title, entry.content
+
+def _post_text(post):
+    return '', post.content
+
+# model -> (kind, text extractor, fields whose change needs re-indexing)
+SEARCHABLE = {
+    Track: (SearchDocument.KIND_TRACK, _track_text, {'label', 'description'}),
+    KnowledgeBase: (SearchDocument.KIND_KNOWLEDGE, _knowledge_text, {'title', 'content'}),
+    CommunityPost: (SearchDocument.KIND_POST, _post_text, {'content'}),
+}
+MODELS_BY_KIND = {kind: model for model, (kind, _, _) in SEARCHABLE.items()}
+
+
+def use_fulltext():
+    backend = getattr(settings, 'SEARCH_BACKEND', None)
+    if backend:
+        return backend == 'fulltext'
+    return connection.vendor == 'mysql'
+
+
+def tokenize(text):
+    """
+    Lowercased, accent-stripped word tokens ("Trilha Fácil" -> trilha, facil),
+    so Portuguese queries match with or without accents.
+    """
+    text = unicodedata.normalize('NFKD', text or '').lower()
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [t[:MAX_TERM_LENGTH] for t in TOKEN_RE.findall(text) if len(t) > 1 or t.isdigit()]
+
+
+def index_object(instance):
+    """
+    Creates or refreshes the SearchDocument (and postings) for one object.
+    """
+    kind, extract, _ = SEARCHABLE[type(instance)]
+    title, body = extract(instance)
+    frequencies = Counter(tokenize(body))
+    for term in tokenize(title):
+        frequencies[term] += TITLE_WEIGHT
+
+    with transaction.atomic():
+        document, _ = SearchDocument.objects.update_or_create(
+            kind=kind, object_id=instance.pk,
+            defaults={'title': (title or '')[:255], 'body': body or '', 'length': sum(frequencies.values())},
+        )
+        if not use_fulltext():
+            document.terms.all().delete()
+            SearchTerm.objects.bulk_create(
+                [SearchTerm(document=document, term=term, frequency=n) for term, n in frequencies.items()],
+                batch_size=500,
+            )
+
+
+def remove_object(instance):
+    kind = SEARCHABLE[type(instance)][0]
+    SearchDocument.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+
+def needs_reindex(instance, update_fields):
+    # Saves that only touch counters, qdrant_id, etc. leave the text alone
+    if not update_fields:
+        return True
+    return bool(SEARCHABLE[type(instance)][2] & set(update_fields))
+
+
+def _fulltext_search(terms, documents, limit):
+    # Every term required, each as a prefix: "trilha fac" -> "+trilha* +fac*"
+    query = ' '.join(f'+{term}*' for term in terms)
+    return list(
+        documents.annotate(score=RawSQL(
+            'MATCH (trackapp_searchdocument.title, trackapp_searchdocument.body) AGAINST (%s IN BOOLEAN MODE)',
+            [query],
+        )).filter(score__gt=0).order_by('-score')[:limit]
+    )
+
+
+def _postings_search(terms, documents, limit):
+    # doc id -> {query term: frequency}, summed over every indexed term the
+    # query term is a prefix of. The range keeps the lookup on the term index.
+    matches = defaultdict(dict)
+    for term in terms:
+        postings = (
+            SearchTerm.objects.filter(term__gte=term, term__lt=term + '\uffff', document__in=documents)
+            .values_list('document', 'frequency')
+        )
+        for document_id, frequency in postings:
+            matches[document_id][term] = matches[document_id].get(term, 0) + frequency
+
+    # All terms required
+    candidates = {doc: tf for doc, tf in matches.items() if len(tf) == len(terms)}
+    if not candidates:
+        return []
+
+    # Collection statistics over every searched document, not just the
+    # matches, so a document's length normalisation doesn't depend on the query
+    stats = documents.aggregate(total=Count('pk'), average_length=Avg('length'))
+    total = stats['total']
+    average_length = stats['average_length'] or 1
+    lengths = dict(documents.filter(pk__in=candidates).values_list('pk', 'length'))
+    document_frequency = Counter(term for tf in matches.values() for term in tf)
+
+    scores = {}
+    for doc, tf in candidates.items():
+        score = 0.0
+        for term, frequency in tf.items():
+            idf = math.log(1 + (total - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / average_length)
+            score += idf * frequency * (BM25_K1 + 1) / norm
+        scores[doc] = score
+
+    best = sorted(scores, key=scores.get, reverse=True)[:limit]
+    found = SearchDocument.objects.in_bulk(best)
+    results = []
+    for doc in best:
+        found[doc].score = scores[doc]
+        results.append(found[doc])
+    return results
+
+
+def search(query, kinds=None, limit=20):
+    """
+    Returns SearchDocuments (with a .score) best first.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    documents = SearchDocument.objects.all()
+    if kinds:
+        documents = documents.filter(kind__in=kinds)
+    if use_fulltext():
+        return _fulltext_search(terms, documents, limit)
+    return _postings_search(terms, documents, limit)
+
+
+def rebuild_index():
+    """
+    Re-indexes every searchable object in place, then deletes the documents
+    whose object is gone, so search keeps answering (from the old documents)
+    while it runs. Returns how many were indexed.
+    """
+    count = 0
+    for model, (kind, _, _) in SEARCHABLE.items():
+        for instance in model.objects.order_by('pk').iterator(chunk_size=500):
+            index_object(instance)
+            count += 1
+        SearchDocument.objects.filter(kind=kind).exclude(object_id__in=model.objects.values('pk')).delete()
+    SearchDocument.objects.exclude(kind__in=MODELS_BY_KIND).delete()
+    return count
@@ -1,31 +1,75 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from .models import Track, Profile, Rating, Favorite, TrackImage, CommunityPost, PostComment, PostReaction
+from .images import VARIANT_SIZES, variants_field
+from .models import SearchDocument, Track, TrackGeometry, Profile, Rating, Favorite, TrackImage, CommunityPost, PostComment, PostReaction
+
+class ImageVariantsField(serializers.Field):
+    """
+    {thumb, medium, full} URLs for an image field (see images.py). Until the
+    variants are rendered, all three point at the original upload.
+    """
+    def __init__(self, image_field='image', **kwargs):
+        self.image_field = image_field
+        kwargs.setdefault('source', '*')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        image = getattr(obj, self.image_field)
+        if not image:
+            return None
+        request = self.context.get('request')
+
+        def url(name):
+            url = image.storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+
+        variants = getattr(obj, variants_field(self.image_field)) or {}
+        if variants.get('source') != image.name:
+            return {size: url(image.name) for size in VARIANT_SIZES}
+        return {size: url(variants[size]) for size in VARIANT_SIZES}
 
 class TrackImageSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = TrackImage
-        fields = ['id', 'image', 'created_at']
+        fields = ['id', 'image', 'image_variants', 'created_at']
 
 class TrackSerializer(serializers.ModelSerializer):
-    favorites_count = serializers.SerializerMethodField()
     is_favorite = serializers.SerializerMethodField()
     image = serializers.ImageField(use_url=True, required=False, allow_null=True)
+    image_variants = ImageVariantsField()
     images = TrackImageSerializer(many=True, read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
 
     class Meta:
         model = Track
-        fields = '__all__'
-
-    def get_favorites_count(self, obj):
-        return Favorite.objects.filter(track=obj).count()
+        # gpx_values is bookkeeping for Track.apply_gpx_statistics
+        exclude = ['gpx_values']
 
+    # Annotated by Track.objects.with_favorites(); the query below only runs
+    # for instances that didn't come from that queryset.
     def get_is_favorite(self, obj):
+        if hasattr(obj, 'is_favorite'):
+            return obj.is_favorite
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Favorite.objects.filter(user=request.user, track=obj).exists()
         return False
 
+class TrackGeometrySerializer(serializers.ModelSerializer):
+    bbox = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TrackGeometry
+        fields = ['track', 'max_zoom', 'tolerance', 'point_count', 'polyline', 'bbox']
+
+    def get_bbox(self, obj):
+        # [min_lon, min_lat, max_lon, max_lat], the order map SDKs expect
+        track = obj.track
+        return [track.min_longitude, track.min_latitude, track.max_longitude, track.max_latitude]
+
 class UserRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     name = serializers.CharField(write_only=True)
@@ -50,17 +94,19 @@ class UserRegisterSerializer(serializers.ModelSerializer):
 
 class ProfileSerializer(serializers.ModelSerializer):
     picture = serializers.ImageField(use_url=True, required=False, allow_null=True)
+    picture_variants = ImageVariantsField('picture')
 
     class Meta:
         model = Profile
-        fields = ['name', 'phone', 'cpf', 'picture']
+        fields = ['name', 'phone', 'cpf', 'picture', 'picture_variants']
 
 class PublicProfileSerializer(serializers.ModelSerializer):
     picture = serializers.ImageField(use_url=True, read_only=True)
+    picture_variants = ImageVariantsField('picture')
 
     class Meta:
         model = Profile
-        fields = ['name', 'picture']
+        fields = ['name', 'picture', 'picture_variants']
 
 class UserSerializer(serializers.ModelSerializer):
     profile = ProfileSerializer()
@@ -72,28 +118,31 @@ class UserSerializer(serializers.ModelSerializer):
 class PublicUserSerializer(serializers.ModelSerializer):
     name = serializers.CharField(source='profile.name', read_only=True)
     picture = serializers.ImageField(source='profile.picture', read_only=True)
+    picture_variants = ImageVariantsField('picture', source='profile')
 
     class Meta:
         model = User
-        fields = ['id', 'name', 'picture']
+        fields = ['id', 'name', 'picture', 'picture_variants']
 
 class RatingSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.id')
     user_name = serializers.ReadOnlyField(source='user.profile.name')
     user_picture = serializers.ImageField(source='user.profile.picture', read_only=True)
+    user_picture_variants = ImageVariantsField('picture', source='user.profile')
 
     class Meta:
         model = Rating
-        fields = ['id', 'user', 'user_name', 'user_picture', 'track', 'comment', 'date', 'score']
+        fields = ['id', 'user', 'user_name', 'user_picture', 'user_picture_variants', 'track', 'comment', 'date', 'score']
         read_only_fields = ['user', 'date']
 
 class PostCommentSerializer(serializers.ModelSerializer):
     user_name = serializers.ReadOnlyField(source='user.profile.name')
     user_picture = serializers.ImageField(source='user.profile.picture', read_only=True)
+    user_picture_variants = ImageVariantsField('picture', source='user.profile')
     
     class Meta:
         model = PostComment
-        fields = ['id', 'user', 'user_name', 'user_picture', 'content', 'created_at']
+        fields = ['id', 'user', 'user_name', 'user_picture', 'user_picture_variants', 'content', 'created_at']
         read_only_fields = ['user', 'created_at']
 
 class PostReactionSerializer(serializers.ModelSerializer):
@@ -105,6 +154,8 @@ class PostReactionSerializer(serializers.ModelSerializer):
 class CommunityPostSerializer(serializers.ModelSerializer):
     user_name = serializers.ReadOnlyField(source='user.profile.name')
     user_picture = serializers.ImageField(source='user.profile.picture', read_only=True)
+    user_picture_variants = ImageVariantsField('picture', source='user.profile')
+    image_variants = ImageVariantsField()
     comments = PostCommentSerializer(many=True, read_only=True)
     reactions_summary = serializers.SerializerMethodField()
     user_reaction = serializers.SerializerMethodField()
@@ -112,19 +163,39 @@ class CommunityPostSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = CommunityPost
-        fields = ['id', 'user', 'user_name', 'user_picture', 'content', 'image', 'track', 'track_info', 'created_at', 'comments', 'reactions_summary', 'user_reaction']
+        fields = ['id', 'user', 'user_name', 'user_picture', 'user_picture_variants', 'content', 'image', 'image_variants', 'track', 'track_info', 'created_at', 'comments', 'reactions_summary', 'user_reaction']
         read_only_fields = ['user', 'created_at']
 
+    # reactions_summary and own_reactions are attached by the feed loader in
+    # CommunityPostViewSet; the queries below are the fallback for single posts.
     def get_reactions_summary(self, obj):
+        if hasattr(obj, 'reactions_summary'):
+            return obj.reactions_summary
         from django.db.models import Count
         return obj.reactions.values('reaction_type').annotate(count=Count('reaction_type'))
 
     def get_user_reaction(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            if hasattr(obj, 'own_reactions'):
+                return obj.own_reactions[0].reaction_type if obj.own_reactions else None
             try:
                 reaction = obj.reactions.get(user=request.user)
                 return reaction.reaction_type
             except PostReaction.DoesNotExist:
                 return None
         return None
+
+
+class SearchResultSerializer(serializers.ModelSerializer):
+    type = serializers.ReadOnlyField(source='kind')
+    id = serializers.ReadOnlyField(source='object_id')
+    snippet = serializers.SerializerMethodField()
+    score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SearchDocument
+        fields = ['type', 'id', 'title', 'snippet', 'score']
+
+    def get_snippet(self, obj):
+        return obj.body[:200]
@@ -0,0 +1,101 @@
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from chatbot.models import KnowledgeBase
+from .models import Track, TrackImage, Profile, CommunityPost, PostComment, PostReaction, Favorite, Rating
+from .images import IMAGE_FIELDS, schedule_cleanup, schedule_variants, variants_built, variants_field
+from . import search, response_cache
+
+# Resized variants for every uploaded picture (see images.py)
+@receiver(post_save, sender=Track)
+@receiver(post_save, sender=TrackImage)
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=CommunityPost)
+def on_image_save(sender, instance, **kwargs):
+    schedule_variants(instance, IMAGE_FIELDS[sender._meta.label_lower])
+
+@receiver(post_delete, sender=Track)
+@receiver(post_delete, sender=TrackImage)
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=CommunityPost)
+def on_image_delete(sender, instance, **kwargs):
+    schedule_cleanup(getattr(instance, variants_field(IMAGE_FIELDS[sender._meta.label_lower])))
+
+
+# Keep the search index (see search.py) in step, one object at a time
+@receiver(post_save, sender=Track)
+@receiver(post_save, sender=KnowledgeBase)
+@receiver(post_save, sender=CommunityPost)
+def on_searchable_save(sender, instance, update_fields=None, **kwargs):
+    if search.needs_reindex(instance, update_fields):
+        search.index_object(instance)
+
+@receiver(post_delete, sender=Track)
+@receiver(post_delete, sender=KnowledgeBase)
+@receiver(post_delete, sender=CommunityPost)
+def on_searchable_delete(sender, instance, **kwargs):
+    search.remove_object(instance)
+
+
+# Track catalog response cache (see response_cache.py)
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def on_track_change(sender, instance, **kwargs):
+    response_cache.invalidate_track(instance.pk)
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def on_favorite_change(sender, instance, **kwargs):
+    response_cache.invalidate_track(instance.track_id, user_id=instance.user_id)
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=TrackImage)
+@receiver(post_delete, sender=TrackImage)
+def on_track_child_change(sender, instance, **kwargs):
+    response_cache.invalidate_track(instance.track_id)
+
+@receiver(variants_built, sender=Track)
+@receiver(variants_built, sender=TrackImage)
+def on_track_variants_built(sender, pk, **kwargs):
+    track_id = pk if sender is Track else TrackImage.objects.filter(pk=pk).values_list('track_id', flat=True).first()
+    response_cache.invalidate_track(track_id)
+
+
+# Conditional GET validators (see conditional.py) come from updated_at, so
+# changes that show up inside another object's response move its parent's
+# updated_at too. Favorite and rating counters do it in their own update().
+@receiver(post_save, sender=TrackImage)
+@receiver(post_delete, sender=TrackImage)
+def touch_track(sender, instance, **kwargs):
+    Track.objects.filter(pk=instance.track_id).touch()
+
+@receiver(post_save, sender=PostComment)
+@receiver(post_delete, sender=PostComment)
+@receiver(post_save, sender=PostReaction)
+@receiver(post_delete, sender=PostReaction)
+def touch_post(sender, instance, **kwargs):
+    CommunityPost.objects.filter(pk=instance.post_id).touch()
+
+def touch_posts_by(user_id):
+    # Posts show their author's and commenters' names and pictures
+    CommunityPost.objects.filter(Q(user_id=user_id) | Q(comments__user_id=user_id)).touch()
+
+@receiver(post_save, sender=Profile)
+def on_profile_save(sender, instance, **kwargs):
+    touch_posts_by(instance.user_id)
+
+@receiver(variants_built, sender=Track)
+@receiver(variants_built, sender=TrackImage)
+@receiver(variants_built, sender=Profile)
+@receiver(variants_built, sender=CommunityPost)
+def touch_after_variants(sender, pk, **kwargs):
+    # build_variants() writes with update(), which leaves updated_at alone
+    if sender is TrackImage:
+        Track.objects.filter(images__pk=pk).touch()
+    elif sender is Profile:
+        Profile.objects.filter(pk=pk).update(updated_at=timezone.now())
+        touch_posts_by(Profile.objects.filter(pk=pk).values_list('user_id', flat=True).first())
+    else:
+        sender.objects.filter(pk=pk).touch()
@@ -0,0 +1,17 @@
+"""
+Job tasks (see chatbot/jobs.py) for the image variants (images.py).
+"""
+from django.apps import apps
+
+from chatbot import jobs
+from . import images
+
+
+@jobs.task('images.variants')
+def build_image_variants(model, pk, image_field):
+    images.build_variants(apps.get_model(model), pk, image_field)
+
+
+@jobs.task('images.cleanup')
+def delete_image_variants(files):
+    images.delete_unused(files)
@@ -1,8 +1,29 @@
-from django.test import TestCase
+import io
+import math
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import skipUnless
+from unittest.mock import patch
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import Track
+from chatbot.models import Job, KnowledgeBase
+from . import images, search
+from .models import Track, Rating, Favorite, TrackImage, Profile, CommunityPost, PostComment, PostReaction, SearchDocument
+
+# Tests that reach the cache get one in this process instead of Redis, and
+# clear it in setUp so nothing carries over from an earlier test
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
 # This checks if the Track model is created correctly and if the fields are correct.
 class TrackModelTests(TestCase):
@@ -22,9 +43,635 @@ class TrackModelTests(TestCase):
         self.assertEqual(track.route_type, "Ida e Volta")
         self.assertEqual(track.elevation, 100)
 
+# A straight line north along a meridian, 0.001° (~111 m) per point, climbing
+# 10 m per point then dropping 5 m, one minute apart.
+def make_gpx(points=11):
+    trkpts = ''.join(
+        f'<trkpt lat="{-22.9 + i * 0.001:.3f}" lon="-43.2"><ele>{100 + 10 * i}</ele>'
+        f'<time>2025-01-01T10:{i:02d}:00Z</time></trkpt>'
+        for i in range(points)
+    )
+    trkpts += f'<trkpt lat="{-22.9 + points * 0.001:.3f}" lon="-43.2"><ele>{95 + 10 * (points - 1)}</ele></trkpt>'
+    return (
+        '<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+        f'<trk><name>Teste</name><trkseg>{trkpts}</trkseg></trk></gpx>'
+    ).encode()
+
+# This checks that uploading a GPX fills in the derived statistics.
+class TrackGPXTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_stats_computed_on_upload(self):
+        track = Track.objects.create(label="GPX", url=SimpleUploadedFile('teste.gpx', make_gpx()))
+        track.refresh_from_db()
+        self.assertEqual(track.point_count, 12)
+        self.assertAlmostEqual(track.distance, 11 * 0.001 * 111195, delta=5)
+        self.assertAlmostEqual(track.min_latitude, -22.9)
+        self.assertAlmostEqual(track.max_latitude, -22.889)
+        self.assertEqual(track.min_altitude, 100)
+        self.assertEqual(track.max_altitude, 200)
+        self.assertEqual(track.duration, 10)
+        self.assertEqual(track.elevation, track.ascent)
+        self.assertGreater(track.ascent, track.descent)
+        # The file itself must still be stored intact
+        with track.url.open('rb') as f:
+            self.assertEqual(f.read(), make_gpx())
+
+    def test_manual_values_are_kept(self):
+        track = Track.objects.create(label="GPX", distance=5000, url=SimpleUploadedFile('teste.gpx', make_gpx()))
+        self.assertEqual(track.distance, 5000)
+        self.assertEqual(track.point_count, 12)
+
+    def test_new_file_replaces_derived_values(self):
+        track = Track.objects.create(label="GPX", url=SimpleUploadedFile('teste.gpx', make_gpx()))
+        typed = Track.objects.create(label="GPX", duration=45, url=SimpleUploadedFile('teste.gpx', make_gpx()))
+        for t in (track, typed):
+            t.url = SimpleUploadedFile('maior.gpx', make_gpx(21))
+            t.save()
+            t.refresh_from_db()
+        self.assertAlmostEqual(track.distance, 21 * 0.001 * 111195, delta=5)
+        self.assertEqual((track.duration, track.point_count), (20, 22))
+        # Typed in: kept, while the rest follows the new file
+        self.assertEqual((typed.duration, typed.point_count), (45, 22))
+        self.assertAlmostEqual(typed.distance, track.distance)
+
+    def test_geometry_levels(self):
+        track = Track.objects.create(label="GPX", url=SimpleUploadedFile('teste.gpx', make_gpx()))
+        url = reverse('track-geometry', args=[track.pk])
+        coarse = self.client.get(url, {'zoom': 5}).json()
+        fine = self.client.get(url, {'zoom': 18}).json()
+        self.assertEqual(coarse['max_zoom'], 10)
+        self.assertEqual(fine['max_zoom'], 16)
+        # Every point is on a straight line, so only the ends survive
+        self.assertEqual(coarse['point_count'], 2)
+        self.assertEqual(coarse['bbox'], [-43.2, -22.9, -43.2, -22.889])
+        self.assertEqual(self.client.get(url, {'zoom': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('track-geometry', args=['abc'])).status_code, 404)
+
+        # Saving without a new file leaves the geometry alone
+        ids = set(track.geometries.values_list('id', flat=True))
+        track.label = "Renamed"
+        track.save()
+        self.assertEqual(set(track.geometries.values_list('id', flat=True)), ids)
+
+    def test_invalid_file_still_saves(self):
+        track = Track.objects.create(label="GPX", url=SimpleUploadedFile('teste.gpx', b'<gpx><trk>'))
+        self.assertIsNone(track.point_count)
+
+# This checks the bulk GPX import command.
+class ImportTracksTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.source = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+        shutil.rmtree(self.source, ignore_errors=True)
+
+    def import_tracks(self, source, **options):
+        with patch('chatbot.jobs.enqueue') as enqueue:
+            call_command('import_tracks', source, workers=1, stdout=io.StringIO(), stderr=io.StringIO(), **options)
+        return enqueue
+
+    def test_imports_directory(self):
+        os.makedirs(os.path.join(self.source, 'serra'))
+        with open(os.path.join(self.source, 'pico.gpx'), 'wb') as f:
+            f.write(make_gpx())
+        with open(os.path.join(self.source, 'serra', 'vale.gpx'), 'wb') as f:
+            f.write(make_gpx(20))
+        with open(os.path.join(self.source, 'quebrado.gpx'), 'wb') as f:
+            f.write(b'<gpx><trk>')
+
+        sync = self.import_tracks(self.source, difficulty='dificil')
+
+        tracks = {t.label: t for t in Track.objects.all()}
+        self.assertEqual(set(tracks), {'pico', 'vale'})
+        vale = tracks['vale']
+        self.assertEqual((vale.point_count, vale.difficulty), (21, 'dificil'))
+        self.assertIsNotNone(vale.grid_cell)
+        self.assertTrue(default_storage.exists(vale.url.name))
+        self.assertEqual(vale.geometries.count(), 3)
+        self.assertTrue(search.search('vale'))
+        # One batched vector sync for the whole import, left to the worker
+        sync.assert_called_once_with('vectors.sync', {'model': 'trackapp.track', 'pks': [t.pk for t in Track.objects.order_by('pk')]})
+
+    def test_imports_zip(self):
+        archive = os.path.join(self.source, 'trilhas.zip')
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('a/um.gpx', make_gpx())
+            z.writestr('leia-me.txt', 'nada')
+        sync = self.import_tracks(archive, skip_vectors=True)
+        self.assertEqual(list(Track.objects.values_list('label', flat=True)), ['um'])
+        sync.assert_not_called()
+
+    def test_failed_batch_leaves_no_files(self):
+        with open(os.path.join(self.source, 'pico.gpx'), 'wb') as f:
+            f.write(make_gpx())
+        with patch('trackapp.models.TrackGeometry.objects.bulk_create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.import_tracks(self.source)
+        self.assertFalse(Track.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media, 'tracks')), [])
+
+def make_jpeg(size=(2000, 1000)):
+    from PIL import Image
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90° on display
+    exif[0x010F] = 'PhoneCam'
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'green').save(buffer, format='JPEG', exif=exif)
+    return buffer.getvalue()
+
+# This checks the resized WebP variants built for uploaded images.
+@override_settings(CACHES=LOCAL_CACHE)
+class ImageVariantTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def image_jobs(self):
+        return Job.objects.filter(task__startswith='images.')
+
+    def run_worker(self):
+        # The cached responses are invalidated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('run_jobs', once=True, stdout=io.StringIO())
+
+    def test_variants_built_by_the_job_queue(self):
+        from PIL import Image
+        track = Track.objects.create(label="Foto", image=SimpleUploadedFile('foto.jpg', make_jpeg()))
+        self.assertEqual(self.image_jobs().get().task, 'images.variants')
+
+        # Until the worker runs, every size falls back to the original
+        data = self.client.get(reverse('track-detail', args=[track.pk])).data
+        self.assertTrue(data['image_variants']['thumb'].endswith(track.image.name))
+
+        self.run_worker()
+        self.assertFalse(self.image_jobs().exists())
+        track.refresh_from_db()
+        self.assertEqual(track.image_variants['source'], track.image.name)
+        with default_storage.open(track.image_variants['thumb']) as f:
+            thumb = Image.open(f)
+            self.assertEqual(thumb.format, 'WEBP')
+            # The EXIF rotation is baked in, then the metadata dropped
+            self.assertEqual(thumb.size, (64, 128))
+            self.assertFalse(thumb.getexif())
+
+        data = self.client.get(reverse('track-detail', args=[track.pk])).data
+        self.assertTrue(data['image_variants']['medium'].endswith(track.image_variants['medium']))
+
+        # Saving without a new image doesn't queue more work
+        track.save()
+        self.assertFalse(self.image_jobs().exists())
+
+    def test_superseded_variants_are_deleted(self):
+        first = Track.objects.create(label="Um", image=SimpleUploadedFile('foto.jpg', make_jpeg()))
+        second = Track.objects.create(label="Dois", image=SimpleUploadedFile('foto.jpg', make_jpeg()))
+        self.run_worker()
+        first.refresh_from_db()
+        old = images.variant_files(first.image_variants)
+
+        first.image = SimpleUploadedFile('outra.jpg', make_jpeg((800, 600)))
+        first.save()
+        self.run_worker()
+        first.refresh_from_db()
+        self.assertNotEqual(images.variant_files(first.image_variants), old)
+        # The same render is still the second track's
+        self.assertTrue(all(default_storage.exists(name) for name in old))
+
+        Track.objects.get(pk=second.pk).delete()
+        self.run_worker()
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+        self.assertTrue(all(default_storage.exists(name) for name in images.variant_files(first.image_variants)))
+
+    def test_backfill_command(self):
+        track = Track.objects.create(label="Foto", image=SimpleUploadedFile('foto.jpg', make_jpeg()))
+        self.run_worker()
+        call_command('build_image_variants', stdout=io.StringIO())
+        self.assertFalse(self.image_jobs().exists())
+        # Built before variants existed
+        Track.objects.filter(pk=track.pk).update(image_variants={})
+        call_command('build_image_variants', stdout=io.StringIO())
+        self.assertEqual(self.image_jobs().get().payload, {'model': 'trackapp.track', 'pk': track.pk, 'image_field': 'image'})
+
+# This checks the nearby/within spatial search.
+class TrackSpatialSearchTests(APITestCase):
+    def setUp(self):
+        # Start points set directly; normally they come from the GPX upload
+        def make(label, lat, lon):
+            track = Track(label=label, start_latitude=lat, start_longitude=lon)
+            track.save()
+            return track
+        self.pedra = make("Pedra da Gávea", -22.9977, -43.2846)
+        self.tijuca = make("Pico da Tijuca", -22.9425, -43.2850)
+        self.petropolis = make("Petrópolis", -22.5050, -43.1780)
+        self.fiji = make("Fiji", -17.0, 179.99)
+        Track.objects.create(label="Sem GPX")
+
+    def test_nearby_sorted_by_distance(self):
+        response = self.client.get(reverse('track-nearby'), {'lat': -22.99, 'lon': -43.28, 'radius': 20000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['label'] for t in response.data], ["Pedra da Gávea", "Pico da Tijuca"])
+        self.assertLess(response.data[0]['distance_from_point'], response.data[1]['distance_from_point'])
+
+    def test_nearby_requires_coordinates(self):
+        response = self.client.get(reverse('track-nearby'), {'lat': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_within_bbox(self):
+        response = self.client.get(reverse('track-within'), {
+            'min_lat': -23.1, 'min_lon': -43.5, 'max_lat': -22.4, 'max_lon': -43.0
+        })
+        self.assertEqual({t['label'] for t in response.data}, {"Pedra da Gávea", "Pico da Tijuca", "Petrópolis"})
+
+    def test_within_across_antimeridian(self):
+        response = self.client.get(reverse('track-within'), {
+            'min_lat': -18, 'min_lon': 179, 'max_lat': -16, 'max_lon': -179
+        })
+        self.assertEqual([t['label'] for t in response.data], ["Fiji"])
+
+# This checks catalog filtering/ordering and that the common shapes hit an index.
+@override_settings(CACHES=LOCAL_CACHE)
+class TrackFilterTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        def make(label, difficulty, route_type, distance, duration):
+            return Track.objects.create(
+                label=label, difficulty=difficulty, route_type=route_type,
+                distance=distance, duration=duration
+            )
+        make("Curta", Track.DIFFICULTY_EASY, Track.ROUTE_TYPE_ROUND_TRIP, 2000, 40)
+        make("Média", Track.DIFFICULTY_EASY, Track.ROUTE_TYPE_ROUND_TRIP, 4500, 90)
+        make("Longa", Track.DIFFICULTY_EASY, Track.ROUTE_TYPE_ROUND_TRIP, 12000, 240)
+        make("Ida", Track.DIFFICULTY_EASY, Track.ROUTE_TYPE_ONE_WAY, 3000, 60)
+        make("Difícil", Track.DIFFICULTY_DIFFICULT, Track.ROUTE_TYPE_ROUND_TRIP, 1000, 120)
+
+    def labels(self, **params):
+        response = self.client.get(reverse('track-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [t['label'] for t in response.data['results']]
+
+    def test_easy_round_trips_under_5km_shortest_first(self):
+        labels = self.labels(difficulty='facil', route_type='ida_volta', distance_max=5000, ordering='distance')
+        self.assertEqual(labels, ["Curta", "Média"])
+
+    def test_ranges_and_multiple_choices(self):
+        self.assertEqual(
+            self.labels(difficulty='facil,dificil', duration_min=60, duration_max=120, ordering='-duration'),
+            ["Difícil", "Média", "Ida"]
+        )
+
+    def test_popularity_ordering(self):
+        user = User.objects.create_user(username='fan', password='pass')
+        Favorite.objects.add(user, Track.objects.get(label="Longa").pk)
+        self.assertEqual(self.labels(ordering='-popularity')[0], "Longa")
+
+    def test_unknown_ordering_is_ignored(self):
+        self.assertEqual(len(self.labels(ordering='cpf')), 5)
+
+    @skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite's")
+    def test_common_filters_use_an_index(self):
+        shapes = [
+            Track.objects.filter(difficulty='facil', route_type='ida_volta', distance__lte=5000).order_by('distance', 'id'),
+            Track.objects.filter(difficulty='facil', distance__gte=1000),
+            Track.objects.filter(route_type='ida').order_by('distance', 'id'),
+            Track.objects.filter(distance__range=(1000, 5000)),
+            Track.objects.filter(duration__lte=90).order_by('duration', 'id'),
+            Track.objects.filter(elevation__gte=300),
+            Track.objects.order_by('-created_at'),
+        ]
+        for queryset in shapes:
+            plan = queryset.explain()
+            for line in plan.splitlines():
+                if 'trackapp_track' in line:
+                    self.assertIn('USING INDEX', line, f"Full scan for {queryset.query}:\n{plan}")
+
+# This checks the favorite endpoint and the stored favorites counter.
+class FavoriteCounterTests(APITestCase):
+    def setUp(self):
+        self.track = Track.objects.create(label="Favorita")
+        self.user = User.objects.create_user(username='fan', password='pass')
+        self.url = reverse('track-favorite', args=[self.track.pk])
+        self.client.force_authenticate(self.user)
+
+    def test_toggle(self):
+        self.assertEqual(self.client.post(self.url).data, {'favorited': True, 'favorites_count': 1})
+        self.assertEqual(self.client.post(self.url).data, {'favorited': False, 'favorites_count': 0})
+
+    def test_put_and_delete_are_idempotent(self):
+        for _ in range(2):
+            self.assertEqual(self.client.put(self.url).data, {'favorited': True, 'favorites_count': 1})
+        for _ in range(2):
+            self.assertEqual(self.client.delete(self.url).data, {'favorited': False, 'favorites_count': 0})
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.favorites_count, 0)
+
+    def test_unknown_track(self):
+        self.assertEqual(self.client.put(reverse('track-favorite', args=[9999])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.post(reverse('track-favorite', args=[9999])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_queries_per_tap(self):
+        # add: INSERT, counter UPDATE, SELECT it; remove: the same plus the
+        # SELECT .delete() makes for post_delete
+        for change, expected, budget in ((Favorite.objects.add, (True, 1), 3), (Favorite.objects.add, (True, 1), 2),
+                                         (Favorite.objects.remove, (False, 0), 4), (Favorite.objects.remove, (False, 0), 2)):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(change(self.user, self.track.pk), expected)
+            # Transaction control (BEGIN, SAVEPOINT, ...) aside
+            statements = [q['sql'] for q in queries if q['sql'].split()[0] in ('SELECT', 'INSERT', 'UPDATE', 'DELETE')]
+            self.assertLessEqual(len(statements), budget, statements)
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.favorites_count, 0)
+
+    def test_drifted_counter_stays_at_zero(self):
+        Favorite.objects.create(user=self.user, track=self.track)
+        Track.objects.filter(pk=self.track.pk).update(favorites_count=0)
+        self.assertEqual(Favorite.objects.remove(self.user, self.track.pk), (False, 0))
+
+    def test_rebuild_command(self):
+        Favorite.objects.create(user=self.user, track=self.track)
+        call_command('rebuild_favorites_count', stdout=io.StringIO())
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.favorites_count, 1)
+
+# This checks the track response cache and its invalidation.
+@override_settings(CACHES=LOCAL_CACHE)
+class TrackResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.track = Track.objects.create(label="Em cache")
+        self.user = User.objects.create_user(username='cached', password='pass')
+
+    def test_anonymous_hits_skip_the_database(self):
+        url = reverse('track-list')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['label'], "Em cache")
+
+    def test_saves_invalidate_list_and_detail(self):
+        detail = reverse('track-detail', args=[self.track.pk])
+        self.client.get(reverse('track-list'))
+        self.client.get(detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.track.label = "Renomeada"
+            self.track.save()
+        self.assertEqual(self.client.get(reverse('track-list')).data['results'][0]['label'], "Renomeada")
+        self.assertEqual(self.client.get(detail).data['label'], "Renomeada")
+
+    def test_rebuild_commands_invalidate_details(self):
+        detail = reverse('track-detail', args=[self.track.pk])
+        Track.objects.filter(pk=self.track.pk).update(favorites_count=7)
+        self.assertEqual(self.client.get(detail).data['favorites_count'], 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_favorites_count', stdout=io.StringIO())
+        self.assertEqual(self.client.get(detail).data['favorites_count'], 0)
+
+    def test_favorites_overlay_is_per_user(self):
+        detail = reverse('track-detail', args=[self.track.pk])
+        self.client.get(detail)
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('track-favorite', args=[self.track.pk]))
+        data = self.client.get(detail).data
+        self.assertEqual((data['is_favorite'], data['favorites_count']), (True, 1))
+
+        other = User.objects.create_user(username='other', password='pass')
+        self.client.force_authenticate(other)
+        response = self.client.get(detail)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertFalse(response.data['is_favorite'])
+
+# This checks ETag/Last-Modified and 304s on conditional GETs.
+@override_settings(CACHES=LOCAL_CACHE)
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='mobile', password='pass')
+        Profile.objects.create(user=self.user, name='Mobile')
+        self.track = Track.objects.create(label="Revalidada")
+        self.post = CommunityPost.objects.create(user=self.user, content='Olá', track=self.track)
+
+    def revalidate(self, url, response, **headers):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **headers)
+
+    def test_unchanged_responses_are_304(self):
+        self.client.force_authenticate(self.user)
+        for url in (reverse('track-list'), reverse('track-detail', args=[self.track.pk]),
+                    reverse('community-post-list'), reverse('community-post-detail', args=[self.post.pk]),
+                    reverse('user-me')):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200, url)
+            self.assertIn('Last-Modified', first)
+            second = self.revalidate(url, first)
+            self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED, url)
+            self.assertEqual(second['ETag'], first['ETag'])
+            self.assertEqual(second.content, b'')
+
+    def test_304_skips_serialization(self):
+        url = reverse('community-post-list')
+        first = self.client.get(url)
+        # Only the fingerprint query runs
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+    def test_if_modified_since(self):
+        url = reverse('track-detail', args=[self.track.pk])
+        first = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_deletion_is_not_hidden_by_if_modified_since(self):
+        CommunityPost.objects.create(user=self.user, content='Mais nova')
+        url = reverse('community-post-list')
+        first = self.client.get(url)
+        # Not the newest, so max(updated_at) stays the same
+        self.post.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+
+    def test_related_changes_change_the_etag(self):
+        self.client.force_authenticate(self.user)
+        track_url = reverse('track-detail', args=[self.track.pk])
+        post_url = reverse('community-post-detail', args=[self.post.pk])
+        track_first, post_first = self.client.get(track_url), self.client.get(post_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('track-favorite', args=[self.track.pk]))
+        self.assertEqual(self.revalidate(track_url, track_first).status_code, 200)
+        self.assertEqual(self.revalidate(post_url, post_first).status_code, 200)
+
+        post_first = self.client.get(post_url)
+        self.client.post(reverse('community-post-comment', args=[self.post.pk]), {'content': 'Bom'})
+        self.assertEqual(self.revalidate(post_url, post_first).status_code, 200)
+
+    def test_etag_is_per_user(self):
+        url = reverse('track-list')
+        anonymous = self.client.get(url)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.revalidate(url, anonymous).status_code, 200)
+
+# This checks the rating aggregates stored on Track.
+@override_settings(CACHES=LOCAL_CACHE)
+class RatingAggregateTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.track = Track.objects.create(label="Avaliada")
+        self.other = Track.objects.create(label="Outra")
+        self.users = [User.objects.create_user(username=f'rater{i}', password='pass') for i in range(3)]
+
+    def rate(self, user, score, track=None):
+        self.client.force_authenticate(user)
+        response = self.client.post(reverse('rating-list'), {'track': (track or self.track).pk, 'score': score})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def test_create_update_destroy(self):
+        first = self.rate(self.users[0], 5)
+        self.rate(self.users[1], 3)
+        self.track.refresh_from_db()
+        self.assertEqual((self.track.rating_count, self.track.rating_sum, self.track.rating_average), (2, 8, 4.0))
+        self.assertEqual(self.track.rating_histogram, {1: 0, 2: 0, 3: 1, 4: 0, 5: 1})
+
+        self.client.force_authenticate(self.users[0])
+        self.client.patch(reverse('rating-detail', args=[first]), {'score': 1})
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.rating_histogram, {1: 1, 2: 0, 3: 1, 4: 0, 5: 0})
+        self.assertEqual(self.track.rating_average, 2.0)
+
+        self.client.patch(reverse('rating-detail', args=[first]), {'track': self.other.pk})
+        self.client.delete(reverse('rating-detail', args=[first]))
+        self.track.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.track.rating_count, self.track.rating_average), (1, 3.0))
+        self.assertEqual((self.other.rating_count, self.other.rating_average), (0, None))
+
+        data = self.client.get(reverse('track-detail', args=[self.track.pk])).data
+        self.assertEqual(data['rating_count'], 1)
+        self.assertEqual(data['rating_histogram'], {'1': 0, '2': 0, '3': 1, '4': 0, '5': 0})
+
+    def test_admin_edits_keep_aggregates(self):
+        admin_user = User.objects.create_superuser(username='admin', password='pass')
+        self.client.force_login(admin_user)
+        self.client.post(reverse('admin:trackapp_rating_add'), {'user': self.users[0].pk, 'track': self.track.pk, 'score': 5, 'comment': ''})
+        rating = Rating.objects.get()
+        self.client.post(reverse('admin:trackapp_rating_change', args=[rating.pk]),
+                         {'user': self.users[0].pk, 'track': self.other.pk, 'score': 2, 'comment': ''})
+        self.track.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.track.rating_count, self.track.rating_count_5), (0, 0))
+        self.assertEqual((self.other.rating_count, self.other.rating_average), (1, 2.0))
+
+        Rating.objects.create(user=self.users[1], track=self.other, score=4)
+        Track.objects.filter(pk=self.other.pk).update(rating_count=1)   # drifted
+        self.client.post(reverse('admin:trackapp_rating_changelist'), {
+            'action': 'delete_selected', 'post': 'yes', '_selected_action': list(Rating.objects.values_list('pk', flat=True)),
+        })
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.rating_count, self.other.rating_sum, self.other.rating_average), (0, 0, None))
+
+    def test_unchanged_score_writes_nothing(self):
+        with self.assertNumQueries(0):
+            Track.objects.apply_rating_change(self.track.pk, added=3, removed=3)
+
+    def test_stale_save_keeps_counters(self):
+        stale = Track.objects.get(pk=self.track.pk)
+        self.rate(self.users[0], 4)
+        stale.label = "Renomeada"
+        stale.save()
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.rating_count, 1)
+
+    def test_rebuild_command_fixes_drift(self):
+        self.rate(self.users[0], 4)
+        self.rate(self.users[1], 2)
+        Rating.objects.create(user=self.users[2], track=self.other, score=5)
+        Track.objects.filter(pk=self.track.pk).update(rating_count=99, rating_count_4=7)
+        call_command('rebuild_rating_aggregates', stdout=io.StringIO())
+        self.track.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.track.rating_count, self.track.rating_sum, self.track.rating_average), (2, 6, 3.0))
+        self.assertEqual(self.track.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 1, 5: 0})
+        self.assertEqual((self.other.rating_count, self.other.rating_average), (1, 5.0))
+
+# This checks /api/search/ on the inverted index fallback used with SQLite.
+@override_settings(SEARCH_BACKEND='terms')
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='hiker', password='pass')
+        self.cachoeira = Track.objects.create(label="Trilha da Cachoeira", description="Caminho fácil até a cachoeira.")
+        Track.objects.create(label="Pico", description="Subida difícil com vista.")
+        KnowledgeBase.objects.create(title="Horário", content="O parque abre às 8h. Trilhas fecham às 17h.")
+        CommunityPost.objects.create(user=self.author, content="Fui na cachoeira hoje, recomendo!")
+
+    def search(self, **params):
+        response = self.client.get(reverse('search'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(r['type'], r['title']) for r in response.data['results']]
+
+    def test_prefix_accents_and_ranking(self):
+        results = self.search(q='cacho')
+        # The title hit ranks first
+        self.assertEqual(results[0], ('track', "Trilha da Cachoeira"))
+        self.assertIn(('post', ''), results)
+        self.assertEqual(self.search(q='facil cach'), [('track', "Trilha da Cachoeira")])
+        self.assertEqual(self.search(q='horario', type='knowledge'), [('knowledge', "Horário")])
+        self.assertEqual(self.search(q='horario', type='track'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.cachoeira.label = "Trilha do Mirante"
+        self.cachoeira.save()
+        self.assertEqual(self.search(q='mirante'), [('track', "Trilha do Mirante")])
+        self.assertNotIn(('track', "Trilha da Cachoeira"), self.search(q='cachoeira'))
+        self.cachoeira.delete()
+        self.assertEqual(self.search(q='mirante'), [])
+
+    def test_bm25_uses_the_collection_average_length(self):
+        pico = search.search('pico')[0]
+        lengths = list(SearchDocument.objects.values_list('length', flat=True))
+        self.assertNotEqual(pico.length, sum(lengths) / len(lengths))
+        tf = search.TITLE_WEIGHT
+        idf = math.log(1 + (len(lengths) - 1 + 0.5) / 1.5)
+        norm = tf + search.BM25_K1 * (1 - search.BM25_B + search.BM25_B * pico.length / (sum(lengths) / len(lengths)))
+        self.assertAlmostEqual(pico.score, idf * tf * (search.BM25_K1 + 1) / norm)
+
+    def test_rebuild_in_place(self):
+        kept = SearchDocument.objects.get(kind='track', object_id=self.cachoeira.pk).pk
+        SearchDocument.objects.create(kind='track', object_id=9999, title="Fantasma")
+        Track.objects.filter(pk=self.cachoeira.pk).update(label="Trilha do Mirante")   # no signal
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search(q='mirante'), [('track', "Trilha do Mirante")])
+        self.assertTrue(SearchDocument.objects.filter(pk=kept).exists())
+        self.assertFalse(SearchDocument.objects.filter(object_id=9999).exists())
+        self.assertEqual(SearchDocument.objects.count(), 4)
+
+    def test_short_query_rejected(self):
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'a'}).status_code, status.HTTP_400_BAD_REQUEST)
+
 # This checks if the API is working.
+@override_settings(CACHES=LOCAL_CACHE)
 class TrackAPITests(APITestCase):
     def setUp(self):
+        cache.clear()
         self.track = Track.objects.create(
             label="Trilha de Teste 2",
             description="You put your right foot in, and you shake it all about.",
@@ -42,3 +689,109 @@ class TrackAPITests(APITestCase):
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['label'], "Trilha de Teste 2")
         self.assertEqual(response.data['results'][0]['difficulty'], "Moderado")
+
+# This checks that listing tracks doesn't run extra queries per track.
+@override_settings(CACHES=LOCAL_CACHE)
+class TrackQueryCountTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='walker', password='pass')
+        other = User.objects.create_user(username='other', password='pass')
+        for i in range(5):
+            track = Track.objects.create(label=f"Trilha {i}")
+            TrackImage.objects.create(track=track, image=f"tracks/gallery/{i}.jpg")
+            Favorite.objects.add(other, track.pk)
+        Favorite.objects.add(self.user, track.pk)
+
+    def test_list_query_count_is_constant(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('track-list')
+        # ETag fingerprint, COUNT for the paginator, the annotated page, the
+        # gallery prefetch and the user's favorite ids for the cache overlay
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = {r['label']: r for r in response.data['results']}
+        self.assertEqual(results['Trilha 4']['favorites_count'], 2)
+        self.assertTrue(results['Trilha 4']['is_favorite'])
+        self.assertEqual(results['Trilha 0']['favorites_count'], 1)
+        self.assertFalse(results['Trilha 0']['is_favorite'])
+        self.assertEqual(len(results['Trilha 0']['images']), 1)
+
+    def test_favorited_filter_keeps_full_count(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('track-list'), {'favorited': 'true'})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['favorites_count'], 2)
+
+# This checks that a feed page is loaded in a fixed number of batched queries.
+class CommunityFeedQueryCountTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='pass')
+        Profile.objects.create(user=self.user, name='Reader')
+        track = Track.objects.create(label="Trilha do Feed")
+        for i in range(6):
+            author = User.objects.create_user(username=f'author{i}', password='pass')
+            Profile.objects.create(user=author, name=f'Author {i}')
+            post = CommunityPost.objects.create(user=author, content=f'Post {i}', track=track)
+            PostComment.objects.create(user=self.user, post=post, content='Nice')
+            PostComment.objects.create(user=author, post=post, content='Thanks')
+            PostReaction.objects.create(user=author, post=post, reaction_type='like')
+        PostReaction.objects.create(user=self.user, post=post, reaction_type='love')
+
+    def test_feed_page_query_count(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('community-post-list')
+        # ETag fingerprint, COUNT, posts+authors, comments+commenters, tracks,
+        # track gallery, own reactions and the grouped reaction summary
+        with self.assertNumQueries(8):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        latest = response.data['results'][0]
+        self.assertEqual(latest['content'], 'Post 5')
+        self.assertEqual(latest['user_name'], 'Author 5')
+        self.assertEqual(latest['user_reaction'], 'love')
+        self.assertEqual(len(latest['comments']), 2)
+        self.assertEqual(latest['comments'][0]['user_name'], 'Reader')
+        self.assertEqual(
+            sorted((r['reaction_type'], r['count']) for r in latest['reactions_summary']),
+            [('like', 1), ('love', 1)]
+        )
+        self.assertEqual(latest['track_info']['label'], "Trilha do Feed")
+        self.assertIsNone(response.data['results'][1]['user_reaction'])
+
+# This checks the opt-in keyset pagination mode.
+@override_settings(CACHES=LOCAL_CACHE)
+class CursorPaginationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='poster', password='pass')
+        for i in range(15):
+            CommunityPost.objects.create(user=author, content=f'Post {i}')
+
+    def test_cursor_pages_follow_feed_order(self):
+        url = reverse('community-post-list')
+        response = self.client.get(url, {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        first = [p['content'] for p in response.data['results']]
+        self.assertEqual(first[0], 'Post 14')
+        self.assertEqual(len(first), 10)
+
+        # A new post must not shift the next page
+        CommunityPost.objects.create(user=User.objects.get(username='poster'), content='Post 15')
+        response = self.client.get(response.data['next'])
+        second = [p['content'] for p in response.data['results']]
+        self.assertEqual(second, [f'Post {i}' for i in range(4, -1, -1)])
+        self.assertIsNone(response.data['next'])
+
+    def test_ordering_refused_with_cursor(self):
+        Track.objects.create(label="Trilha")
+        response = self.client.get(reverse('track-list'), {'pagination': 'cursor', 'ordering': '-distance'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('track-list'), {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_page_numbers_remain_default(self):
+        response = self.client.get(reverse('community-post-list'))
+        self.assertEqual(response.data['count'], 15)
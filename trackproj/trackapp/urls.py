@@ -1,6 +1,6 @@
 from rest_framework.routers import DefaultRouter
 from django.conf import settings
-from .views import TrackViewSet, UserRegisterViewSet, UserViewSet, RatingViewSet, CommunityPostViewSet, PostCommentViewSet
+from .views import TrackViewSet, UserRegisterViewSet, UserViewSet, RatingViewSet, CommunityPostViewSet, PostCommentViewSet, SearchView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.urls import path, include
 
@@ -19,4 +19,5 @@ urlpatterns = [
     path('', include(router.urls)),
     path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('search/', SearchView.as_view(), name='search'),
 ]
\ No newline at end of file
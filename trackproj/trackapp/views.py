@@ -1,57 +1,228 @@
 # Django (pale in comparison to the imports right after it)
 from django.contrib.auth.models import User
+from django.db import transaction
 
 # Rest Framework paraphernalia
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
 from rest_framework import serializers as drf_serializers
 from rest_framework.permissions import (
     IsAuthenticatedOrReadOnly, IsAuthenticated, 
     AllowAny
 )
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, NotFound
+
+# Spatial search
+import numpy as np
+from . import geo
+from .gpx import haversine
+
+# Filtering and ordering of the track catalog
+from .filters import TrackFilter, TrackOrderingFilter
+
+# Pagination (page numbers by default, keyset cursors with ?pagination=cursor)
+from .pagination import OptionalCursorPagination
 
 # Models and Serializers
-from .models import Track, Profile, Rating, Favorite, CommunityPost, PostComment, PostReaction
+from .models import Track, TrackGeometry, Profile, Rating, Favorite, CommunityPost, PostComment, PostReaction
 from .serializers import (
-    TrackSerializer, UserRegisterSerializer, UserSerializer, 
+    TrackSerializer, TrackGeometrySerializer, UserRegisterSerializer, UserSerializer, 
     ProfileSerializer, RatingSerializer, CommunityPostSerializer,
-    PostCommentSerializer, PostReactionSerializer, PublicUserSerializer
+    PostCommentSerializer, PostReactionSerializer, PublicUserSerializer,
+    SearchResultSerializer
 )
+from . import search, response_cache, conditional
 
 class TrackViewSet(ModelViewSet):
     queryset = Track.objects.all().order_by('id')
     serializer_class = TrackSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('id',)
+    filter_backends = [TrackFilter, TrackOrderingFilter]
     permission_classes = [IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
-        queryset = Track.objects.all().order_by('id')
+        queryset = Track.objects.with_favorites(self.request.user).order_by('id')
         favorited = self.request.query_params.get('favorited')
         if favorited == 'true' and self.request.user.is_authenticated:
             queryset = queryset.filter(favorite__user=self.request.user)
         return queryset
 
-    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    # list/retrieve go through response_cache: the shared (anonymous) payload
+    # is cached, then is_favorite is filled in for the current user. The
+    # fingerprint for the ETag is cached next to it, under the same version,
+    # so a revalidation that hits the cache doesn't touch the database.
+    def _cached(self, key, fingerprint, build, items, many=False):
+        state, _ = response_cache.get_or_build(f'{key}:state', fingerprint)
+
+        def respond():
+            data, hit = response_cache.get_or_build(key, lambda: build().data)
+            user = self.request.user
+            favorited = set()
+            if user.is_authenticated:
+                favorited = response_cache.favorite_ids(
+                    user, lambda: Favorite.objects.filter(user=user).values_list('track_id', flat=True)
+                )
+            response_cache.apply_overlay(items(data), favorited)
+            return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+        return conditional.respond(self.request, state, respond, many)
+
+    def list(self, request, *args, **kwargs):
+        fingerprint = lambda: conditional.fingerprint(self.filter_queryset(self.get_queryset()))
+        # A user's own favorites list isn't shared with anyone
+        if request.query_params.get('favorited') == 'true' and request.user.is_authenticated:
+            return conditional.respond(request, fingerprint(), lambda: super(TrackViewSet, self).list(request, *args, **kwargs), many=True)
+        return self._cached(
+            response_cache.list_key(request),
+            fingerprint,
+            lambda: super(TrackViewSet, self).list(request, *args, **kwargs),
+            lambda data: data['results'],
+            many=True,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not str(kwargs['pk']).isdigit():
+            raise NotFound()
+        return self._cached(
+            response_cache.detail_key(request, kwargs['pk']),
+            lambda: conditional.fingerprint(Track.objects.filter(pk=kwargs['pk'])),
+            lambda: super(TrackViewSet, self).retrieve(request, *args, **kwargs),
+            lambda data: [data],
+        )
+
+    @action(detail=True, methods=['post', 'put', 'delete'], permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
-        track = self.get_object()
-        user = request.user
-        favorite, created = Favorite.objects.get_or_create(user=user, track=track)
-        if not created:
-            favorite.delete()
-            favorited = False
-        else:
-            favorited = True
-        count = Favorite.objects.filter(track=track).count()
+        """
+        POST toggles. PUT favorites and DELETE unfavorites, and both are
+        idempotent, so a retried request can't flip the state back.
+        """
+        change = {
+            'POST': Favorite.objects.toggle,
+            'PUT': Favorite.objects.add,
+            'DELETE': Favorite.objects.remove,
+        }[request.method]
+        try:
+            favorited, count = change(request.user, int(pk))
+        except (ValueError, Track.DoesNotExist):
+            raise NotFound()
         return Response({'favorited': favorited, 'favorites_count': count})
 
+    def _float_params(self, request, *names):
+        try:
+            return [float(request.query_params[name]) for name in names]
+        except (KeyError, ValueError):
+            raise drf_serializers.ValidationError({'error': f"{', '.join(names)} are required numbers"})
+
+    def _limit(self, request, default=20, maximum=100):
+        try:
+            return max(1, min(int(request.query_params.get('limit', default)), maximum))
+        except ValueError:
+            return default
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Tracks starting within ?radius= meters (default 10 km, max 100 km) of
+        ?lat=&lon=, closest first. Each result carries `distance_from_point`.
+        """
+        lat, lon = self._float_params(request, 'lat', 'lon')
+        try:
+            radius = min(abs(float(request.query_params.get('radius', 10000))), 100000)
+        except ValueError:
+            return Response({'error': 'radius must be a number'}, status=400)
+
+        candidates = list(
+            self.filter_queryset(self.get_queryset()).starting_in(*geo.bbox_around(lat, lon, radius))
+            .values_list('id', 'start_latitude', 'start_longitude')
+        )
+        if not candidates:
+            return Response([])
+
+        ids, lats, lons = (np.array(column) for column in zip(*candidates))
+        distances = haversine(lat, lon, lats, lons)
+        order = np.argsort(distances)
+        order = order[distances[order] <= radius][:self._limit(request)]
+        distance_by_id = {int(ids[i]): float(distances[i]) for i in order}
+
+        tracks = {t.id: t for t in self.get_queryset().filter(id__in=distance_by_id)}
+        data = []
+        for track_id, distance in distance_by_id.items():
+            item = self.get_serializer(tracks[track_id]).data
+            item['distance_from_point'] = round(distance, 1)
+            data.append(item)
+        return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def within(self, request):
+        """
+        Tracks starting inside the map view ?min_lat=&min_lon=&max_lat=&max_lon=.
+        """
+        box = self._float_params(request, 'min_lat', 'min_lon', 'max_lat', 'max_lon')
+        queryset = self.filter_queryset(self.get_queryset()).starting_in(*box)[:self._limit(request, maximum=200)]
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def geometry(self, request, pk=None):
+        """
+        Simplified polyline for drawing the track on a map, so clients don't
+        need the raw GPX. ?zoom= picks the level (defaults to 13).
+        """
+        try:
+            zoom = int(request.query_params.get('zoom', 13))
+        except ValueError:
+            return Response({'error': 'zoom must be an integer'}, status=400)
+
+        try:
+            track_id = int(pk)
+        except ValueError:
+            raise NotFound()
+        levels = TrackGeometry.objects.filter(track_id=track_id).select_related('track')
+        geometry = levels.filter(max_zoom__gte=zoom).first() or levels.last()
+        if geometry is None:
+            raise NotFound('Geometry not available for this track.')
+        return Response(TrackGeometrySerializer(geometry).data)
+
 class CommunityPostViewSet(ModelViewSet):
     queryset = CommunityPost.objects.all()
     serializer_class = CommunityPostSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    pagination_class = PageNumberPagination
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        return CommunityPost.objects.for_feed(self.request.user)
+
+    # Comments, reactions and author profile changes touch the post (see
+    # signals.py); the mentioned track carries its own updated_at.
+    def _fingerprint(self, queryset):
+        return conditional.fingerprint(queryset, 'updated_at', 'track__updated_at')
+
+    def list(self, request, *args, **kwargs):
+        return conditional.respond(
+            request, self._fingerprint(self.filter_queryset(CommunityPost.objects.all())),
+            lambda: super(CommunityPostViewSet, self).list(request, *args, **kwargs),
+            many=True,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not str(kwargs['pk']).isdigit():
+            raise NotFound()
+        return conditional.respond(
+            request, self._fingerprint(CommunityPost.objects.filter(pk=kwargs['pk'])),
+            lambda: super(CommunityPostViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
+    def paginate_queryset(self, queryset):
+        # Feed loader: the page itself comes from for_feed(), then the reaction
+        # counts for every post on it are filled in with one grouped query.
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            summaries = PostReaction.objects.summaries_for(page)
+            for post in page:
+                post.reactions_summary = summaries[post.pk]
+        return page
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -121,32 +292,50 @@ class UserViewSet(ModelViewSet):
                 profile_serializer.save()
                 return Response(UserSerializer(user, context={'request': request}).data)
             return Response(profile_serializer.errors, status=400)
-        return Response(UserSerializer(user, context={'request': request}).data)
+        # Loading the profile is the fingerprint query; serializing reuses it
+        profile = getattr(user, 'profile', None)
+        state = conditional.state(1, [getattr(profile, 'updated_at', None)], extra=f'|{user.username}|{user.email}')
+        return conditional.respond(request, state, lambda: Response(UserSerializer(user, context={'request': request}).data))
 
 class RatingViewSet(ModelViewSet):
     queryset = Rating.objects.all()
     serializer_class = RatingSerializer
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('-date', '-id')
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy', 'create']:
             return [IsAuthenticated()]
         return [AllowAny()]
 
+    # Each write also adjusts the aggregates stored on Track, in the same transaction
     def perform_create(self, serializer):
         track = serializer.validated_data['track']
         if Rating.objects.filter(user=self.request.user, track=track).exists():
             raise drf_serializers.ValidationError('Você já avaliou esta trilha.')
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            rating = serializer.save(user=self.request.user)
+            Track.objects.apply_rating_change(rating.track_id, added=rating.score)
 
     def perform_update(self, serializer):
         if serializer.instance.user != self.request.user:
             raise PermissionDenied('Você só pode editar suas próprias avaliações.')
-        serializer.save()
+        old_track_id, old_score = serializer.instance.track_id, serializer.instance.score
+        with transaction.atomic():
+            rating = serializer.save()
+            if rating.track_id != old_track_id:
+                response_cache.invalidate_track(old_track_id)
+                Track.objects.apply_rating_change(old_track_id, removed=old_score)
+                Track.objects.apply_rating_change(rating.track_id, added=rating.score)
+            elif rating.score != old_score:
+                Track.objects.apply_rating_change(rating.track_id, added=rating.score, removed=old_score)
 
     def perform_destroy(self, instance):
         if instance.user != self.request.user:
             raise PermissionDenied('Você só pode apagar suas próprias avaliações.')
-        instance.delete()
+        with transaction.atomic():
+            instance.delete()
+            Track.objects.apply_rating_change(instance.track_id, removed=instance.score)
 
 class PostCommentViewSet(ModelViewSet):
     queryset = PostComment.objects.all()
@@ -165,4 +354,23 @@ class PostCommentViewSet(ModelViewSet):
     def perform_destroy(self, instance):
         if instance.user != self.request.user:
             raise PermissionDenied('Você só pode apagar seus próprios comentários.')
-        instance.delete()
\ No newline at end of file
+        instance.delete()
+
+class SearchView(APIView):
+    """
+    GET /api/search/?q=trilha fac&type=track,knowledge,post&limit=20
+    Every word must match, each as a prefix, ranked by relevance.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            return Response({'error': 'q must have at least 2 characters'}, status=400)
+        kinds = [k for k in request.query_params.get('type', '').split(',') if k in search.MODELS_BY_KIND]
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 50))
+        except ValueError:
+            limit = 20
+        results = search.search(query, kinds=kinds, limit=limit)
+        return Response({'query': query, 'results': SearchResultSerializer(results, many=True).data})
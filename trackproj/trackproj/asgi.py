@@ -22,8 +22,13 @@ django_asgi_app = get_asgi_application()
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 import chatbot.routing
+from chatbot import clients
 
-application = ProtocolTypeRouter({
+# 4. Shared chatbot clients: created and checked once here, closed on shutdown
+clients.start()
+clients.close_on_daphne_shutdown()
+
+application = clients.LifespanMiddleware(ProtocolTypeRouter({
     # Serve HTTP requests using the Django application initialized above
     "http": django_asgi_app,
     
@@ -33,4 +38,4 @@ application = ProtocolTypeRouter({
             chatbot.routing.websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+}))
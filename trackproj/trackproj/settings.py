@@ -99,15 +99,56 @@ ROOT_URLCONF = 'trackproj.urls'
 
 ASGI_APPLICATION = 'trackproj.asgi.application'
 
+REDIS_HOST = os.environ.get('REDIS_HOST', 'redis')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [('redis', 6379)],
+            "hosts": [(REDIS_HOST, REDIS_PORT)],
         },
     },
 }
 
+# Qdrant (vector store for the chatbot)
+QDRANT_HOST = os.environ.get('QDRANT_HOST', 'qdrant')
+QDRANT_PORT = int(os.environ.get('QDRANT_PORT', 6333))
+QDRANT_API_KEY = os.environ.get('QDRANT_API_KEY') or None
+QDRANT_TIMEOUT = int(os.environ.get('QDRANT_TIMEOUT', 10))
+# Connections kept open by each web process's shared async client
+QDRANT_POOL_SIZE = int(os.environ.get('QDRANT_POOL_SIZE', 20))
+
+# Vector store backend (chatbot/vector_store.py): 'qdrant', or 'numpy' for
+# memory-mapped files under VECTOR_STORE_PATH (no server needed)
+VECTOR_STORE = os.environ.get('VECTOR_STORE', 'qdrant')
+VECTOR_STORE_PATH = os.environ.get('VECTOR_STORE_PATH', BASE_DIR / 'vector_store')
+
+# Semantic answer cache (chatbot/answer_cache.py): how close (cosine) a question
+# must be to an answered one to reuse its answer, and how long answers last
+ANSWER_CACHE_THRESHOLD = float(os.environ.get('ANSWER_CACHE_THRESHOLD', 0.95))
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 5000))
+
+# Most of the chatbot prompt's context, in (estimated) tokens (chatbot/retrieval.py)
+CHAT_CONTEXT_TOKENS = int(os.environ.get('CHAT_CONTEXT_TOKENS', 2000))
+
+# Days the chatbot keeps the messages it answered, for its conversation memory
+# (chatbot/memory.py)
+CHAT_MEMORY_RETENTION_DAYS = int(os.environ.get('CHAT_MEMORY_RETENTION_DAYS', 30))
+
+# Cache (database 1 of the same Redis, so it never collides with the channel layer)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}/1',
+    },
+}
+
+# Seconds a cached track list/detail response lives (trackapp/response_cache.py);
+# entries are invalidated on change, so this only bounds memory use
+TRACK_CACHE_TIMEOUT = int(os.environ.get('TRACK_CACHE_TIMEOUT', 3600))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -183,6 +224,20 @@ STATIC_ROOT = os.environ.get('DJANGO_STATIC_ROOT', '/static/')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.environ.get('DJANGO_MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
 
+# Site search (trackapp/search.py): 'fulltext' (MySQL FULLTEXT) or 'terms'
+# (inverted index table, any database). Unset picks by database vendor.
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or None
+
+# Background jobs (chatbot/jobs.py, run by `manage.py run_jobs`)
+# Seconds after an object's last change before its vectors are re-synced
+VECTOR_SYNC_DELAY = int(os.environ.get('VECTOR_SYNC_DELAY', 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 6))
+
+# Embedding cache (chatbot/embedding_cache.py): vectors kept in each process,
+# and seconds they live in Redis (evicted sooner if Redis fills up)
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 2048))
+EMBEDDING_CACHE_TIMEOUT = int(os.environ.get('EMBEDDING_CACHE_TIMEOUT', 30 * 24 * 3600))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 